@@ -0,0 +1,23 @@
+# Migrates a sonnet database from per guild tables to shared guild indexed tables (db version 2.0.0)
+# Safe to run while sonnet is online, see lib_sonnetdb.migrate_to_shared_tables
+# Usage: python3 build_tools/dbmigrate.py [--drop-old]
+
+import sys, os, time
+
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+
+from lib_sonnetdb import migrate_to_shared_tables
+
+start = time.monotonic()
+
+try:
+    copied = migrate_to_shared_tables(drop_old="--drop-old" in sys.argv[1:])
+except RuntimeError as e:
+    print(f"Migration aborted: {e}")
+    sys.exit(1)
+
+if copied is None:
+    print("Database already uses shared tables")
+else:
+    print(f"Migrated {copied} rows to shared tables in {time.monotonic()-start:.1f}s")
@@ -5,10 +5,30 @@ sys.path.insert(1, os.getcwd() + "/common")
 
 from lib_db_obfuscator import db_hlapi
 
-with gzip.open(sys.argv[1], "rb") as fname:
+from typing import Any, Dict, List
 
-    dbdict = json.loads(fname.read())
+# Usage: gztodb.py <database.gz or database.partN.ndjson.gz...> <guild id>
+# gdpr download used to export one json file, it now exports NDJSON parts which must all be passed
 
-with db_hlapi(int(sys.argv[2])) as db:
-    if not db.upload_guild_db(dbdict):
+dbdict: Dict[str, List[List[Any]]] = {}
+
+for fname in sys.argv[1:-1]:
+    with gzip.open(fname, "rt", encoding="utf8") as fp:
+        if fname.endswith(".ndjson.gz"):
+            for line in fp:
+                entry = json.loads(line)
+                if "columns" in entry:
+                    dbdict.setdefault(entry["table"], [entry["columns"]])
+                else:
+                    dbdict[entry["table"]].append(entry["row"])
+        else:
+            dbdict.update(json.load(fp))
+
+
+def progress(table: str, rows: int, rate: float) -> None:
+    print(f"{table}: {rows}/{len(dbdict[table]) - 1} rows ({rate:.0f} rows/s)")
+
+
+with db_hlapi(int(sys.argv[-1])) as db:
+    if not db.upload_guild_db(dbdict, rebuild_indexes=True, progress=progress):
         print("gztodb failed on db upload")
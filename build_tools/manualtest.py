@@ -31,6 +31,16 @@ def test_func_io(func: Callable[[T], OUT], arg: T, expect: OUT) -> None:
     assert func(arg) == expect, f"func({arg=})={func(arg)} != {expect=}"
 
 
+def check(errs: List[Exception], got: Any, expect: Any) -> None:
+    """
+    Appends an AssertionError to errs if got != expect, so one test can report every failed check
+    """
+    try:
+        assert got == expect, f"{got=} != {expect=}"
+    except AssertionError as e:
+        errs.append(e)
+
+
 def try_or_return(func: Callable[[], Optional[Iterable[Exception]]]) -> Callable[[], Optional[Iterable[Exception]]]:
     def wrapped() -> Optional[Iterable[Exception]]:
         try:
@@ -176,7 +186,167 @@ def test_ramfs() -> Optional[Iterable[Exception]]:
     else: return None
 
 
-testfuncs: List[Callable[[], Optional[Iterable[Exception]]]] = [test_parse_duration, test_ramfs]
+@try_or_return
+def test_blacklist_matcher() -> Optional[Iterable[Exception]]:
+
+    import re
+    from lib_automod import AhoCorasick, SuffixMatcher, BlacklistMatcher
+
+    errs: List[Exception] = []
+
+    # Overlapping and nested patterns must all be reported, in pattern order
+    ac = AhoCorasick(["he", "she", "his", "hers", "e"])
+    check(errs, ac.search("ushers"), [0, 1, 3, 4])
+    check(errs, ac.search("xyz"), [])
+    check(errs, AhoCorasick([]).search("anything"), [])
+    check(errs, AhoCorasick(["aa", "aaa"]).search("aaaa"), [0, 1])
+
+    sm = SuffixMatcher([".gz", ".tar.gz", ".exe"])
+    check(errs, sm.search("archive.tar.gz"), [0, 1])
+    check(errs, sm.search("setup.exe.txt"), [])
+
+    matcher = BlacklistMatcher(
+        ["bad", "worse"],
+        ["ass", "bass"],
+        [".exe"],
+        [re.compile("f+o+"), re.compile("(b)(a)r")],
+        [re.compile("ping")],
+        re.compile(r"(https?://)(?:\n)?(evil\.com)"),
+        )
+
+    check(errs, matcher.scan("a bad worse bad", "a bad worse bad", []), (True, False, ["Word(bad)", "Word(worse)", "Word(bad)"]))
+    check(errs, matcher.scan("big bass", "big bass", ["x.exe", "y.png"]), (True, False, ["WordInWord(ass)", "WordInWord(bass)", "FileType(.exe)"]))
+    check(errs, matcher.scan("fooo bar ping", "fooo bar ping", []), (True, True, ["RegEx(fooo)", "RegEx(ba)"]))
+    check(errs, matcher.scan("httpsevilcom", "https://evil.com", []), (True, False, ["URL(https://evil.com)"]))
+    check(errs, matcher.scan("clean text", "clean text", ["a.png"]), (False, False, []))
+
+    # Edits only rescan words touching the change, and word in word patterns spanning it
+    check(errs, matcher.scan_edit("clean text", "clean bad text", "clean bad text", []), (True, False, ["Word(bad)"]))
+    check(errs, matcher.scan_edit("big ba", "big bass", "big bass", []), (True, False, ["WordInWord(ass)", "WordInWord(bass)"]))
+    check(errs, matcher.scan_edit("b a", "b ad", "b ad", []), (False, False, []))
+    check(errs, matcher.scan_edit("ba d", "bad", "bad", ["x.exe"]), (True, False, ["Word(bad)", "FileType(.exe)"]))
+    check(errs, matcher.scan_edit("clean", "clean fooo", "clean fooo", []), (True, False, ["RegEx(fooo)"]))
+
+    # Only messages recorded as scanned clean may take the edit path
+    check(errs, matcher.is_clean(1), False)
+    matcher.mark_clean(1)
+    check(errs, matcher.is_clean(1), True)
+
+    if errs: return errs
+    else: return None
+
+
+@try_or_return
+def test_antispam_store() -> Optional[Iterable[Exception]]:
+
+    from lib_antispam import AntispamStore
+
+    errs: List[Exception] = []
+
+    store = AntispamStore()
+
+    # Scans are (lifetime 1000ms, lifetime 5000ms), droptimes are created - lifetime + 1
+    def push(user: int, t: int, chars: int) -> Any:
+        return store.push(user, t, chars, (t - 1000 + 1, t - 5000 + 1))
+
+    check(errs, push(1, 10000, 5), [(1, 5), (1, 5)])
+    check(errs, push(1, 10500, 7), [(2, 12), (2, 12)])
+    check(errs, push(1, 11000, 1), [(2, 8), (3, 13)])
+    check(errs, push(1, 15500, 2), [(1, 2), (2, 3)])
+
+    # Growing past the starting capacity must keep messages in order
+    for i in range(20):
+        push(2, 20000 + i, 1)
+    check(errs, push(2, 20020, 1), [(21, 21), (21, 21)])
+    check(errs, store.export()["2"][:2], [(20000, 1), (20001, 1)])
+
+    # User 1 has nothing within the longest lifetime of this message, so it is evicted
+    check(errs, push(3, 24000, 1), [(1, 1), (1, 1)])
+    check(errs, sorted(store.export()), ["2", "3"])
+
+    if errs: return errs
+    else: return None
+
+
+@try_or_return
+def test_encryption_wrapper() -> Optional[Iterable[Exception]]:
+
+    import asyncio, io, os
+    from lib_encryption_wrapper import encrypted_writer, encrypted_reader, errors as crypt_errors
+
+    errs: List[Exception] = []
+
+    class keepopen(io.BytesIO):
+        def close(self) -> None:
+            pass
+
+    key, iv = os.urandom(32), os.urandom(16)
+    data = os.urandom(70000) * 3
+
+    for large_blocks in [False, True]:
+        raw = keepopen()
+        writer = encrypted_writer(raw, key, iv, large_blocks=large_blocks)
+        writer.write(data[:10])
+        writer.write(data[10:])
+        writer.close()
+
+        reader = encrypted_reader(keepopen(raw.getvalue()), key, iv)
+        check(errs, reader.read(5), data[:5])
+        check(errs, reader.seek(2), 2)
+        check(errs, reader.read(), data[2:])
+
+        async def read_all(buf: bytes) -> bytes:
+            return await (await encrypted_reader.open(keepopen(buf), key, iv, verify=False)).read_all()
+
+        check(errs, asyncio.run(read_all(raw.getvalue())), data)
+
+        tampered = bytearray(raw.getvalue())
+        tampered[-1] ^= 1
+        try:
+            asyncio.run(read_all(bytes(tampered)))
+            errs.append(AssertionError("read_all accepted a tampered file"))
+        except crypt_errors.HMACInvalidError:
+            pass
+
+    if errs: return errs
+    else: return None
+
+
+@try_or_return
+def test_command_registry() -> Optional[Iterable[Exception]]:
+
+    import types
+    from lib_sonnetcommands import get_command_registry
+
+    errs: List[Exception] = []
+
+    async def ctxcmd(message: Any, args: Any, client: Any, ctx: Any) -> None:
+        pass
+
+    async def kwargscmd(message: Any, args: Any, client: Any, **kwargs: Any) -> None:
+        pass
+
+    mod_a = types.SimpleNamespace(commands={"ping": {"execute": ctxcmd, "description": "a"}, "p": {"alias": "ping"}})
+    mod_b = types.SimpleNamespace(commands={"pong": {"execute": kwargscmd}, "pp": {"alias": "ping"}, "broken": {"alias": "nothing"}})
+
+    cmds_dict = {**mod_a.commands, **mod_b.commands}
+    registry = get_command_registry([mod_a, mod_b], cmds_dict)
+
+    check(errs, registry.get("p"), registry["ping"])
+    check(errs, registry["pp"].description, "a")
+    check(errs, registry.true_name("pp"), "ping")
+    check(errs, registry.aliases["ping"], ("p", "pp"))
+    check(errs, registry.modules["pp"] is mod_b, True)
+    check(errs, registry.executors["p"] is ctxcmd, True)
+    check(errs, "broken" in registry, False)
+    check(errs, get_command_registry([], cmds_dict) is registry, True)
+    check(errs, get_command_registry([], dict(cmds_dict)) is registry, False)
+
+    if errs: return errs
+    else: return None
+
+
+testfuncs: List[Callable[[], Optional[Iterable[Exception]]]] = [test_parse_duration, test_ramfs, test_blacklist_matcher, test_antispam_store, test_encryption_wrapper, test_command_registry]
 
 
 def main_tests() -> None:
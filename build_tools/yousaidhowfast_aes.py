@@ -0,0 +1,40 @@
+import sys, os, time, tempfile
+
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+
+from lib_encryption_wrapper import encrypted_writer, encrypted_reader
+
+# Writes and reads back a file in both SONNETAES formats, in the write sizes lz4 and discord.py tend to produce
+size = 64 * 1024 * 1024
+writesizes = [4096, 65536, 1024 * 1024]
+
+key = os.urandom(32)
+iv = os.urandom(16)
+data = os.urandom(size)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    fname = os.path.join(tmpdir, "bench.cache.db")
+
+    for large_blocks in [False, True]:
+        fmt = "v2 (large blocks)" if large_blocks else "v1"
+
+        for writesize in writesizes:
+            tstart = time.time()
+
+            writer = encrypted_writer(fname, key, iv, large_blocks=large_blocks)
+            for i in range(0, size, writesize):
+                writer.write(data[i:i + writesize])
+            writer.close()
+
+            twrite = time.time() - tstart
+
+            tstart = time.time()
+
+            reader = encrypted_reader(fname, key, iv)
+            assert reader.read() == data
+            reader.close()
+
+            tread = time.time() - tstart
+
+            print(f"{fmt} writes of {writesize}B: write {round(size/twrite/1024/1024)}MiB/s, read {round(size/tread/1024/1024)}MiB/s, file {os.path.getsize(fname)}B")
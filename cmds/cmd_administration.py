@@ -4,7 +4,7 @@
 import importlib
 
 import discord, os, glob
-import json, gzip, io, time, math
+import json, zlib, io, time, math
 
 import lib_db_obfuscator
 
@@ -24,15 +24,19 @@ importlib.reload(lib_sonnetcommands)
 import lib_constants
 
 importlib.reload(lib_constants)
+import lib_antispam
+
+importlib.reload(lib_antispam)
 
 from lib_parsers import parse_boolean_strict, update_log_channel, parse_role, paginate_noexcept
 from lib_loaders import load_embed_color, embed_colors
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import db_hlapi, run_in_db_executor
 from lib_sonnetconfig import BOT_NAME
 from lib_sonnetcommands import CommandCtx
+from lib_antispam import load_antispam_store
 import lib_constants as constants
 
-from typing import List, Dict, Tuple, Final
+from typing import List, Dict, Tuple, Final, Optional, Union
 import lib_lexdpyk_h as lexdpyk
 
 InfracModifierT = Dict[str, Tuple[str, str]]
@@ -217,6 +221,101 @@ async def username_log_change(message: discord.Message, args: List[str], client:
         return 1
 
 
+# Rows read from the database per batch while exporting
+_EXPORT_BATCH = 1000
+# Room left in each upload for the rest of the request
+_EXPORT_HEADROOM = 64 * 1024
+# (table name, column names, rows) as streamed by db_hlapi.iter_guild_db
+_ExportBatchT = Tuple[str, List[str], Tuple[Tuple[Union[str, int], ...], ...]]
+
+
+class _GuildDBExport:
+    """
+    Exports a guilds database as gzipped NDJSON, split into parts of at most part_size bytes
+
+    Rows are paged from the database with a cursor and compressed as they are read, so only one part is in memory at a time
+    Each line is a json object, {"table": name, "columns": [...]} before the rows of a table and {"table": name, "row": [...]} for each row
+    Every part starts with the columns of its first table, so each part can be imported on its own
+    """
+    __slots__ = "database", "rows", "part_size", "parts", "pending"
+
+    def __init__(self, guild_id: int, part_size: int) -> None:
+        # An exclusive connection, as the cursor is advanced from executor threads
+        self.database = db_hlapi(guild_id, exclusive_connection=True)
+        self.rows = self.database.iter_guild_db(_EXPORT_BATCH)
+        self.part_size = part_size
+        self.parts = 0
+        # A batch that did not fit in the last part
+        self.pending: Optional[_ExportBatchT] = None
+
+    def _next_batch(self) -> Optional[_ExportBatchT]:
+
+        if (batch := self.pending) is not None:
+            self.pending = None
+            return batch
+
+        return next(self.rows, None)
+
+    @staticmethod
+    def _encode(batch: _ExportBatchT, header: bool) -> bytes:
+
+        table, columns, rows = batch
+        lines: List[str] = []
+
+        if header:
+            lines.append(json.dumps({"table": table, "columns": columns}, separators=(",", ":")))
+
+        lines.extend(json.dumps({"table": table, "row": row}, separators=(",", ":")) for row in rows)
+        lines.append("")
+
+        return "\n".join(lines).encode("utf8")
+
+    def next_part(self) -> Optional[io.BytesIO]:
+        """
+        Compresses rows into the next part, this blocks on the database and should be run on the db executor
+
+        :returns: Optional[io.BytesIO] - The next part, or None if every row has been exported
+        """
+
+        if (batch := self._next_batch()) is None and self.parts:
+            return None
+
+        self.parts += 1
+        part = io.BytesIO()
+
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(wbits=31)
+        # The table whose columns were last written to this part
+        table: Optional[str] = None
+
+        while batch is not None:
+            chunk = self._encode(batch, header=batch[0] != table)
+
+            # Compress with a copy of the stream, so a chunk that would overflow the part is left for the next one
+            attempt = compressor.copy()
+            data = attempt.compress(chunk) + attempt.flush(zlib.Z_SYNC_FLUSH)
+
+            # Finishing the stream adds an empty block and the 8 byte trailer
+            if table is not None and part.tell() + len(data) + 32 > self.part_size:
+                self.pending = batch
+                break
+
+            part.write(data)
+            compressor = attempt
+            table = batch[0]
+
+            batch = self._next_batch()
+
+        part.write(compressor.flush())
+
+        part.seek(0)
+        return part
+
+    def close(self) -> None:
+        self.rows.close()
+        self.database.close()
+
+
 class gdpr_functions:
     __slots__ = "commands",
 
@@ -245,36 +344,33 @@ class gdpr_functions:
             )
 
     async def download(self, message: discord.Message, guild_id: int, ramfs: lexdpyk.ram_filesystem, kramfs: lexdpyk.ram_filesystem) -> None:
+        if not message.guild:
+            return
 
         timestart = time.time()
 
-        with db_hlapi(guild_id) as database:
-            dbdict = database.download_guild_db()
+        export = await run_in_db_executor(_GuildDBExport, guild_id, message.guild.filesize_limit - _EXPORT_HEADROOM)
 
-        # Convert db to compressed json
-        db = io.BytesIO()
-        with gzip.GzipFile(filename=f"{guild_id}.db.json.gz", mode="wb", fileobj=db) as txt:
-            txt.write(json.dumps(dbdict, indent=4).encode("utf8"))
-        db.seek(0)
-
-        # Add cache files
-        assert isinstance(antispam := ramfs.read_f(f"{guild_id}/asam"), dict)
-        assert isinstance(charantispam := ramfs.read_f(f"{guild_id}/casam"), dict)
-
-        # Finalize discord file objs
-        fileobj_db = discord.File(db, filename="database.gz")
+        try:
+            # Each part is uploaded before the next is built, so a large database is never held in memory
+            while (part := await run_in_db_executor(export.next_part)) is not None:
+                try:
+                    await message.channel.send(f"Database part {export.parts}", file=discord.File(part, filename=f"database.part{export.parts}.ndjson.gz"))
+                except discord.errors.HTTPException:
+                    await message.channel.send(
+                        f"ERROR: There was an error uploading part {export.parts} of the database\n"
+                        "Please contact the bot owner directly to download your guilds database\n"
+                        "Or if discord experienced a lag spike, consider retrying as the network may have gotten corrupted"
+                        )
+                    return
+        finally:
+            await run_in_db_executor(export.close)
+
+        # Add cache files, both antispam scans share one store of (timestamp millis, char count) per user
+        antispam = load_antispam_store(guild_id, ramfs).export()
         fileobj_antispam = discord.File(io.BytesIO(json.dumps(antispam, indent=4).encode("utf8")), filename="antispam.json")
-        fileobj_cantispam = discord.File(io.BytesIO(json.dumps(charantispam, indent=4).encode("utf8")), filename="charantispam.json")
 
-        # Send data
-        try:
-            await message.channel.send(f"Grabbing DB took: {round((time.time()-timestart)*100000)/100}ms", files=[fileobj_db, fileobj_antispam, fileobj_cantispam])
-        except discord.errors.HTTPException:
-            await message.channel.send(
-                "ERROR: There was an error uploading the files, if you have a large infraction database this could be caused by discords file size limitation\n"
-                "Please contact the bot owner directly to download your guilds database\n"
-                "Or if discord experienced a lag spike, consider retrying as the network may have gotten corrupted"
-                )
+        await message.channel.send(f"Grabbing DB took: {round((time.time()-timestart)*100000)/100}ms over {export.parts} part{'s' if export.parts != 1 else ''}", file=fileobj_antispam)
 
 
 async def gdpr_database(message: discord.Message, args: List[str], client: discord.Client, ctx: CommandCtx) -> int:
@@ -26,7 +26,7 @@ importlib.reload(lib_sonnetcommands)
 from lib_goparsers import MustParseDuration
 from lib_db_obfuscator import db_hlapi
 from lib_sonnetconfig import REGEX_VERSION, AUTOMOD_ENABLED
-from lib_parsers import parse_role, parse_boolean_strict, parse_user_member, format_duration
+from lib_parsers import parse_role, parse_boolean_strict, parse_user_member, format_duration, load_blacklist_matcher
 from lib_sonnetcommands import CommandCtx, ExecutableCtxT
 
 from typing import Any, Dict, List, Callable, Coroutine, Tuple, Optional, Literal
@@ -260,10 +260,15 @@ async def list_blacklist(message: discord.Message, args: List[str], client: disc
     if args and args[0] in ["--raw", "-r"]:
         raw = True
 
+    if not message.guild:
+        return 1
+
+    matcher = load_blacklist_matcher(message.guild.id, mconf, ctx.ramfs)
+
     # Format blacklist
     blacklist: Dict[str, Any] = {}
-    blacklist["regex-blacklist"] = [f"/{i.pattern}/g" for i in mconf["regex-blacklist"]]
-    blacklist["regex-notifier"] = [f"/{i.pattern}/g" for i in mconf["regex-notifier"]]
+    blacklist["regex-blacklist"] = [f"/{i.pattern}/g" for i in matcher.regex_blacklist]
+    blacklist["regex-notifier"] = [f"/{i.pattern}/g" for i in matcher.regex_notifier]
     blacklist["word-blacklist"] = ",".join(mconf["word-blacklist"])
     blacklist["word-in-word-blacklist"] = ",".join(mconf["word-in-word-blacklist"])
     blacklist["filetype-blacklist"] = ",".join(mconf["filetype-blacklist"])
@@ -9,9 +9,10 @@ import lib_sonnetcommands
 
 from lib_goparsers import ParseDurationSuper
 from lib_loaders import generate_infractionid, load_embed_color, load_message_config, embed_colors, datetime_now
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import db_hlapi, async_db_hlapi
 from lib_parsers import parse_user_member_noexcept, format_duration, parse_core_permissions, parse_boolean_strict
 from lib_compatibility import user_avatar_url, to_snowflake, GuildMessageable
+from lib_mutescheduler import get_mute_scheduler
 from lib_sonnetconfig import BOT_NAME
 from lib_sonnetcommands import CommandCtx
 import lib_constants as constants
@@ -62,6 +63,29 @@ class InfractionModifier:
         e.add_field(name=self.title, value=self.value)
 
 
+# Runs on the db executor, as the id collision test can take many queries
+def _record_infraction(db: db_hlapi, user_id: str, moderator_id: str, i_type: str, i_reason: str, timestamp: int) -> Tuple[str, int]:
+
+    iterations: int = 0
+    iter_limit: Final[int] = 10_000
+    # Infraction id collision test
+    while db.grab_infraction(generated_id := generate_infractionid()):
+        iterations += 1
+        if iterations > iter_limit:
+            raise lib_sonnetcommands.CommandError("ERROR: Failed to generate a unique infraction ID after {iter_limit} attempts\n(Do you have too many infractions/too small of a wordlist installed?)")
+
+    # Grab log channel
+    try:
+        chan: int = int(db.grab_config("infraction-log") or "0")
+    except ValueError:
+        chan = 0
+
+    # Send infraction to database
+    db.add_infraction(generated_id, user_id, moderator_id, i_type, i_reason, timestamp)
+
+    return generated_id, chan
+
+
 # Sends an infraction to database and log channels if user exists
 async def log_infraction(
     message: discord.Message, client: discord.Client, user: InterfacedUser, moderator: InterfacedUser, i_reason: str, i_type: str, to_dm: bool, ramfs: lexdpyk.ram_filesystem,
@@ -72,33 +96,11 @@ async def log_infraction(
 
     timestamp = datetime_now()  # Infraction timestamp
 
-    # Define db outputs scoped correctly
-    generated_id: str
-    log_channel: Optional[discord.TextChannel]
-
-    with db_hlapi(message.guild.id) as db:
-
-        iterations: int = 0
-        iter_limit: Final[int] = 10_000
-        # Infraction id collision test
-        while db.grab_infraction(generated_id := generate_infractionid()):
-            iterations += 1
-            if iterations > iter_limit:
-                raise lib_sonnetcommands.CommandError(
-                    "ERROR: Failed to generate a unique infraction ID after {iter_limit} attempts\n(Do you have too many infractions/too small of a wordlist installed?)"
-                    )
-
-        # Grab log channel
-        try:
-            chan: int = int(db.grab_config("infraction-log") or "0")
-        except ValueError:
-            chan = 0
-
-        c = client.get_channel(chan)
-        log_channel = c if isinstance(c, discord.TextChannel) else None
+    async with async_db_hlapi(message.guild.id) as db:
+        generated_id, chan = await db.run(_record_infraction, str(user.id), str(moderator.id), i_type, i_reason, int(timestamp.timestamp()))
 
-        # Send infraction to database
-        db.add_infraction(generated_id, str(user.id), str(moderator.id), i_type, i_reason, int(timestamp.timestamp()))
+    c = client.get_channel(chan)
+    log_channel: Optional[discord.TextChannel] = c if isinstance(c, discord.TextChannel) else None
 
     if log_channel:
 
@@ -442,21 +444,6 @@ async def grab_mute_role(message: discord.Message, ramfs: lexdpyk.ram_filesystem
             raise NoMuteRole("No mute role")
 
 
-async def sleep_and_unmute(guild: discord.Guild, member: discord.Member, infractionID: str, mute_role: discord.Role, mutetime: int, ramfs: lexdpyk.ram_filesystem) -> None:
-
-    await asyncio.sleep(mutetime)
-
-    # unmute in db
-    with db_hlapi(guild.id) as db:
-        if db.is_muted(infractionid=infractionID):
-            db.unmute_user(infractionid=infractionID)
-
-            try:
-                await member.remove_roles(to_snowflake(mute_role))
-            except discord.errors.HTTPException:
-                pass
-
-
 def parse_duration_for_mutes(args: List[str], inf_name: str, /) -> Tuple[int, Optional[str]]:
     """
     Parses a duration from args to get mutetime/timeouttime and returns string if a duration was not passed in the correct place but is valid
@@ -552,13 +539,14 @@ async def mute_user(message: discord.Message, args: List[str], client: discord.C
             if warn_text is not None:
                 asyncio.create_task(message.channel.send(warn_text))
 
+        endtime = int(datetime_now().timestamp() + mutetime)
+
         # Stop other mute timers and add to mutedb
         with db_hlapi(message.guild.id) as db:
             db.unmute_user(userid=member.id)
-            db.mute_user(member.id, int(datetime_now().timestamp() + mutetime), infractionID)
+            db.mute_user(member.id, endtime, infractionID)
 
-        # Create in other thread to not block command execution
-        asyncio.create_task(sleep_and_unmute(message.guild, member, infractionID, mute_role, mutetime, ramfs))
+        get_mute_scheduler(client, ctx.kernel_ramfs).schedule(message.guild.id, infractionID, member.id, endtime)
 
     else:
 
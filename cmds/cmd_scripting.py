@@ -137,9 +137,7 @@ async def sonnet_sh(message: discord.Message, args: List[str], client: discord.C
             arguments = totalcommand[1]
             message.content = f'{ctx.conf_cache["prefix"]}{totalcommand[0]} ' + " ".join(totalcommand[1])
 
-            if command in cmds_dict:
-
-                cmd = SonnetCommand(cmds_dict[command], cmds_dict)
+            if (cmd := ctx.registry.get(command)) is not None:
 
                 permission = await parse_permissions(message, ctx.conf_cache, cmd['permission'])
 
@@ -412,11 +410,9 @@ async def run_as_subcommand(message: discord.Message, args: List[str], client: d
     if args:
         command = args[0]
 
-        if command not in ctx.cmds_dict:
+        if (sonnetc := ctx.registry.get(command)) is None:
             raise lib_sonnetcommands.CommandError("ERROR(sub): Command does not exist", private_message=f"Command `{command}` does not exist")
 
-        sonnetc = SonnetCommand(ctx.cmds_dict[command], ctx.cmds_dict)
-
         if sonnetc.execute_ctx == run_as_subcommand:
             raise lib_sonnetcommands.CommandError("ERROR(sub): Cannot call sub from sub")
 
@@ -21,7 +21,7 @@ import lib_starboard
 
 importlib.reload(lib_starboard)
 
-from lib_starboard import starboard_cache, build_starboard_embed
+from lib_starboard import starboard_cache, build_starboard_embed, load_starred_index
 from lib_parsers import parse_boolean_strict, update_log_channel, parse_channel_message
 from lib_loaders import load_message_config
 from lib_db_obfuscator import db_hlapi
@@ -117,13 +117,8 @@ async def force_starboard(message: discord.Message, args: List[str], client: dis
             await message.channel.send("ERROR: Starboard channel is not a TextChannel")
             return 1
 
-        with db_hlapi(message.guild.id) as db:
-            db.inject_enum("starboard", [
-                ("messageID", str),
-                ])
-
-            # Add to starboard
-            db.set_enum("starboard", [str(starmessage.id)])
+        # Add to starboard, through the starred index so the reaction handler sees it
+        load_starred_index(message.guild.id, kwargs["ramfs"]).add(starmessage.id)
 
         try:
             await channel.send(embed=(await build_starboard_embed(starmessage)))
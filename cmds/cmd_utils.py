@@ -48,8 +48,8 @@ import lib_lexdpyk_h as lexdpyk
 from lib_compatibility import discord_datetime_now, user_avatar_url, is_guild_messageable, GuildMessageable
 from lib_db_obfuscator import db_hlapi
 from lib_loaders import embed_colors, load_embed_color
-from lib_parsers import (parse_boolean_strict, parse_permissions, parse_core_permissions, parse_user_member_noexcept, parse_channel_message_noexcept, generate_reply_field, grab_files)
-from lib_sonnetcommands import CallCtx, CommandCtx, SonnetCommand
+from lib_parsers import (parse_boolean_strict, parse_permissions, parse_core_permissions, parse_user_member_noexcept, parse_channel_message_noexcept, generate_reply_field, async_grab_files)
+from lib_sonnetcommands import CallCtx, CommandCtx
 from lib_sonnetconfig import BOT_NAME
 from lib_tparse import Parser
 from lib_datetimeplus import Time
@@ -265,8 +265,91 @@ class Instant(int):
         return Duration(time.monotonic_ns() - self)
 
 
+class HelpCache:
+    """
+    Precomputed help output of the loaded command modules
+
+    Category listings are built once per (module name, module version, prefix), as they only change on a reload or prefix change,
+    this module is reloaded with every kernel_reload_command_modules so the cache is dropped with it,
+    and it is also rebuilt if cmds_dict is not the one it was built from
+    """
+    __slots__ = "source", "modules", "total", "listing", "categories"
+
+    # Guilds with distinct prefixes each add entries, past this the category cache is cleared
+    max_categories: Final = 4096
+
+    def __init__(self, cmds: List[lexdpyk.cmd_module], cmds_dict: lexdpyk.cmd_modules_dict) -> None:
+        self.source = cmds_dict
+        # module name -> module
+        self.modules: Dict[str, lexdpyk.cmd_module] = {mod.category_info["name"]: mod for mod in cmds}
+        # Total commands that are not aliases
+        self.total = sum(1 for i in cmds_dict.values() if "alias" not in i)
+        # Category listing fields, sorted by pretty name
+        self.listing: List[Tuple[str, str]] = []
+        # (module name, module version, prefix) -> (usage, description) of each command
+        self.categories: Dict[Tuple[str, str, str], List[Tuple[str, str]]] = {}
+
+        for module in sorted(cmds, key=lambda m: m.category_info['pretty_name']):
+            mnames = [f"`{i}`" for i in module.commands if 'alias' not in module.commands[i]]
+
+            if mnames:
+                builder = io.StringIO()
+                for idx, i in enumerate(sorted(mnames)):
+                    if idx != 0:
+                        builder.write(", ")
+
+                    if (len(i) + builder.tell()) < 512:
+                        builder.write(i)
+                    else:
+                        builder.write("...")
+                        break
+
+                helptext = builder.getvalue()
+            else:
+                helptext = module.category_info['description']
+
+            self.listing.append((f"{module.category_info['pretty_name']} ({module.category_info['name']})", helptext))
+
+    def category(self, module: lexdpyk.cmd_module, prefix: str) -> List[Tuple[str, str]]:
+        """
+        Grabs the (usage, description) of each non alias command of a module, sorted by name
+
+        :returns: List[Tuple[str, str]] - The commands
+        """
+        key = (module.category_info["name"], module.version_info, prefix)
+
+        try:
+            return self.categories[key]
+        except KeyError:
+            pass
+
+        if len(self.categories) >= self.max_categories:
+            self.categories.clear()
+
+        commands = self.categories[key] = [(prefix + module.commands[i]['pretty_name'], module.commands[i]['description']) for i in sorted(module.commands) if "alias" not in module.commands[i]]
+
+        return commands
+
+
+_help_cache: Optional[HelpCache] = None
+
+
+def get_help_cache(ctx: CommandCtx) -> HelpCache:
+    """
+    Grabs the HelpCache of the loaded command modules, building it if it does not exist or is stale
+
+    :returns: HelpCache - The help cache
+    """
+    global _help_cache
+
+    if _help_cache is None or _help_cache.source is not ctx.cmds_dict:
+        _help_cache = HelpCache(ctx.cmds, ctx.cmds_dict)
+
+    return _help_cache
+
+
 class HelpHelper:
-    __slots__ = "guild", "args", "client", "ctx", "prefix", "helpname", "message", "start_time"
+    __slots__ = "guild", "args", "client", "ctx", "prefix", "helpname", "message", "start_time", "cache"
 
     def __init__(self, message: discord.Message, guild: discord.Guild, args: List[str], client: discord.Client, ctx: CommandCtx, helpname: str, start_time: Instant):
         self.message = message
@@ -277,17 +360,17 @@ class HelpHelper:
         self.prefix = ctx.prefix
         self.helpname = helpname
         self.start_time = start_time
+        self.cache = get_help_cache(ctx)
 
     # Builds a single command
     async def single_command(self, cmd_name: str) -> discord.Embed:
 
-        cmds_dict = self.ctx.cmds_dict
+        registry = self.ctx.registry
 
         # relies on true name for alias grouping
-        if 'alias' in cmds_dict[cmd_name]:
-            cmd_name = cmds_dict[cmd_name]['alias']
+        cmd_name = registry.commands[cmd_name]
 
-        command = SonnetCommand(cmds_dict[cmd_name])
+        command = registry[cmd_name]
 
         cmd_embed = discord.Embed(title=f'Command "{cmd_name}"', description=command.description, color=load_embed_color(self.guild, embed_colors.primary, self.ctx.ramfs))
         cmd_embed.set_author(name=self.helpname)
@@ -309,11 +392,11 @@ class HelpHelper:
 
         cmd_embed.add_field(name="Permission level:", value=perms + permstr)
 
-        aliases = ", ".join(filter(lambda c: "alias" in cmds_dict[c] and cmds_dict[c]["alias"] == cmd_name, cmds_dict))
+        aliases = ", ".join(registry.aliases[cmd_name])
         if aliases:
             cmd_embed.add_field(name="Aliases:", value=aliases, inline=False)
 
-        module: lexdpyk.cmd_module = next(i for i in self.ctx.cmds if cmd_name in i.commands)
+        module: lexdpyk.cmd_module = registry.modules[cmd_name]
 
         cmd_embed.set_footer(text=f"Module: {module.category_info['pretty_name']} | Took: {self.start_time.elapsed().milli_f():.1f}ms")
 
@@ -322,8 +405,7 @@ class HelpHelper:
     # Builds help for a category
     async def category_help(self, category_name: str) -> Tuple[str, List[Tuple[str, str]], lexdpyk.cmd_module]:
 
-        curmod = next(mod for mod in self.ctx.cmds if mod.category_info["name"] == category_name)
-        nonAliasCommands = list(filter(lambda c: "alias" not in curmod.commands[c], curmod.commands))
+        curmod = self.cache.modules[category_name]
         description = curmod.category_info["description"]
         override_commands: Optional[List[Tuple[str, str]]] = None
 
@@ -335,10 +417,7 @@ class HelpHelper:
                 override_commands = newhelp[1]
 
         if override_commands is None:
-            normal_commands: List[Tuple[str, str]] = []
-            for i in sorted(nonAliasCommands):
-                normal_commands.append((self.prefix + curmod.commands[i]['pretty_name'], curmod.commands[i]['description']))
-            return description, normal_commands, curmod
+            return description, self.cache.category(curmod, self.prefix), curmod
         else:
             return description, override_commands, curmod
 
@@ -353,34 +432,10 @@ class HelpHelper:
         cmd_embed = discord.Embed(title=f"Category Listing (Page {page+1} / {(len(cmds) + (per_page-1))//per_page})", color=load_embed_color(self.guild, embed_colors.primary, self.ctx.ramfs))
         cmd_embed.set_author(name=self.helpname)
 
-        total = 0
-        # Total counting is separate due to pagination not counting all modules
-        for cmd in cmds_dict:
-            if 'alias' not in cmds_dict[cmd]:
-                total += 1
-
-        for module in sorted(cmds, key=lambda m: m.category_info['pretty_name'])[(page * per_page):(page * per_page) + per_page]:
-            mnames = [f"`{i}`" for i in module.commands if 'alias' not in module.commands[i]]
-
-            if mnames:
-                builder = io.StringIO()
-                for idx, i in enumerate(sorted(mnames)):
-                    if idx != 0:
-                        builder.write(", ")
-
-                    if (len(i) + builder.tell()) < 512:
-                        builder.write(i)
-                    else:
-                        builder.write("...")
-                        break
+        for name, helptext in self.cache.listing[(page * per_page):(page * per_page) + per_page]:
+            cmd_embed.add_field(name=name, value=helptext, inline=False)
 
-                helptext = builder.getvalue()
-            else:
-                helptext = module.category_info['description']
-
-            cmd_embed.add_field(name=f"{module.category_info['pretty_name']} ({module.category_info['name']})", value=helptext, inline=False)
-
-        cmd_embed.set_footer(text=f"Total Commands: {total} | Total Endpoints: {len(cmds_dict)} | Took: {self.start_time.elapsed().milli_f():.1f}ms")
+        cmd_embed.set_footer(text=f"Total Commands: {self.cache.total} | Total Endpoints: {len(cmds_dict)} | Took: {self.start_time.elapsed().milli_f():.1f}ms")
 
         return cmd_embed
 
@@ -395,7 +450,6 @@ async def help_function(message: discord.Message, args: List[str], client: disco
     per_page: int = 10
 
     cmds = ctx.cmds
-    cmds_dict = ctx.cmds_dict
 
     parser = Parser("help")
     pageP = parser.add_arg(["-p", "--page"], lambda s: int(s) - 1)
@@ -413,10 +467,8 @@ async def help_function(message: discord.Message, args: List[str], client: disco
 
     if args:
 
-        modules = {mod.category_info["name"] for mod in cmds}
-
         # Per module help
-        if (a := args[0].lower()) in modules and not commandonly:
+        if (a := args[0].lower()) in help_helper.cache.modules and not commandonly:
 
             description, commands, curmod = await help_helper.category_help(a)
             pagecount = (len(commands) + (per_page - 1)) // per_page
@@ -440,7 +492,7 @@ async def help_function(message: discord.Message, args: List[str], client: disco
                 raise lib_sonnetcommands.CommandError(constants.sonnet.error_embed)
 
         # Per command help
-        elif a in cmds_dict:
+        elif a in ctx.registry:
             try:
                 await message.channel.send(embed=await help_helper.single_command(a))
             except discord.errors.Forbidden:
@@ -593,7 +645,7 @@ async def grab_guild_message(message: discord.Message, args: List[str], client:
     message_embed.timestamp = discord_message.created_at
 
     # Grab files from cache
-    fileobjs = grab_files(discord_message.guild.id, discord_message.id, ctx.kernel_ramfs)
+    fileobjs = await async_grab_files(discord_message.guild.id, discord_message.id, ctx.kernel_ramfs)
 
     # Grab files async if not in cache
     if fileobjs is None:
@@ -2,3 +2,16 @@
 
 # Owner
 BOT_OWNER = ""
+
+# Handler time budgets in seconds, 0 disables a budget
+# A dynamiclib handler running past its budget is cancelled and reported as an error, see debug-event-stats for timings
+# Budget for any single handler
+HANDLER_TIMEOUT = 30
+# Overrides of HANDLER_TIMEOUT by event name ("on-message") or by handler name as shown in debug-event-stats
+#  on-message and on-ready run commands and startup work inline, which can legitimately take long
+#  on-message-delete and on-bulk-message-delete decrypt and upload logged files, a bulk delete can carry many of them
+HANDLER_TIMEOUTS = {"on-message": 0, "on-ready": 0, "on-message-delete": 180, "on-bulk-message-delete": 600}
+# Budget for all exec order tiers of an event together, tiers not started within the budget are skipped
+EVENT_TIMEOUT = 60
+# Overrides of EVENT_TIMEOUT by event name
+EVENT_TIMEOUTS = {"on-message": 0, "on-ready": 0, "on-message-delete": 240, "on-bulk-message-delete": 660}
@@ -13,6 +13,18 @@ STARBOARD_COUNT = "5"
 DB_TYPE = "mariadb"
 # only needs to be set if using sqlite3 db in sonnet mode, mariadb login is stored in .login-info.txt
 SQLITE3_LOCATION = "datastore/sonnetdb.db"
+# Max number of idle database connections kept open for reuse, also the number of db executor threads when using mariadb
+DB_POOL_SIZE = 4
+# Seconds between background health checks of idle database connections
+DB_HEALTHCHECK_INTERVAL = 60
+# Milliseconds that infraction, mute, config and starboard writes are batched for before being written in one transaction, 0 writes immediately
+DB_WRITE_BEHIND_MS = 250
+# Max number of timed unmutes (database lookups and role removals) processed at once, mostly matters when recovering mutes after downtime
+UNMUTE_CONCURRENCY = 8
+# Max total bytes of message attachments kept in the encrypted file cache for message delete logs, the oldest files are evicted past this
+FILELOG_MAX_BYTES = 1024**3
+# Number of attachments downloaded into the file cache at once
+FILELOG_WORKERS = 4
 
 # Configure whether to use re2 or re, any public instance must use re2 due to exploits, however re is cross platform and easier to set up
 REGEX_VERSION = "re2"
@@ -4,25 +4,23 @@
 import asyncio
 import copy as pycopy
 import gzip
-import hashlib
 import io
-import os
 import string
 import time
 import warnings
-from typing import (Any, Awaitable, Callable, Dict, Final, List, Literal, NewType, Optional, Tuple, TypedDict, Union, cast)
+from typing import (Any, Awaitable, Callable, Dict, Final, List, Literal, Optional, Tuple, Union)
 
 import discord
 import lib_constants as constants
 import lib_lexdpyk_h as lexdpyk
 import lib_sonnetcommands
-import lz4.frame
+from lib_antispam import load_antispam_store
+from lib_filelog import get_filelog
 from lib_compatibility import user_avatar_url
-from lib_db_obfuscator import db_hlapi
-from lib_encryption_wrapper import encrypted_writer
+from lib_db_obfuscator import async_db_hlapi
 from lib_loaders import (datetime_now, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
-from lib_parsers import (generate_reply_field, grab_files, parse_blacklist, parse_boolean_strict, parse_permissions, parse_skip_message)
-from lib_sonnetcommands import (CallCtx, CommandCtx, ExecutableCtxT, SonnetCommand, parse_command_novalidate)
+from lib_parsers import (generate_reply_field, async_grab_files, cached_file_count, close_files, delete_files, parse_blacklist, parse_boolean_strict, parse_permissions, parse_skip_message)
+from lib_sonnetcommands import (CallCtx, CommandCtx, ExecutableCtxT, parse_command_novalidate)
 from lib_sonnetconfig import AUTOMOD_ENABLED
 
 ALLOWED_CHARS: Final = set(string.ascii_letters + string.digits + "-+;:'\"!@#$%^&()/.,?[{}]= ")
@@ -41,23 +39,24 @@ async def catch_logging_error(channel: discord.TextChannel, contents: discord.Em
             pass
 
 
-def decide_to_file(msg: discord.Message, filename: str, behavior: Literal["none", "gzip", "text"]) -> Optional[discord.File]:
-    if any(i not in ALLOWED_CHARS for i in msg.content) and behavior != "none":
+def text_to_file(raw: bytes, filename: str, behavior: Literal["gzip", "text"]) -> discord.File:
 
-        msgraw = msg.content.encode("utf8")
+    if behavior == "gzip":
+        buf = io.BytesIO()
+        with gzip.GzipFile(filename + "txt", "wb", fileobj=buf) as txt:
+            txt.write(raw)
+        buf.seek(0)
+        filename += "gz"
+    else:
+        buf = io.BytesIO(raw)
+        filename += "txt"
 
-        if behavior == "text":
-            buf = io.BytesIO(msgraw)
-            filename += "txt"
+    return discord.File(buf, filename=filename)
 
-        elif behavior == "gzip":
-            buf = io.BytesIO()
-            with gzip.GzipFile(filename + "txt", "wb", fileobj=buf) as txt:
-                txt.write(msgraw)
-            buf.seek(0)
-            filename += "gz"
 
-        return discord.File(buf, filename=filename)
+def decide_to_file(msg: discord.Message, filename: str, behavior: Literal["none", "gzip", "text"]) -> Optional[discord.File]:
+    if any(i not in ALLOWED_CHARS for i in msg.content) and behavior != "none":
+        return text_to_file(msg.content.encode("utf8"), filename, behavior)
 
     return None
 
@@ -93,7 +92,7 @@ async def on_message_delete(message: discord.Message, **kargs: Any) -> None:
     elif not message.guild:
         return
 
-    files: Optional[List[discord.File]] = grab_files(message.guild.id, message.id, kernel_ramfs, delete=True)
+    files: Optional[List[discord.File]] = await async_grab_files(message.guild.id, message.id, kernel_ramfs, delete=True)
 
     # Change Optional[List[discord.File]] to List[discord.File]
     files = files if files is not None else []
@@ -149,6 +148,133 @@ async def on_message_delete(message: discord.Message, **kargs: Any) -> None:
     await catch_logging_error(log_channel, message_embed, files)
 
 
+def bulk_transcript(messages: List[discord.Message]) -> bytes:
+    """
+    Renders deleted messages as one plaintext transcript, oldest first
+
+    :returns: bytes - The utf8 encoded transcript
+    """
+
+    lines: List[str] = []
+
+    for message in sorted(messages, key=lambda m: m.id):
+        lines.append(f"[{message.created_at.strftime('%Y-%m-%d %H:%M:%S')} UTC] {message.author} ({message.author.id}) Message ID: {message.id}")
+
+        if (r := message.reference) and (rr := r.resolved) and isinstance(rr, discord.Message):
+            lines.append(f"Replying to: {rr.author} ({rr.author.id}) Message ID: {rr.id}")
+
+        if message.content:
+            lines.append(message.content)
+
+        for i in message.attachments:
+            lines.append(f"Attachment: {i.filename}")
+
+        lines.append("")
+
+    return "\n".join(lines).encode("utf8")
+
+
+async def _grab_page_files(guild_id: int, messages: List[discord.Message], kernel_ramfs: lexdpyk.ram_filesystem) -> List[discord.File]:
+
+    grabbed: Final = await asyncio.gather(*(async_grab_files(guild_id, i.id, kernel_ramfs, delete=True) for i in messages), return_exceptions=True)
+
+    for message_files in grabbed:
+        if isinstance(message_files, BaseException):
+            for other in grabbed:
+                if isinstance(other, list):
+                    close_files(other)
+            raise message_files
+
+    files: List[discord.File] = []
+    for message, message_files in zip(messages, grabbed):
+        if not isinstance(message_files, list):
+            continue
+        # Add logged_ prefix to make it impossible to namesnipe message content, and the message id as names may collide
+        for i in message_files:
+            i.filename = f"logged_{message.id}_{i.filename}"
+            files.append(i)
+
+    return files
+
+
+async def on_bulk_message_delete(messages: List[discord.Message], **kargs: Any) -> None:
+
+    client: Final[discord.Client] = kargs["client"]
+    kernel_ramfs: Final[lexdpyk.ram_filesystem] = kargs["kernel_ramfs"]
+    ramfs: Final[lexdpyk.ram_filesystem] = kargs["ramfs"]
+
+    # Ignore bots, bulk deletes are always from one channel so they share a guild
+    messages = [i for i in messages if not parse_skip_message(client, i, allow_bots=True)]
+
+    if not messages or not (guild := messages[0].guild):
+        return
+
+    inc_statistics_better(guild.id, "on-bulk-message-delete", kernel_ramfs)
+
+    db_configs = load_message_config(guild.id, ramfs, datatypes=message_and_edit_logs)
+
+    message_log: Optional[str] = db_configs["message-log"]
+    behavior: Final = message_file_log_behavior(db_configs["message-to-file-behavior"])
+
+    log_channel = None
+    try:
+        if message_log:
+            log_channel = client.get_channel(int(message_log))
+    except ValueError:
+        try:
+            await messages[0].channel.send("ERROR: message-log config is corrupt in database, please reset")
+        except discord.errors.Forbidden:
+            pass
+
+    if not isinstance(log_channel, discord.TextChannel):
+        # Without a log channel cached files are only deleted, never opened
+        for i in messages:
+            delete_files(guild.id, i.id, kernel_ramfs)
+        return
+
+    # The transcript is the only place the content is logged, so it is sent as text even if file logging is off
+    transcript: Final = text_to_file(bulk_transcript(messages), f"{messages[0].channel.id}_bulk_transcript.", "gzip" if behavior == "gzip" else "text")
+
+    # Discord allows 10 files per message, the transcript and first files go with the log embed and the rest are paged after it
+    # Messages are grouped into pages by their cached file count, so at most one page of files is open at a time
+    counts: Final = [cached_file_count(guild.id, i.id, kernel_ramfs) for i in messages]
+    pages: Final[List[List[discord.Message]]] = [[]]
+    room = 9
+    for message, count in zip(messages, counts):
+        if not count:
+            continue
+        if count > room:
+            pages.append([])
+            room = 10
+        pages[-1].append(message)
+        room -= count
+
+    authors: Final = len(set(i.author.id for i in messages))
+    color: Final = load_embed_color(guild, embed_colors.deletion, ramfs)
+    logged: Final = sum(counts)
+
+    message_embed: Final = discord.Embed(
+        title=f"{len(messages)} messages bulk deleted in #{messages[0].channel}",
+        description=f"Sent by {authors} user{'s' if authors != 1 else ''}, {logged} logged file{'s' if logged != 1 else ''}",
+        color=color
+        )
+    message_embed.set_footer(text=f"Message IDs: {min(i.id for i in messages)}-{max(i.id for i in messages)}")
+    message_embed.timestamp = datetime_now()
+
+    for page, page_messages in enumerate(pages, start=1):
+        files = await _grab_page_files(guild.id, page_messages, kernel_ramfs)
+
+        try:
+            if page == 1:
+                await catch_logging_error(log_channel, message_embed, [transcript] + files)
+            else:
+                page_embed = discord.Embed(title=f"Bulk deleted files in #{messages[0].channel} ({page}/{len(pages)})", color=color)
+                page_embed.set_footer(text=f"Message IDs: {min(i.id for i in messages)}-{max(i.id for i in messages)}")
+                await catch_logging_error(log_channel, page_embed, files)
+        finally:
+            close_files(files)
+
+
 async def attempt_message_delete(message: discord.Message) -> None:
     try:
         await message.delete()
@@ -193,6 +319,10 @@ async def on_message_edit(old_message: discord.Message, message: discord.Message
 
     inc_statistics_better(message.guild.id, "on-message-edit", kernel_ramfs)
 
+    # Embeds being resolved and attachments being removed fire edits too, there is nothing to log or scan in those
+    if old_message.content == message.content and {i.id for i in message.attachments} <= {i.id for i in old_message.attachments}:
+        return
+
     db_configs = load_message_config(message.guild.id, kctx.ramfs, datatypes=message_and_edit_logs)
 
     message_log_str: Final[Optional[str]] = db_configs["message-edit-log"] or (db_configs["message-log"] if parse_boolean_strict(db_configs["edit-log-is-message-log"]) else None)
@@ -235,7 +365,7 @@ async def on_message_edit(old_message: discord.Message, message: discord.Message
         # Check against blacklist
         mconf: Final = load_message_config(message.guild.id, ramfs)
         # we could pass the clientuser here to enable the set-whitelist escape, but that codepath shouldn't be on on a message edit
-        broke_blacklist, notify, infraction_type = parse_blacklist((message, mconf, ramfs), )
+        broke_blacklist, notify, infraction_type = parse_blacklist((message, mconf, ramfs), old_message=old_message)
 
         if broke_blacklist:
 
@@ -262,143 +392,44 @@ async def on_message_edit(old_message: discord.Message, message: discord.Message
             asyncio.create_task(grab_an_adult(message, message.guild, client, mconf, kctx.ramfs))
 
 
-class BaseAntispamMeta(TypedDict):
-    name: str
-    message_count: int
-    lifetime_millis: int
-
-
-class FullAntispamMeta(BaseAntispamMeta, total=False):
-    char_count: int
-
-
-CharCount = NewType("CharCount", int)
-
-
-def breaches_char_count(total_char_count: int, scan: FullAntispamMeta) -> bool:
-    """
-    Returns True in cases where scan does not have a char_count attr
-    """
-    if "char_count" in scan:
-        return total_char_count > scan["char_count"]
-
-    return True
-
-
-def test_single_antispam(message: discord.Message, scan: FullAntispamMeta, ramfs: lexdpyk.ram_filesystem) -> bool:
+def antispam_check(message: discord.Message, ramfs: lexdpyk.ram_filesystem, antispam: List[str], charantispam: List[str]) -> Tuple[bool, Literal["", "Antispam", "CharAntispam"]]:
     if not message.guild:
         raise RuntimeError("ERROR: antispam_check called on a non guild message")
 
     # Weird behavior(ultrabear): message.created_at.timestamp() returns unaware dt so we need to use datetime.utcnow for timestamps in antispam
     # Update(ultrabear): now that we use discord_datetime_now() we get an unaware dt or aware dt depending on dpy version
 
-    # We drop a item if it is older than this
+    # We drop a item if it is older than its scans droptime
     #
     # We use the created_at timestamp here because this is the most recent message, and antispam should be based on durations created from message timestamps
     # If it was based on current polled time (previously it was) a lagspike could cause the bot to not trigger antispam on a set of messages where it should have
     #
     # We add one millisecond so that a lifetime of 0 will drop the current message
-    droptime = (round(message.created_at.timestamp() * 1000) - scan["lifetime_millis"]) + 1
-
-    try:
-        data_dir = cast(Dict[int, List[Tuple[int, CharCount]]], ramfs.read_f(f"{message.guild.id}/{scan['name']}"))
-        assert isinstance(data_dir, dict)
-    except FileNotFoundError:
-        data_dir = ramfs.create_f(f"{message.guild.id}/{scan['name']}", f_type=dict)
-
-    user_data = data_dir.get(message.author.id, [])
-
-    # add current message
-    user_data.append((round(message.created_at.timestamp() * 1000), CharCount(len(message.content))), )
-
-    new_user_data = []
-    total_char_count = 0
-
-    for (timestamp_millis, char_count) in user_data:
-
-        if timestamp_millis > droptime:
-            total_char_count += char_count
-            new_user_data.append((timestamp_millis, char_count), )
+    created_millis = round(message.created_at.timestamp() * 1000)
 
-    # load new data
-    data_dir[message.author.id] = new_user_data
+    asam_droptime = (created_millis - int(float(antispam[1]) * 1000)) + 1
+    casam_droptime = (created_millis - int(float(charantispam[1]) * 1000)) + 1
 
-    return breaches_char_count(total_char_count, scan) and len(new_user_data) >= scan["message_count"]
+    # Both scans share one window per user, so a message is stored once and both are tested in one pass
+    store = load_antispam_store(message.guild.id, ramfs)
+    (asam_count, _), (casam_count, casam_chars) = store.push(message.author.id, created_millis, len(message.content), (asam_droptime, casam_droptime))
 
-
-def antispam_check(message: discord.Message, ramfs: lexdpyk.ram_filesystem, antispam: List[str], charantispam: List[str]) -> Tuple[bool, Literal["", "Antispam", "CharAntispam"]]:
-
-    antispam_data: FullAntispamMeta = {
-        "name": "asam",
-        "message_count": int(antispam[0]),
-        "lifetime_millis": int(float(antispam[1]) * 1000),
-        }
-
-    char_antispam_data: FullAntispamMeta = {
-        "name": "casam",
-        "message_count": int(charantispam[0]),
-        "lifetime_millis": int(float(charantispam[1]) * 1000),
-        "char_count": int(charantispam[2]),
-        }
-
-    if test_single_antispam(message, antispam_data, ramfs):
+    if asam_count >= int(antispam[0]):
         return (True, "Antispam")
-    elif test_single_antispam(message, char_antispam_data, ramfs):
+    elif casam_chars > int(charantispam[2]) and casam_count >= int(charantispam[0]):
         return (True, "CharAntispam")
 
     return (False, "")
 
 
-async def download_file(nfile: discord.Attachment, compression: Any, encryption: encrypted_writer, filename: str, ramfs: lexdpyk.ram_filesystem, guild_id: int, message_id: int) -> None:
-
-    await nfile.save(compression, seek_begin=False)
-    compression.close()
-    encryption.close()
-
-    # Keep message files in cache for 60 minutes, or 1 hour
-    # This was previously 30 minutes as it was seen as an average response time,
-    # but has been raised to account for some edge case poor response times from moderators
-    # This did not show significant disk use at 30 minutes, so double that time should be fine
-    await asyncio.sleep(60 * 60)
-
-    try:
-        os.remove(filename)
-    except FileNotFoundError:
-        pass
-    try:
-        ramfs.rmdir(f"{guild_id}/files/{message_id}")
-    except FileNotFoundError:
-        pass
-
-
 async def log_message_files(message: discord.Message, kernel_ramfs: lexdpyk.ram_filesystem) -> None:
     if not message.guild:
         return
 
-    for i in message.attachments:
-
-        fname: bytes = i.filename.encode("utf8")
-
-        ramfs_path = f"{message.guild.id}/files/{message.id}/{hashlib.sha256(fname).hexdigest()}"
-
-        namefile = kernel_ramfs.create_f(f"{ramfs_path}/name")
-        namefile.write(fname)
+    filelog = get_filelog(kernel_ramfs)
 
-        keyfile = kernel_ramfs.create_f(f"{ramfs_path}/key")
-        keyfile.write(key := os.urandom(32))
-        keyfile.write(iv := os.urandom(16))
-
-        pointerfile = kernel_ramfs.create_f(f"{ramfs_path}/pointer")
-        pointer = hashlib.sha256(fname + key + iv).hexdigest()
-        file_loc = f"./datastore/{message.guild.id}-{pointer}.cache.db"
-        pointerfile.write(file_loc.encode("utf8"))
-
-        # Create encryption and compression wrappers (raw -> compressed -> encrypted -> disk)
-        encryption_fileobj = encrypted_writer(file_loc, key, iv)
-        compression_fileobj = lz4.frame.LZ4FrameFile(filename=encryption_fileobj, mode="wb")
-
-        # Do file downloading in async
-        asyncio.create_task(download_file(i, compression_fileobj, encryption_fileobj, file_loc, kernel_ramfs, message.guild.id, message.id))
+    for i in message.attachments:
+        filelog.submit(i, message.guild.id, message.id)
 
 
 def warn_missing(command_dict: Dict[str, Any], argument: str, /) -> ExecutableCtxT:
@@ -470,8 +501,8 @@ async def do_automod_pass(message: discord.Message, client: discord.Client, mcon
 
         if action == "mute":
 
-            with db_hlapi(message.guild.id) as db:
-                if not db.is_muted(userid=message.author.id):
+            async with async_db_hlapi(message.guild.id) as db:
+                if not await db.is_muted(userid=message.author.id):
                     timeout = True
 
         elif action == "timeout":
@@ -574,10 +605,10 @@ async def on_message(message: discord.Message, kernel_args: lexdpyk.KernelArgs)
         return
 
     # Process commands
-    if command in command_modules_dict:
-        command_ctx.command_name = command
+    registry: Final = command_ctx.registry
 
-        cmd: Final = SonnetCommand(command_modules_dict[command], command_modules_dict)
+    if (cmd := registry.get(command)) is not None:
+        command_ctx.command_name = command
 
         if not await parse_permissions(message, mconf, cmd.permission):
             return  # Return on no perms
@@ -586,7 +617,7 @@ async def on_message(message: discord.Message, kernel_args: lexdpyk.KernelArgs)
             stats["end"] = round(time.time() * 100000)
 
             try:
-                await cmd.execute_ctx(message, arguments, client, command_ctx)
+                await registry.executors[command](message, arguments, client, command_ctx)
             except lib_sonnetcommands.CommandError as ce:
                 asyncio.create_task(ce.send(message))
 
@@ -617,6 +648,7 @@ commands: Final[Dict[str, Callable[..., Any]]] = {
     "on-message": on_message,
     "on-message-edit": on_message_edit,
     "on-message-delete": on_message_delete,
+    "on-bulk-message-delete": on_bulk_message_delete,
     }
 
 version_info: Final = "2.0.2"
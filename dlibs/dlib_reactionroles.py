@@ -2,6 +2,8 @@
 # Ultrabear 2021
 
 import importlib
+import asyncio
+import functools
 
 import discord
 
@@ -11,15 +13,12 @@ importlib.reload(lib_loaders)
 import lib_lexdpyk_h
 
 importlib.reload(lib_lexdpyk_h)
-import lib_compatibility
-
-importlib.reload(lib_compatibility)
 
 from lib_loaders import load_message_config, inc_statistics_better
 from lib_lexdpyk_h import ToKernelArgs, KernelArgs
-from lib_compatibility import to_snowflake
+from lib_sonnetconfig import STATELESS
 
-from typing import Dict, Any, Union, Optional, Tuple
+from typing import Dict, Any, Union, Optional, Tuple, Set, cast
 
 reactionrole_types: Dict[Union[int, str], Any] = {0: "sonnet_reactionroles", "json": [["reaction-role-data", {}], ]}
 
@@ -34,29 +33,125 @@ def emojifrompayload(payload: discord.RawReactionActionEvent) -> Tuple[str, Opti
         return "", None
 
 
-async def get_role_from_emojiname(payload: discord.RawReactionActionEvent, client: discord.Client, reactionroles: Dict[str, Dict[str, int]]) -> Optional[Tuple[discord.Member, discord.Role]]:
+# (message id, emoji name or custom emoji id) -> role id
+ReactionRoleIndexT = Dict[Tuple[int, str], int]
+
+
+def build_reactionrole_index(reactionroles: Dict[str, Dict[str, int]]) -> Tuple[Dict[str, Dict[str, int]], ReactionRoleIndexT]:
+    # The database is not trusted, malformed entries can never match a reaction and are skipped
+    return reactionroles, {
+        (int(message_id), emoji): role_id
+        for message_id, emojis in reactionroles.items() if str(message_id).isdecimal() and isinstance(emojis, dict) for emoji, role_id in emojis.items()
+        }
+
+
+def load_reactionrole_index(guild_id: int, ramfs: lib_lexdpyk_h.ram_filesystem, reactionroles: Dict[str, Dict[str, int]]) -> ReactionRoleIndexT:
+    """
+    Grabs the reactionrole index of a guild, building it from the loaded reaction-role-data config if needed
+    The index is cached next to the config so cache sweeps drop both, and is tied to the config object it was built from
+
+    :returns: ReactionRoleIndexT -- The index
+    """
+
+    if STATELESS:
+        return build_reactionrole_index(reactionroles)[1]
+
+    try:
+        source, index = cast(Tuple[Dict[str, Dict[str, int]], ReactionRoleIndexT], ramfs.read_f(dirlist=[str(guild_id), "caches", "reactionrole_index"]))
+        if source is reactionroles:
+            return index
+        ramfs.remove_f(dirlist=[str(guild_id), "caches", "reactionrole_index"])
+    except FileNotFoundError:
+        pass
+
+    return ramfs.create_f(dirlist=[str(guild_id), "caches", "reactionrole_index"], f_type=functools.partial(build_reactionrole_index, reactionroles))[1]
+
+
+async def get_role_from_emojiname(payload: discord.RawReactionActionEvent, client: discord.Client, index: ReactionRoleIndexT) -> Optional[Tuple[discord.Member, discord.Role]]:
 
     emojiname, opt = emojifrompayload(payload)
 
-    message_id_str = str(payload.message_id)
+    if (role_id := index.get((payload.message_id, emojiname))) is None:
+        if opt is None or (role_id := index.get((payload.message_id, opt))) is None:
+            return None
 
-    if message_id_str not in reactionroles:
+    if not payload.guild_id:
         return None
 
-    if emojiname in reactionroles[message_id_str]:
-        role_id = reactionroles[message_id_str][emojiname]
-    elif opt is not None and opt in reactionroles[message_id_str]:
-        role_id = reactionroles[message_id_str][opt]
-    else:
+    # Resolve from the gateway cache, REST is only used when the cache misses
+    if not (guild := client.get_guild(payload.guild_id) or await client.fetch_guild(payload.guild_id)):
         return None
 
-    if not payload.guild_id:
+    if not (role := guild.get_role(role_id)):
+        return None
+
+    if not (member := payload.member or guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)):
         return None
 
-    if (guild := (await client.fetch_guild(payload.guild_id))) and (member := (await guild.fetch_member(payload.user_id))) and (role := guild.get_role(role_id)):
-        return member, role
+    return member, role
+
+
+# Seconds that role changes of one member are collected for before being applied together
+_COALESCE_WINDOW = 0.5
+
+
+class RoleCoalescer:
+    """
+    Collects reactionrole changes per member of a guild for a short window and applies them in one call
+
+    The last change to a role wins, so an add and remove of the same role inside the window cancel out,
+    and changes that leave the members roles as they are cost no REST calls at all
+    """
+    __slots__ = "guild_id", "_pending"
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+        # member id -> role id -> True to add or False to remove
+        self._pending: Dict[int, Dict[int, bool]] = {}
+
+    def queue(self, member: discord.Member, role: discord.Role, add: bool) -> None:
+
+        if (changes := self._pending.get(member.id)) is None:
+            changes = self._pending[member.id] = {}
+            asyncio.create_task(self._apply_later(member.guild, member.id))
+
+        changes[role.id] = add
+
+    async def _apply_later(self, guild: discord.Guild, member_id: int) -> None:
+
+        await asyncio.sleep(_COALESCE_WINDOW)
+
+        changes = self._pending.pop(member_id)
+
+        try:
+            # Grab the member again for up to date roles
+            member = guild.get_member(member_id) or await guild.fetch_member(member_id)
+
+            current: Set[int] = {i.id for i in member.roles}
+            add = [i for i, v in changes.items() if v and i not in current]
+            remove = [i for i, v in changes.items() if not v and i in current]
+
+            if len(add) + len(remove) == 1:
+                # A single change uses the per role endpoint, which cannot clobber roles changed elsewhere in the meantime
+                if add:
+                    await member.add_roles(discord.Object(add[0]))
+                else:
+                    await member.remove_roles(discord.Object(remove[0]))
+
+            elif add or remove:
+                # The default role cannot be passed to edit
+                roles = (current | set(add)) - set(remove) - {guild.id}
+                await member.edit(roles=[discord.Object(i) for i in roles])
+
+        except discord.errors.HTTPException:
+            pass
+
 
-    return None
+def load_role_coalescer(guild_id: int, ramfs: lib_lexdpyk_h.ram_filesystem) -> RoleCoalescer:
+    try:
+        return cast(RoleCoalescer, ramfs.read_f(dirlist=[str(guild_id), "reactionrole_pending"]))
+    except FileNotFoundError:
+        return ramfs.create_f(dirlist=[str(guild_id), "reactionrole_pending"], f_type=functools.partial(RoleCoalescer, guild_id))
 
 
 @ToKernelArgs
@@ -75,13 +170,10 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent, kargs: Ke
             return
 
     if rrconf:
-        opt = await get_role_from_emojiname(payload, client, rrconf)
+        opt = await get_role_from_emojiname(payload, client, load_reactionrole_index(payload.guild_id, kargs.ramfs, rrconf))
         if opt is not None:
-            try:
-                member, role = opt
-                await member.add_roles(to_snowflake(role))
-            except discord.errors.Forbidden:
-                pass
+            member, role = opt
+            load_role_coalescer(payload.guild_id, kargs.ramfs).queue(member, role, True)
 
 
 @ToKernelArgs
@@ -100,13 +192,10 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent, kargs:
             return
 
     if rrconf:
-        opt = await get_role_from_emojiname(payload, client, rrconf)
+        opt = await get_role_from_emojiname(payload, client, load_reactionrole_index(payload.guild_id, kargs.ramfs, rrconf))
         if opt is not None:
-            try:
-                member, role = opt
-                await member.remove_roles(to_snowflake(role))
-            except discord.errors.Forbidden:
-                pass
+            member, role = opt
+            load_role_coalescer(payload.guild_id, kargs.ramfs).queue(member, role, False)
 
 
 category_info = {'name': 'ReactionRoles'}
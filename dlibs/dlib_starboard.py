@@ -4,9 +4,6 @@
 import importlib
 
 import discord
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
 import lib_loaders
 
 importlib.reload(lib_loaders)
@@ -14,8 +11,7 @@ import lib_starboard
 
 importlib.reload(lib_starboard)
 
-from lib_starboard import starboard_cache, build_starboard_embed
-from lib_db_obfuscator import db_hlapi
+from lib_starboard import starboard_cache, build_starboard_embed, load_starred_index
 from lib_loaders import load_message_config, inc_statistics_better
 
 from typing import Any
@@ -40,17 +36,17 @@ async def on_reaction_add(reaction: discord.Reaction, user: discord.User, **karg
     if bool(int(mconf["starboard-enabled"])) and reaction.emoji == mconf["starboard-emoji"] and reaction.count >= int(mconf["starboard-count"]):
         if (channel_id := mconf["starboard-channel"]) and (channel := client.get_channel(int(channel_id))) and isinstance(channel, discord.TextChannel):
 
-            with db_hlapi(message.guild.id) as db:
-                with db.inject_enum_context("starboard", [("messageID", str)]) as starboard:
-                    if not (starboard.grab(str(message.id))) and not (int(channel_id) == message.channel.id):
+            starred = load_starred_index(message.guild.id, ramfs)
+
+            if message.id not in starred and not (int(channel_id) == message.channel.id):
 
-                        # Add to starboard
-                        starboard.set([str(message.id)])
+                # Add to starboard
+                starred.add(message.id)
 
-                        try:
-                            await channel.send(embed=(await build_starboard_embed(message)))
-                        except discord.errors.Forbidden:
-                            pass
+                try:
+                    await channel.send(embed=(await build_starboard_embed(message)))
+                except discord.errors.Forbidden:
+                    pass
 
 
 category_info = {'name': 'Starboard'}
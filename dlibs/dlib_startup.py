@@ -3,7 +3,7 @@
 
 import importlib
 
-import discord, time, asyncio
+import discord
 
 import lib_db_obfuscator
 
@@ -11,29 +11,15 @@ importlib.reload(lib_db_obfuscator)
 import lib_loaders
 
 importlib.reload(lib_loaders)
-import lib_compatibility
+import lib_mutescheduler
 
-importlib.reload(lib_compatibility)
+importlib.reload(lib_mutescheduler)
 
 from lib_db_obfuscator import db_hlapi
-from lib_loaders import inc_statistics_better, datetime_now
-from lib_compatibility import to_snowflake
+from lib_loaders import inc_statistics_better
+from lib_mutescheduler import get_mute_scheduler
 
-from typing import Dict, Callable, Any, List, Tuple
-
-
-async def attempt_unmute(Client: discord.Client, mute_entry: Tuple[str, str, str, int]) -> None:
-
-    with db_hlapi(int(mute_entry[0])) as db:
-        db.unmute_user(infractionid=mute_entry[1])
-        mute_role_id = db.grab_config("mute-role")
-
-    if (guild := Client.get_guild(int(mute_entry[0]))) and mute_role_id:
-        if (user := guild.get_member(int(mute_entry[2]))) and (mute_role := guild.get_role(int(mute_role_id))):
-            try:
-                await user.remove_roles(to_snowflake(mute_role))
-            except discord.errors.Forbidden:
-                pass
+from typing import Dict, Callable, Any
 
 
 async def on_ready(**kargs: Any) -> None:
@@ -47,35 +33,8 @@ async def on_ready(**kargs: Any) -> None:
     if Client.user and not Client.user.bot:
         print("WARNING: The connected account is not a bot, as it is against ToS we do not condone user botting")
 
-    # bot start time check to not reparse timers on network disconnect
-    if kargs["bot_start"] > (time.time() - 10):
-
-        with db_hlapi(None) as db:
-            mutes: List[Tuple[str, str, str, int]] = db.fetch_all_mutes()
-            lost_mutes = sorted(mutes, key=lambda a: a[3])
-
-        ts = datetime_now().timestamp()
-
-        lost_mute_timers = [i for i in lost_mutes if 0 != i[3]]
-
-        if lost_mute_timers:
-
-            print(f"Lost mutes: {len(lost_mute_timers)}")
-            for i in lost_mute_timers:
-                if i[3] < ts:
-                    await attempt_unmute(Client, i)
-
-            lost_mute_timers = [i for i in lost_mute_timers if i[3] >= ts]
-            if lost_mute_timers:
-                print(f"Mute timers to recover: {len(lost_mute_timers)}\nThis process will end in {round(lost_mutes[-1][3]-time.time())} seconds")
-
-                for i in lost_mute_timers:
-                    await asyncio.sleep(i[3] - datetime_now().timestamp())
-                    with db_hlapi(int(i[0])) as db:
-                        if db.is_muted(infractionid=i[1]):
-                            await attempt_unmute(Client, i)
-
-            print("Mutes recovered")
+    # The scheduler recovers mutes from the database on start, and keeps running over network disconnects
+    get_mute_scheduler(Client, kargs["kernel_ramfs"]).start()
 
 
 async def on_guild_join(guild: discord.Guild, **kargs: Any) -> None:
@@ -10,7 +10,7 @@ from typing import Any, Dict, List, Optional, Union
 
 import lib_lexdpyk_h as lexdpyk
 from lib_compatibility import (discord_datetime_now, has_default_avatar, user_avatar_url, to_snowflake)
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import async_db_hlapi
 from lib_loaders import (datetime_now, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
 from lib_parsers import parse_boolean_strict
 from lib_sonnetconfig import AUTOMOD_ENABLED
@@ -85,9 +85,8 @@ async def notify_problem(member: discord.Member, ptype: List[str], log: str, cli
         await catch_logging_error(channel, notify_embed)
 
 
-async def try_mute_on_rejoin(member: discord.Member, db: db_hlapi, client: discord.Client, log: str, ramfs: lexdpyk.ram_filesystem) -> None:
+async def try_mute_on_rejoin(member: discord.Member, mute_role_id: Optional[str], client: discord.Client, log: str, ramfs: lexdpyk.ram_filesystem) -> None:
 
-    mute_role_id = db.grab_config("mute-role")
     if mute_role_id and (mute_role := member.guild.get_role(int(mute_role_id))):
 
         success: bool
@@ -156,9 +155,12 @@ async def on_member_join(member: discord.Member, **kargs: Any) -> None:
         if isinstance(logging_channel, discord.TextChannel):
             asyncio.create_task(catch_logging_error(logging_channel, embed))
 
-    with db_hlapi(member.guild.id) as db:
-        if db.is_muted(userid=member.id):
-            await try_mute_on_rejoin(member, db, client, notifier_cache["regex-notifier-log"], ramfs)
+    async with async_db_hlapi(member.guild.id) as db:
+        muted = await db.is_muted(userid=member.id)
+        mute_role_id = await db.grab_config("mute-role") if muted else None
+
+    if muted:
+        await try_mute_on_rejoin(member, mute_role_id, client, notifier_cache["regex-notifier-log"], ramfs)
 
 
 # Handles member leave logging
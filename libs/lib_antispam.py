@@ -0,0 +1,183 @@
+# Antispam message window storage
+# Keeps a fixed size ring buffer of recent messages per user, shared by every antispam scan
+# Ultrabear 2022
+
+from array import array
+from collections import OrderedDict
+
+import lib_lexdpyk_h as lexdpyk
+
+from typing import Dict, List, Sequence, Tuple, cast
+
+__all__ = [
+    "UserWindow",
+    "AntispamStore",
+    "load_antispam_store",
+    ]
+
+# A users window starts with room for this many messages and doubles as needed up to _MAX_MESSAGES
+_START_MESSAGES = 8
+# No scan can count more messages than this, which bounds the memory of one user
+_MAX_MESSAGES = 256
+
+
+class UserWindow:
+    """
+    The recent messages of one user, stored as (timestamp millis, char count) in two array backed ring buffers
+
+    Every message gets a sequence number, message n lives at index n % capacity
+    Each scan keeps the sequence number of its oldest message within its lifetime and a running char count sum of its messages,
+    so pushing a message costs O(scans + messages that expired) and never rebuilds the buffer
+    """
+
+    __slots__ = "_times", "_chars", "_first", "_next", "_tails", "_sums"
+
+    def __init__(self, scans: int) -> None:
+        self._times = array("q", bytes(8 * _START_MESSAGES))
+        self._chars = array("q", bytes(8 * _START_MESSAGES))
+        # Sequence numbers of the oldest stored message and the next message
+        self._first = 0
+        self._next = 0
+        # Per scan, sequence number of the oldest message within its lifetime and sum of char counts from there
+        self._tails = [0] * scans
+        self._sums = [0] * scans
+
+    def __len__(self) -> int:
+        return self._next - self._first
+
+    @property
+    def newest(self) -> int:
+        """
+        The timestamp of the most recent message, or 0 if there are none
+        """
+        if self._next == self._first:
+            return 0
+
+        return self._times[(self._next - 1) % len(self._times)]
+
+    def _grow(self) -> None:
+        cap = len(self._times)
+
+        # Rebuild in sequence order so message n lands at index n % (cap * 2)
+        times = array("q", bytes(16 * cap))
+        chars = array("q", bytes(16 * cap))
+        for seq in range(self._first, self._next):
+            times[seq % (cap * 2)] = self._times[seq % cap]
+            chars[seq % (cap * 2)] = self._chars[seq % cap]
+
+        self._times = times
+        self._chars = chars
+
+    def _drop_oldest(self) -> None:
+        cap = len(self._times)
+
+        for i, tail in enumerate(self._tails):
+            if tail == self._first:
+                self._sums[i] -= self._chars[tail % cap]
+                self._tails[i] += 1
+
+        self._first += 1
+
+    def push(self, timestamp_millis: int, char_count: int, droptimes: Sequence[int]) -> List[Tuple[int, int]]:
+        """
+        Adds a message and expires every message that is at or before the droptime of each scan
+
+        :returns: List[Tuple[int, int]] - Per scan, the amount of messages and total char count within its lifetime
+        """
+        if len(self) == len(self._times):
+            if len(self._times) < _MAX_MESSAGES:
+                self._grow()
+            else:
+                self._drop_oldest()
+
+        cap = len(self._times)
+
+        self._times[self._next % cap] = timestamp_millis
+        self._chars[self._next % cap] = char_count
+        self._next += 1
+
+        out: List[Tuple[int, int]] = []
+
+        for i, droptime in enumerate(droptimes):
+            tail = self._tails[i]
+            total = self._sums[i] + char_count
+
+            while tail < self._next and self._times[tail % cap] <= droptime:
+                total -= self._chars[tail % cap]
+                tail += 1
+
+            self._tails[i] = tail
+            self._sums[i] = total
+            out.append((self._next - tail, total))
+
+        # Nothing older than the longest lifetime is needed anymore
+        self._first = min(self._tails)
+
+        return out
+
+    def export(self) -> List[Tuple[int, int]]:
+        """
+        Returns all stored messages as (timestamp millis, char count), oldest first
+        """
+        cap = len(self._times)
+        return [(self._times[seq % cap], self._chars[seq % cap]) for seq in range(self._first, self._next)]
+
+
+class AntispamStore:
+    """
+    The antispam windows of every user in a guild
+
+    Users are kept in least recently active order, so users whose messages have all expired are evicted
+    from the front as other users send messages, bounding memory to users active within the longest lifetime
+    """
+
+    __slots__ = "scans", "_users"
+
+    def __init__(self, scans: int = 2) -> None:
+        self.scans = scans
+        self._users: "OrderedDict[int, UserWindow]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def push(self, user_id: int, timestamp_millis: int, char_count: int, droptimes: Sequence[int]) -> List[Tuple[int, int]]:
+        """
+        Adds a users message and runs every scan over their window in one pass
+
+        :returns: List[Tuple[int, int]] - Per scan, the amount of messages and total char count within its lifetime
+        """
+        try:
+            window = self._users[user_id]
+            self._users.move_to_end(user_id)
+        except KeyError:
+            window = self._users[user_id] = UserWindow(self.scans)
+
+        result = window.push(timestamp_millis, char_count, droptimes)
+
+        # Evict idle users, nothing they sent is within the longest lifetime anymore
+        oldest = min(droptimes)
+        while self._users:
+            idle_id, idle = next(iter(self._users.items()))
+            if idle_id == user_id or idle.newest > oldest:
+                break
+            del self._users[idle_id]
+
+        return result
+
+    def export(self) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Returns a json safe export of every stored users messages as (timestamp millis, char count)
+        """
+        return {str(user_id): window.export() for user_id, window in self._users.items()}
+
+
+def load_antispam_store(guild_id: int, ramfs: lexdpyk.ram_filesystem) -> AntispamStore:
+    """
+    Grabs a guilds antispam store from the ramfs, creating it if it does not exist
+
+    :returns: AntispamStore - The guilds antispam store
+    """
+    try:
+        return cast(AntispamStore, ramfs.read_f(dirlist=[str(guild_id), "antispam"]))
+    except FileNotFoundError:
+        return ramfs.create_f(dirlist=[str(guild_id), "antispam"], f_type=AntispamStore)
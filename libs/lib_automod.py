@@ -0,0 +1,338 @@
+# Compiled automod blacklist matching
+# Builds every blacklist of a guild into one matcher so a message is scanned in a single pass
+# Ultrabear 2022
+
+from __future__ import annotations
+
+import importlib
+from collections import OrderedDict, deque
+
+from lib_sonnetconfig import REGEX_VERSION
+
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Any
+
+# Import re here to trick type checker into using re stubs even if importlib grabs re2, they (should) have the same stubs
+import re
+
+# Place this in the globals scope by hand to avoid pyflakes saying its a redefinition
+globals()["re"] = importlib.import_module(REGEX_VERSION)
+
+__all__ = [
+    "AhoCorasick",
+    "SuffixMatcher",
+    "BlacklistMatcher",
+    ]
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton, finds every pattern that occurs in a text in one pass over the text
+
+    The automaton is stored as a deterministic transition table, so scanning is a single dict lookup per character
+    """
+    __slots__ = "_delta", "_out", "patterns"
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns: Tuple[str, ...] = tuple(patterns)
+
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+
+        # Build trie
+        for idx, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(idx)
+
+        # Resolve failure links breadth first and fold them into the transition table
+        fail: List[int] = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        delta[0] = dict(goto[0])
+        queue: Deque[int] = deque(goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                fail[nxt] = delta[fail[state]].get(char, 0)
+                out[nxt].extend(out[fail[nxt]])
+            if state != 0:
+                delta[state] = {**delta[fail[state]], **goto[state]}
+
+        self._delta = delta
+        self._out: List[Tuple[int, ...]] = [tuple(i) for i in out]
+
+    def search(self, text: str) -> List[int]:
+        """
+        Searches text for all patterns
+
+        :returns: List[int] -- Sorted indexes of every pattern that occurs at least once in text
+        """
+        delta = self._delta
+        out = self._out
+        found: set[int] = set()
+        state = 0
+
+        for char in text:
+            state = delta[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+
+        return sorted(found)
+
+
+class SuffixMatcher:
+    """
+    A trie of reversed patterns, finds every pattern that a string ends with in O(longest pattern)
+    """
+    __slots__ = "_trie", "patterns"
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns: Tuple[str, ...] = tuple(patterns)
+
+        # Each node is (children, terminating pattern indexes)
+        self._trie: Tuple[Dict[str, Any], List[int]] = ({}, [])
+
+        for idx, pattern in enumerate(self.patterns):
+            node = self._trie
+            for char in reversed(pattern):
+                node = node[0].setdefault(char, ({}, []))
+            node[1].append(idx)
+
+    def search(self, text: str) -> List[int]:
+        """
+        Searches for all patterns that text ends with
+
+        :returns: List[int] -- Sorted indexes of every pattern that is a suffix of text
+        """
+        node = self._trie
+        found: List[int] = list(node[1])
+
+        for char in reversed(text):
+            nxt = node[0].get(char)
+            if nxt is None:
+                break
+            node = nxt
+            found.extend(node[1])
+
+        return sorted(found)
+
+
+# Amount of clean message ids a matcher remembers, edits of older messages are fully rescanned
+_MAX_CLEAN = 4096
+
+
+def _changed_region(old: str, new: str) -> Tuple[int, int]:
+    """
+    Finds the region of new that differs from old, after removing their common prefix and suffix
+
+    :returns: Tuple[int, int] -- The start and end index of the changed region in new
+    """
+    limit = min(len(old), len(new))
+
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    return prefix, len(new) - suffix
+
+
+def _formatregexfind(gex: List[Any]) -> str:
+    return ", ".join(i if isinstance(i, str) else "".join(i) for i in gex)
+
+
+def _build_regex_set(patterns: Sequence["re.Pattern[str]"]) -> Optional[Any]:
+    """
+    Builds a combined RE2 Set out of a list of compiled patterns, this can only be done when running under re2
+
+    :returns: Optional[re2.Set] -- The compiled set, or None if it could not be built
+    """
+    if not patterns or not hasattr(re, "Set"):
+        return None
+
+    try:
+        regex_set = re.Set.SearchSet()
+        for i in patterns:
+            regex_set.Add(i.pattern)
+        regex_set.Compile()
+    except re.error:
+        return None
+
+    return regex_set
+
+
+class BlacklistMatcher:
+    """
+    A precompiled form of a guilds blacklists, built once per cache generation and reused for every message
+
+    Word blacklists are hashed, word-in-word blacklists use an Aho-Corasick automaton,
+    filetype blacklists use a suffix trie, and regex lists are combined into a single RE2 Set when re2 is in use
+    """
+    __slots__ = "words", "word_in_word", "filetypes", "regex_blacklist", "regex_notifier", "url", "_regex_set", "_notifier_set", "_word_in_word_len", "_clean"
+
+    def __init__(
+        self,
+        word_blacklist: Iterable[str],
+        word_in_word_blacklist: Sequence[str],
+        filetype_blacklist: Sequence[str],
+        regex_blacklist: Sequence["re.Pattern[str]"],
+        regex_notifier: Sequence["re.Pattern[str]"],
+        url: Optional["re.Pattern[str]"],
+        ) -> None:
+
+        self.words = frozenset(word_blacklist)
+        self.word_in_word = AhoCorasick(word_in_word_blacklist)
+        self.filetypes = SuffixMatcher(filetype_blacklist)
+        self.regex_blacklist: Tuple["re.Pattern[str]", ...] = tuple(regex_blacklist)
+        self.regex_notifier: Tuple["re.Pattern[str]", ...] = tuple(regex_notifier)
+        self.url = url
+        self._regex_set = _build_regex_set(self.regex_blacklist)
+        self._notifier_set = _build_regex_set(self.regex_notifier)
+        self._word_in_word_len = max((len(i) for i in self.word_in_word.patterns), default=0)
+        # Ids of messages this matcher scanned and found clean, oldest first
+        self._clean: "OrderedDict[int, None]" = OrderedDict()
+
+    def match_words(self, text: str) -> List[str]:
+        """
+        Matches a filtered space separated text against the word blacklist
+        """
+        if not self.words:
+            return []
+
+        return [f"Word({i})" for i in text.split(" ") if i in self.words]
+
+    def match_word_in_word(self, compact_text: str) -> List[str]:
+        """
+        Matches a filtered text with spaces removed against the word in word blacklist
+        """
+        patterns = self.word_in_word.patterns
+
+        if not patterns:
+            return []
+
+        return [f"WordInWord({patterns[i]})" for i in self.word_in_word.search(compact_text)]
+
+    def match_regex(self, content: str) -> List[str]:
+        """
+        Matches lowercased message content against the regex blacklist
+        """
+        if not self.regex_blacklist:
+            return []
+
+        candidates: Iterable["re.Pattern[str]"]
+        if self._regex_set is not None:
+            if (hits := self._regex_set.Match(content)) is None:
+                return []
+            candidates = [self.regex_blacklist[i] for i in sorted(hits)]
+        else:
+            candidates = self.regex_blacklist
+
+        out: List[str] = []
+        for r in candidates:
+            try:
+                if broke := r.findall(content):
+                    out.append(f"RegEx({_formatregexfind(broke)})")
+            except re.error:
+                pass  # GC for old regex
+
+        return out
+
+    def match_notifier(self, content: str) -> bool:
+        """
+        Matches lowercased message content against the regex notifier list
+        """
+        if self._notifier_set is not None:
+            return self._notifier_set.Match(content) is not None
+
+        return any(r.findall(content) for r in self.regex_notifier)
+
+    def match_filetypes(self, filenames: Iterable[str]) -> List[str]:
+        """
+        Matches lowercased filenames against the filetype blacklist
+        """
+        patterns = self.filetypes.patterns
+
+        if not patterns:
+            return []
+
+        return [f"FileType({patterns[i]})" for name in filenames for i in self.filetypes.search(name)]
+
+    def match_url(self, content: str) -> List[str]:
+        """
+        Matches lowercased message content against the url blacklist
+        """
+        if self.url is not None and (broke := self.url.findall(content)):
+            return [f"URL({_formatregexfind(broke)})"]
+
+        return []
+
+    def scan(self, text: str, content: str, filenames: Iterable[str]) -> Tuple[bool, bool, List[str]]:
+        """
+        Runs every blacklist over a message
+
+        :returns: Tuple[bool, bool, List[str]] -- broke blacklist, broke notifier list, list of strings of infraction messages
+        """
+        infraction_type = self.match_words(text)
+        infraction_type.extend(self.match_word_in_word(text.replace(" ", "")))
+        infraction_type.extend(self.match_regex(content))
+        notifier = self.match_notifier(content)
+        infraction_type.extend(self.match_filetypes(filenames))
+        infraction_type.extend(self.match_url(content))
+
+        return bool(infraction_type), notifier, infraction_type
+
+    def mark_clean(self, message_id: int) -> None:
+        """
+        Records that a messages current content was scanned by this matcher and broke nothing, so an edit may use scan_edit
+        """
+        self._clean[message_id] = None
+        self._clean.move_to_end(message_id)
+
+        if len(self._clean) > _MAX_CLEAN:
+            self._clean.popitem(last=False)
+
+    def is_clean(self, message_id: int) -> bool:
+        """
+        Whether a message was scanned clean by this matcher, see mark_clean
+        """
+        return message_id in self._clean
+
+    def scan_edit(self, old_text: str, text: str, content: str, new_filenames: Iterable[str]) -> Tuple[bool, bool, List[str]]:
+        """
+        Runs every blacklist over an edited message, where the old text was already scanned by this matcher and broke nothing (see is_clean)
+
+        The word and word in word blacklists only rescan the changed region of the text, widened to whole words
+        and to the longest word in word pattern, as any new match must overlap the change
+        Regex and url blacklists can match across any span so they rescan all of content, and only new files are rescanned
+
+        :returns: Tuple[bool, bool, List[str]] -- broke blacklist, broke notifier list, list of strings of infraction messages
+        """
+        start, end = _changed_region(old_text, text)
+        # Widen to every word touching the change
+        start = text.rfind(" ", 0, start) + 1
+        end = len(text) if (end := text.find(" ", end)) == -1 else end
+        infraction_type = self.match_words(text[start:end])
+
+        if self._word_in_word_len:
+            compact = text.replace(" ", "")
+            start, end = _changed_region(old_text.replace(" ", ""), compact)
+            widen = self._word_in_word_len - 1
+            infraction_type.extend(self.match_word_in_word(compact[max(start - widen, 0):end + widen]))
+
+        infraction_type.extend(self.match_regex(content))
+        notifier = self.match_notifier(content)
+        infraction_type.extend(self.match_filetypes(new_filenames))
+        infraction_type.extend(self.match_url(content))
+
+        return bool(infraction_type), notifier, infraction_type
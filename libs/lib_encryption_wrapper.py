@@ -3,10 +3,14 @@
 
 # This module sucks, python was not meant to do disk handling
 
+import io
+import asyncio
+import functools
+
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import hashes, hmac
 
-from typing import Generator, Union, List, Protocol, runtime_checkable
+from typing import Union, List, Optional, Protocol, runtime_checkable
 
 
 class errors:
@@ -36,8 +40,19 @@ def directBinNumber(inData: int, length: int) -> bytes:
     return bytes((inData >> (8 * i) & 0xff) for i in range(length))
 
 
+# SONNETAES files start with a magic, then a 64 byte HMAC, then blocks of (little endian length, encrypted data)
+# Version 1 uses a 2 byte length and blocks of at most 2^16-1 bytes,
+# version 2 (large blocks) uses a 4 byte length and blocks of up to 1MiB, which costs far less per block overhead on large files
+_MAGIC_V1 = b"SONNETAES\x01"
+_MAGIC_V2 = b"SONNETAES\x02"
+_LENSIZE = {_MAGIC_V1: 2, _MAGIC_V2: 4}
+_BLOCKSIZE = {_MAGIC_V1: (2**16) - 1, _MAGIC_V2: 2**20}
+
+_Buffer = Union[bytes, bytearray, memoryview]
+
+
 class _WriteSeekCloser(Protocol):
-    def write(self, buf: bytes, /) -> int:
+    def write(self, buf: _Buffer, /) -> int:
         ...
 
     def seek(self, cookie: int, whence: int = 0, /) -> int:
@@ -54,9 +69,15 @@ class _Flushable(Protocol):
 
 
 class encrypted_writer:
-    __slots__ = "cipher", "encryptor_module", "HMACencrypt", "rawfile", "buf"
+    """
+    Encrypts data written to it to a SONNETAES file
 
-    def __init__(self, filename: Union[bytes, str, _WriteSeekCloser], key: bytes, iv: bytes) -> None:
+    Writes are buffered into full blocks, each block is encrypted in place after its length header
+    so the header and payload are written with one call and without copying, pass large_blocks=True to write version 2 files
+    """
+    __slots__ = "cipher", "encryptor_module", "HMACencrypt", "rawfile", "buf", "pending", "lensize", "blocksize"
+
+    def __init__(self, filename: Union[bytes, str, _WriteSeekCloser], key: bytes, iv: bytes, *, large_blocks: bool = False) -> None:
 
         # Start cipher system
         self.cipher = Cipher(algorithms.AES(key), modes.CTR(iv))
@@ -65,53 +86,66 @@ class encrypted_writer:
         # Initialize HMAC generator
         self.HMACencrypt = hmac.HMAC(key, hashes.SHA512())
 
-        # Open rawfile and write headers
+        magic = _MAGIC_V2 if large_blocks else _MAGIC_V1
+        self.lensize = _LENSIZE[magic]
+        self.blocksize = _BLOCKSIZE[magic]
+
+        # Open rawfile and write headers, the HMAC is filled in on finalize
         if isinstance(filename, (bytes, str)):
             self.rawfile: _WriteSeekCloser = open(filename, "wb+")
         else:
             self.rawfile = filename
-        self.rawfile.write(b"SONNETAES\x01")
-        self.rawfile.write(bytes(64))
+        self.rawfile.write(magic + bytes(64))
 
-        # Initialize writable buffer
-        self.buf = bytearray(2**16 + 256)
+        # Plaintext waiting for a full block
+        self.pending = bytearray()
+        # Length header followed by encrypted block, with room for the cipher to overshoot
+        self.buf = bytearray(self.lensize + self.blocksize + 256)
 
-    def _generate_chunks(self, data: bytes) -> Generator[memoryview, None, None]:
+    def write(self, data: _Buffer) -> None:
 
-        # Init mem map
-        raw_data = memoryview(data)
+        view = memoryview(data).cast("B")
 
-        # Yield data in chunks
-        for i in range(0, len(data), ((2**16) - 1)):
-            yield raw_data[i:i + ((2**16) - 1)]
+        # Top up a partial block first
+        if self.pending:
+            take = self.blocksize - len(self.pending)
+            self.pending += view[:take]
+            view = view[take:]
 
-    def write(self, data: bytes) -> None:
+            if len(self.pending) < self.blocksize:
+                return
 
-        # Write a maximum of 2^16-1 blocksize
-        if len(data) > ((2**16) - 1):
-            for chunk in self._generate_chunks(data):
-                self._write_data(chunk)
-        elif data:
+            self._write_data(self.pending)
+            self.pending.clear()
 
-            self._write_data(data)
+        # Full blocks are encrypted straight from the callers buffer
+        while len(view) >= self.blocksize:
+            self._write_data(view[:self.blocksize])
+            view = view[self.blocksize:]
 
-    def _write_data(self, unencrypted: Union[memoryview, bytes]) -> None:
+        self.pending += view
+
+    def _write_data(self, unencrypted: _Buffer) -> None:
 
-        # Write length of data to file
         dlen = len(unencrypted)
-        self.rawfile.write(directBinNumber(dlen, 2))
+        lensize = self.lensize
 
-        # Encrypt
-        self.encryptor_module.update_into(unencrypted, self.buf)
+        # Write length and encrypt after it
+        self.buf[:lensize] = dlen.to_bytes(lensize, "little")
         memptr = memoryview(self.buf)
+        self.encryptor_module.update_into(unencrypted, memptr[lensize:])
 
-        # for some reason we can't pass a memoryview to rawfile, oh well
-        self.rawfile.write(bytes(self.buf[:dlen]))
         # Update HMAC
-        self.HMACencrypt.update(memptr[:dlen])
+        self.HMACencrypt.update(memptr[lensize:lensize + dlen])
+
+        self.rawfile.write(memptr[:lensize + dlen])
 
     def finalize(self) -> None:
 
+        if self.pending:
+            self._write_data(self.pending)
+            self.pending.clear()
+
         # Finalize HMAC
         encrypted_HMAC = self.HMACencrypt.finalize()
 
@@ -123,6 +157,10 @@ class encrypted_writer:
         self.encryptor_module.finalize()
 
     def flush(self) -> None:
+        if self.pending:
+            self._write_data(self.pending)
+            self.pending.clear()
+
         if isinstance(self.rawfile, _Flushable):
             self.rawfile.flush()
 
@@ -151,9 +189,27 @@ class _ReadSeekCloser(Protocol):
 
 
 class encrypted_reader:
-    __slots__ = "rawfile", "cipher", "decryptor_module", "pointer", "cache"
+    """
+    Decrypts a SONNETAES file as it is read
+
+    The HMAC is verified block by block when opening, then data is decrypted one block at a time as it is read,
+    so memory use is bounded by the block size no matter the file size
+    Seeking backwards rewinds to the start of the file and decrypts forward again, as AES-CTR keystream position follows the data
+
+    From async code use `await encrypted_reader.open()` and `await reader.read_all()`, which do the crypto work in an executor
+    (cryptography releases the GIL for it) so the event loop is never blocked on large files
+    """
+    __slots__ = "rawfile", "cipher", "decryptor_module", "pointer", "block", "blockpos", "lensize", "_hmac", "_checksum"
 
-    def __init__(self, filename: Union[bytes, str, _ReadSeekCloser], key: bytes, iv: bytes) -> None:
+    def __init__(self, filename: Union[bytes, str, _ReadSeekCloser], key: bytes, iv: bytes, *, verify: bool = True) -> None:
+        """
+        Opens a SONNETAES file, verifying its HMAC unless verify is False
+
+        An unverified reader may only be read with read_all(), which verifies the HMAC in the same pass as decrypting
+
+        :raises: errors.NotSonnetAESError - The file is not a SONNETAES file
+        :raises: errors.HMACInvalidError - The HMAC does not match the file contents
+        """
 
         # Open rawfile
         if isinstance(filename, (bytes, str)):
@@ -163,88 +219,168 @@ class encrypted_reader:
 
         # Make decryptor instance
         self.cipher = Cipher(algorithms.AES(key), modes.CTR(iv))
-        self.decryptor_module = self.cipher.decryptor()
 
         # Generate HMAC
         HMACobj = hmac.HMAC(key, hashes.SHA512())
 
         # Check if file is valid SONNETAES
-        if self.rawfile.read(10) == b"SONNETAES\x01":
+        if (magic := self.rawfile.read(10)) in _LENSIZE:
+            self.lensize = _LENSIZE[magic]
             checksum = self.rawfile.read(64)
         else:
             self.rawfile.close()
             raise errors.NotSonnetAESError("The file requested is not a SONNETAES file")
 
-        # Calculate HMAC of encrypted field
-        while a := self.rawfile.read(2):
-            HMACobj.update(self.rawfile.read(int.from_bytes(a, "little")))
+        self._hmac: Optional[hmac.HMAC] = None
+        self._checksum = checksum
+
+        if verify:
+            # Calculate HMAC of encrypted field
+            while a := self.rawfile.read(self.lensize):
+                HMACobj.update(self.rawfile.read(int.from_bytes(a, "little")))
+
+            if not HMACobj.finalize() == checksum:
+                self.rawfile.close()
+                raise errors.HMACInvalidError("The encrypted contents does not match the HMAC")
+        else:
+            # Verified by read_all
+            self._hmac = HMACobj
+
+        self._rewind()
+
+    @classmethod
+    async def open(cls, filename: Union[bytes, str, _ReadSeekCloser], key: bytes, iv: bytes, *, verify: bool = True) -> "encrypted_reader":
+        """
+        Opens a SONNETAES file from an executor, see __init__
+
+        :returns: encrypted_reader - The opened reader
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(cls, filename, key, iv, verify=verify))
+
+    def _read_all(self) -> bytes:
+
+        if self._hmac is None:
+            self.seek(0)
+            return self.read()
+
+        # Unverified, so HMAC and decrypt each block in one pass and only return data if it all matches
+        self._rewind()
 
-        if not HMACobj.finalize() == checksum:
+        HMACobj, self._hmac = self._hmac, None
+        datamap: List[bytes] = []
+
+        while a := self.rawfile.read(self.lensize):
+            encrypted = self.rawfile.read(int.from_bytes(a, "little"))
+            HMACobj.update(encrypted)
+            datamap.append(self.decryptor_module.update(encrypted))
+
+        if not HMACobj.finalize() == self._checksum:
             raise errors.HMACInvalidError("The encrypted contents does not match the HMAC")
 
-        # Seek to start of file after checking HMAC
+        returndata = b"".join(datamap)
+        self.pointer = len(returndata)
+
+        return returndata
+
+    async def read_all(self) -> bytes:
+        """
+        Reads the whole file from an executor, verifying the HMAC in the same pass if the reader was opened with verify=False
+
+        :returns: bytes - The decrypted file
+        :raises: errors.HMACInvalidError - The HMAC does not match the file contents
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_all)
+
+    def _rewind(self) -> None:
+
+        # Seek to start of data and restart the keystream
         self.rawfile.seek(10 + 64)
+        self.decryptor_module = self.cipher.decryptor()
         self.pointer = 0
-        self.cache = bytearray()
-
-    def _grab_amount(self, amount: int) -> bytes:
+        # Current decrypted block and read position in it
+        self.block = b""
+        self.blockpos = 0
 
-        return self.decryptor_module.update(self.rawfile.read(amount))
+    def _next_block(self) -> bool:
 
-    def _read_exact(self, amount_wanted: int) -> bytes:
+        if self._hmac is not None:
+            raise errors.HMACInvalidError("The reader was opened without verification, only read_all() may read it")
 
-        if amount_wanted == 0:
-            return b""
+        if not (a := self.rawfile.read(self.lensize)):
+            return False
 
-        # Read till EOF
-        eof_reached = False
-        while len(self.cache) < self.pointer + amount_wanted and not eof_reached:
-            read_amount = int.from_bytes(self.rawfile.read(2), "little")
-            if read_amount:
-                self.cache.extend(self._grab_amount(read_amount))
-            else:
-                eof_reached = True
+        self.block = self.decryptor_module.update(self.rawfile.read(int.from_bytes(a, "little")))
+        self.blockpos = 0
 
-        return bytes(memoryview(self.cache)[self.pointer:amount_wanted + self.pointer])
+        return True
 
     def read(self, size: int = -1) -> bytes:
 
-        if size == -1:
-            if self.pointer == 0:
-                # Return entire file if pointer is at 0
-                datamap: List[bytes] = []
-                while a := self.rawfile.read(2):
-                    datamap.append(self._grab_amount(int.from_bytes(a, "little")))
-                return b"".join(datamap)
+        datamap: List[bytes] = []
+        remaining = size
+
+        while remaining != 0:
+
+            if self.blockpos >= len(self.block) and not self._next_block():
+                break
+
+            if remaining < 0:
+                chunk = self.block[self.blockpos:]
             else:
-                # Return remainder of data
-                while a := self.rawfile.read(2):
-                    self.cache.extend((self._grab_amount(int.from_bytes(a, "little"))))
-                return bytes(memoryview(self.cache)[self.pointer:])
-        else:
+                chunk = self.block[self.blockpos:self.blockpos + remaining]
+                remaining -= len(chunk)
+
+            self.blockpos += len(chunk)
+            datamap.append(chunk)
+
+        returndata = b"".join(datamap)
+        self.pointer += len(returndata)
+
+        return returndata
+
+    def peek(self, size: int = 1) -> bytes:
 
-            returndata = self._read_exact(size)
-            self.pointer += size
+        if self.blockpos >= len(self.block):
+            self._next_block()
 
-            return returndata
+        # Like io.BufferedReader.peek, this returns what is buffered and may be shorter than size
+        return self.block[self.blockpos:self.blockpos + max(size, 1)]
 
-    def peek(self, size: int) -> bytes:
+    def seek(self, seekloc: int, whence: int = io.SEEK_SET) -> int:
 
-        return self._read_exact(size)
+        if whence == io.SEEK_CUR:
+            seekloc += self.pointer
+        elif whence == io.SEEK_END:
+            # The plaintext length is only known by decrypting to the end
+            while self.read(2**16):
+                pass
+            seekloc += self.pointer
 
-    def seek(self, seekloc: int) -> int:
+        if seekloc < self.pointer:
+            self._rewind()
 
-        self.pointer = seekloc
-        return int(self.pointer)
+        # Decrypt forward to the target, skipping whole blocks where possible
+        while self.pointer < max(seekloc, 0) and self.read(min(seekloc - self.pointer, 2**16)):
+            pass
+
+        return self.pointer
+
+    def tell(self) -> int:
+
+        return self.pointer
 
     def seekable(self) -> bool:
 
         return True
 
+    def readable(self) -> bool:
+
+        return True
+
     def close(self) -> None:
 
         self.rawfile.close()
-        del self.cache
+        self.block = b""
 
     def write(self, data: bytes) -> None:
         raise TypeError(f"{self} object does not allow writing")
@@ -0,0 +1,234 @@
+# Message attachment logging
+# Streams attachments to the encrypted disk cache from a bounded worker pool, under a global disk budget
+# Ultrabear 2022
+
+import asyncio
+import functools
+import hashlib
+import os
+import time
+import traceback
+from collections import OrderedDict
+
+import aiohttp
+import discord
+import lz4.frame
+
+from lib_encryption_wrapper import encrypted_writer
+from lib_sonnetconfig import FILELOG_MAX_BYTES, FILELOG_WORKERS
+import lib_lexdpyk_h as lexdpyk
+
+from typing import List, NamedTuple, Optional, Set, cast
+
+__all__ = [
+    "FileLog",
+    "get_filelog",
+    ]
+
+# Keep message files in cache for 60 minutes, or 1 hour
+# This was previously 30 minutes as it was seen as an average response time,
+# but has been raised to account for some edge case poor response times from moderators
+# This did not show significant disk use at 30 minutes, so double that time should be fine
+_LIFETIME = 60 * 60
+# Seconds between sweeps for expired files
+_SWEEP_INTERVAL = 60
+# Attachments are streamed in chunks of this size, so a download never holds a whole file in memory
+_CHUNK_SIZE = 64 * 1024
+# Attachments waiting for a worker past this are not logged
+_MAX_QUEUED = 1024
+
+
+class _Entry(NamedTuple):
+    ramfs_path: str
+    size: int
+    expires: float
+
+
+class _Job(NamedTuple):
+    url: str
+    size: int
+    file_loc: str
+    ramfs_path: str
+    key: bytes
+    iv: bytes
+
+
+class FileLog:
+    """
+    Logs message attachments to the encrypted disk cache for FILELOG_MAX_BYTES total
+
+    Attachments are streamed to disk by FILELOG_WORKERS workers, when the budget is full the oldest logged files are evicted,
+    and one sweeper task deletes files after they expire instead of a sleeping task per file
+    Files are found by grab_files through the kernel ramfs as before, so readers do not change
+    """
+    __slots__ = "kernel_ramfs", "budget", "used", "_entries", "_pending", "_queue", "_tasks"
+
+    def __init__(self, kernel_ramfs: lexdpyk.ram_filesystem, budget: int = FILELOG_MAX_BYTES) -> None:
+        self.kernel_ramfs = kernel_ramfs
+        self.budget = budget
+        # Bytes reserved by logged and downloading files
+        self.used = 0
+        # file_loc -> entry, oldest first
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # file_locs that are queued or downloading, so they may not exist on disk yet
+        self._pending: Set[str] = set()
+        self._queue: "Optional[asyncio.Queue[_Job]]" = None
+        self._tasks: "List[asyncio.Task[None]]" = []
+
+    def _start(self) -> "asyncio.Queue[_Job]":
+
+        if self._queue is None or any(i.done() for i in self._tasks):
+            for i in self._tasks:
+                i.cancel()
+
+            self._queue = asyncio.Queue(_MAX_QUEUED)
+            self._tasks = [asyncio.create_task(self._worker(self._queue)) for _ in range(FILELOG_WORKERS)]
+            self._tasks.append(asyncio.create_task(self._sweeper()))
+
+        return self._queue
+
+    def submit(self, attachment: discord.Attachment, guild_id: int, message_id: int) -> bool:
+        """
+        Queues an attachment to be logged, must be called from the event loop
+
+        :returns: bool - False if the attachment was not logged because it does not fit the budget or the queue is full
+        """
+        queue = self._start()
+
+        if attachment.size > self.budget or queue.full():
+            return False
+
+        fname: bytes = attachment.filename.encode("utf8")
+
+        ramfs_path = f"{guild_id}/files/{message_id}/{hashlib.sha256(fname).hexdigest()}"
+
+        namefile = self.kernel_ramfs.create_f(f"{ramfs_path}/name")
+        namefile.write(fname)
+
+        keyfile = self.kernel_ramfs.create_f(f"{ramfs_path}/key")
+        keyfile.write(key := os.urandom(32))
+        keyfile.write(iv := os.urandom(16))
+
+        pointerfile = self.kernel_ramfs.create_f(f"{ramfs_path}/pointer")
+        pointer = hashlib.sha256(fname + key + iv).hexdigest()
+        file_loc = f"./datastore/{guild_id}-{pointer}.cache.db"
+        pointerfile.write(file_loc.encode("utf8"))
+
+        # Reserve the space now so queued downloads cannot overcommit the budget
+        self._reserve(attachment.size)
+        self._entries[file_loc] = _Entry(ramfs_path, attachment.size, time.monotonic() + _LIFETIME)
+        self._pending.add(file_loc)
+
+        queue.put_nowait(_Job(attachment.url, attachment.size, file_loc, ramfs_path, key, iv))
+
+        return True
+
+    def _reserve(self, size: int) -> None:
+        # Evict the oldest files until size fits
+        while self._entries and self.used + size > self.budget:
+            file_loc, _ = next(iter(self._entries.items()))
+            self._remove(file_loc)
+
+        self.used += size
+
+    def _remove(self, file_loc: str) -> None:
+
+        if (entry := self._entries.pop(file_loc, None)) is None:
+            return
+
+        self.used -= entry.size
+
+        try:
+            os.remove(file_loc)
+        except FileNotFoundError:
+            pass
+        try:
+            self.kernel_ramfs.rmdir(entry.ramfs_path)
+        except FileNotFoundError:
+            pass
+
+        # Drop the messages directory with its last file, or every message would leave one behind
+        message_dir = entry.ramfs_path.rsplit("/", 1)[0]
+        try:
+            files, dirs = self.kernel_ramfs.ls(message_dir)
+            if not files and not dirs:
+                self.kernel_ramfs.rmdir(message_dir)
+        except FileNotFoundError:
+            pass
+
+    async def _worker(self, queue: "asyncio.Queue[_Job]") -> None:
+
+        # Each worker owns its session, it is closed when the worker is cancelled on shutdown or restart
+        async with aiohttp.ClientSession() as session:
+            while True:
+                job = await queue.get()
+
+                try:
+                    # Skip files evicted before their download started
+                    if job.file_loc in self._entries:
+                        await self._download(session, job)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                    self._remove(job.file_loc)
+                except Exception as e:
+                    # A bug must not kill the worker, the jobs behind it would never run and keep their space reserved
+                    print(f"FileLog: failed to log {job.file_loc}: {type(e).__name__}: {e}")
+                    traceback.print_exception(type(e), e, e.__traceback__)
+                    self._remove(job.file_loc)
+                finally:
+                    self._pending.discard(job.file_loc)
+
+    async def _download(self, session: aiohttp.ClientSession, job: _Job) -> None:
+
+        # Create encryption and compression wrappers (raw -> compressed -> encrypted -> disk)
+        encryption_fileobj = encrypted_writer(job.file_loc, job.key, job.iv, large_blocks=True)
+        compression_fileobj = lz4.frame.LZ4FrameFile(filename=encryption_fileobj, mode="wb")
+
+        try:
+            async with session.get(job.url, timeout=aiohttp.ClientTimeout(total=_LIFETIME)) as resp:
+                resp.raise_for_status()
+
+                written = 0
+                async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+                    # Never write more than was reserved, the attachment size is reported by discord
+                    if (written := written + len(chunk)) > job.size:
+                        raise OSError("Attachment is larger than its reported size")
+
+                    compression_fileobj.write(chunk)
+        finally:
+            compression_fileobj.close()
+            encryption_fileobj.close()
+
+        # The file was evicted while it was downloading
+        if job.file_loc not in self._entries:
+            try:
+                os.remove(job.file_loc)
+            except FileNotFoundError:
+                pass
+
+    async def _sweeper(self) -> None:
+
+        while True:
+            await asyncio.sleep(_SWEEP_INTERVAL)
+
+            now = time.monotonic()
+
+            # Entries are in insertion order, and lifetimes are equal, so expired files are at the front
+            while self._entries and next(iter(self._entries.values())).expires <= now:
+                self._remove(next(iter(self._entries)))
+
+            # Files read with grab_files(delete=True) are removed from disk without telling us, release their space
+            for file_loc in list(self._entries):
+                if file_loc not in self._pending and not os.path.exists(file_loc):
+                    self._remove(file_loc)
+
+
+def get_filelog(kernel_ramfs: lexdpyk.ram_filesystem) -> FileLog:
+    """
+    Grabs the attachment logger from the kernel ramfs, creating it if it does not exist
+
+    :returns: FileLog - The attachment logger
+    """
+    try:
+        return cast(FileLog, kernel_ramfs.read_f(dirlist=["global", "filelog"]))
+    except FileNotFoundError:
+        return kernel_ramfs.create_f(dirlist=["global", "filelog"], f_type=functools.partial(FileLog, kernel_ramfs))
@@ -1,6 +1,7 @@
 # Headers for the kernel ramfs
 
 import io
+import functools
 import discord
 from dataclasses import dataclass
 
@@ -86,6 +87,7 @@ def ToKernelArgs(f: _FuncType) -> _FuncType:
     """
     A decorator to convert kwargs to KernelArgs for a kernel event handler
     """
+    @functools.wraps(f)
     def newfunc(*args: Any, **kwargs: Any) -> Coroutine[Any, Any, Any]:
         nargs = (*args, KernelArgs(**kwargs))
         return f(*nargs)
@@ -5,7 +5,7 @@ from __future__ import annotations
 
 import discord
 
-import random, ctypes, time, io, json, pickle, threading, warnings
+import random, ctypes, time, io, json, threading, warnings, functools
 import datetime
 import subprocess
 
@@ -14,7 +14,7 @@ from lib_db_obfuscator import db_hlapi
 from lib_sonnetconfig import CLIB_LOAD, GLOBAL_PREFIX, BLACKLIST_ACTION, STATELESS
 from lib_datetimeplus import Time
 
-from typing import Any, Tuple, Optional, Union, cast, Type, Dict, Protocol, Final, Literal
+from typing import Any, Tuple, Optional, Union, cast, Type, Dict, Protocol, Final, Literal, NoReturn
 import lib_lexdpyk_h as lexdpyk
 
 
@@ -94,121 +94,90 @@ def write_vnum(fileobj: Writer, number: int) -> None:
     fileobj.write(bytes(directBinNumber(number, vnum_count)))
 
 
-def _get_cached_config(guild_id: int, ramfs: lexdpyk.ram_filesystem, datatypes: Dict[Union[str, int], Any]) -> Dict[str, Any]:
+class GuildConfig(Dict[str, Any]):
     """
-    Loads config from cache or raises FileNotFoundError on cache not existing
+    A decoded guild config as returned by load_message_config
+
+    GuildConfigs are cached in ramfs and shared between every event that loads them, so they are immutable,
+    csv values are stored as tuples, and json values must be treated as read only
+    Use .copy() to get a mutable dict
     """
-    try:
-        # Loads fileio object
-        blacklist_cache = ramfs.read_f(dirlist=[str(guild_id), "caches", str(datatypes[0])])
-    except FileNotFoundError:
-        raise
+    __slots__ = ()
+
+    def _immutable(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError("GuildConfig is immutable, use .copy() to get a mutable dict")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _immutable
 
-    assert isinstance(blacklist_cache, io.BytesIO)
-    blacklist_cache.seek(0)
+
+def _decode_config(datatypes: Dict[Union[str, int], Any], raw_config: Dict[str, Optional[str]]) -> GuildConfig:
+    """
+    Decodes raw db config values into a GuildConfig, falling back to datatype defaults for unset or empty values
+    """
     message_config: Dict[str, Any] = {}
 
-    # Imports csv style data
-    for i in datatypes["csv"]:  # csv types are List[str]
-        csvpre = blacklist_cache.read(read_vnum(blacklist_cache))
-        if csvpre:
-            message_config[i[0]] = csvpre.decode("utf8").split(",")
+    # csv types are Tuple[str, ...]
+    for i in datatypes["csv"]:
+        if (v := raw_config[i[0]]):
+            message_config[i[0]] = tuple(v.lower().split(","))
         else:
-            message_config[i[0]] = i[1].split(",") if i[1] else []
+            message_config[i[0]] = tuple(i[1].split(",")) if i[1] else ()
 
-    # Imports text style data
-    for i in datatypes["text"]:  # text types are str
-        textpre = blacklist_cache.read(read_vnum(blacklist_cache))
-        if textpre:
-            message_config[i[0]] = textpre.decode("utf8")
-        else:
-            message_config[i[0]] = i[1]
+    # text types are str
+    for i in datatypes["text"]:
+        message_config[i[0]] = raw_config[i[0]] or i[1]
 
-    # Imports JSON type data
-    for i in datatypes["json"]:  # json types are Union[Dict[str, Any], List[Any]]
-        jsonpre = blacklist_cache.read(read_vnum(blacklist_cache))
-        if jsonpre:
-            message_config[i[0]] = pickle.loads(jsonpre)
-        else:
-            message_config[i[0]] = i[1]
+    # json types are Union[Dict[str, Any], List[Any]]
+    for i in datatypes["json"]:
+        message_config[i[0]] = i[1]
+        if (v := raw_config[i[0]]):
+            try:
+                message_config[i[0]] = json.loads(v) or i[1]
+            except json.JSONDecodeError:
+                # Corrupted db objects default to defaults
+                pass
 
-    return message_config
+    return GuildConfig(message_config)
 
 
 # Load config from cache, or load from db if cache isn't existent
-def load_message_config(guild_id: int, ramfs: lexdpyk.ram_filesystem, datatypes: Optional[dict[Union[str, int], Any]] = None) -> dict[str, Any]:
+def load_message_config(guild_id: int, ramfs: lexdpyk.ram_filesystem, datatypes: Optional[dict[Union[str, int], Any]] = None) -> GuildConfig:
     """
     Load config from cache, or load from db if cache isn't existent
     will always load from db if stateless mode is enabled
+
+    The decoded config is cached in ramfs under {guild_id}/caches/{datatypes[0]},
+    so cache_sweep invalidates it the same way it did the old serialized cache
+
+    :returns: GuildConfig -- An immutable dict of config names to their values
     """
 
     datatypes = defaultcache if datatypes is None else datatypes
 
+    # Prevents cache from being loaded
+    if not STATELESS:
+        try:
+            cached = ramfs.read_f(dirlist=[str(guild_id), "caches", str(datatypes[0])])
+            # Check against dict as GuildConfig may come from a different reload of this module
+            assert isinstance(cached, dict)
+            return cast(GuildConfig, cached)
+        except FileNotFoundError:
+            pass
+
     for i in ["csv", "text", "json"]:
         if i not in datatypes:
             datatypes[i] = []
 
-    try:
-        # Prevents cache from being loaded
-        if STATELESS:
-            raise FileNotFoundError
+    # Loads base db
+    raw_config: Dict[str, Optional[str]] = {}
+    with db_hlapi(guild_id) as db:
+        for i in datatypes["csv"] + datatypes["text"] + datatypes["json"]:
+            raw_config[i[0]] = db.grab_config(i[0])
 
-        return _get_cached_config(guild_id, ramfs, datatypes)
-
-    except FileNotFoundError:
-        message_config: Dict[str, Any] = {}
-
-        # Loads base db
-        with db_hlapi(guild_id) as db:
-            for i in datatypes["csv"] + datatypes["text"] + datatypes["json"]:
-                message_config[i[0]] = db.grab_config(i[0])
-                if not message_config[i[0]]:
-                    message_config[i[0]] = None
-
-        # Load json datatype
-        for i in datatypes["json"]:
-            if (v := message_config[i[0]]):
-                try:
-                    message_config[i[0]] = json.loads(v)
-                except json.JSONDecodeError:
-                    # Corrupted db objects default to defaults
-                    message_config[i[0]] = None
-
-        # Load CSV datatype
-        for i in datatypes["csv"]:
-            if (v := message_config[i[0]]):
-                message_config[i[0]] = v.lower().split(",")
-
-        # Generate SNOWFLAKE DBCACHE
-        blacklist_cache = ramfs.create_f(dirlist=[str(guild_id), "caches", str(datatypes[0])])
-        # Add csv based configs
-        for i in datatypes["csv"]:
-            if message_config[i[0]]:
-                outdat = ",".join(message_config[i[0]]).encode("utf8")
-                write_vnum(blacklist_cache, len(outdat))
-                blacklist_cache.write(outdat)
-            else:
-                write_vnum(blacklist_cache, 0)
-
-        # Add text based configs
-        for i in datatypes["text"]:
-            if message_config[i[0]]:
-                outdat = message_config[i[0]].encode("utf8")
-                write_vnum(blacklist_cache, len(outdat))
-                blacklist_cache.write(outdat)
-            else:
-                write_vnum(blacklist_cache, 0)
-
-        # Add json configs
-        for i in datatypes["json"]:
-            if message_config[i[0]]:
-                outdat = pickle.dumps(message_config[i[0]])
-                write_vnum(blacklist_cache, len(outdat))
-                blacklist_cache.write(outdat)
-            else:
-                write_vnum(blacklist_cache, 0)
+    if STATELESS:
+        return _decode_config(datatypes, raw_config)
 
-        return _get_cached_config(guild_id, ramfs, datatypes)
+    return ramfs.create_f(dirlist=[str(guild_id), "caches", str(datatypes[0])], f_type=functools.partial(_decode_config, datatypes, raw_config))
 
 
 # Generate an infraction id from the wordlist cache format
@@ -3,7 +3,8 @@
 
 import mariadb
 import io
-from typing import List, Dict, Any, Tuple, Union
+import functools
+from typing import List, Dict, Any, Tuple, Union, Sequence, Iterator
 
 mdb_version = tuple([int(i) for i in mariadb.mariadbapi_version.split(".")])
 
@@ -14,6 +15,37 @@ class db_error:  # DB error codes
     Error = mariadb.OperationalError
 
 
+def _search_key(searchparms: Sequence[Sequence[Any]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    return tuple(i[0] for i in searchparms), tuple(i[2] if len(i) > 2 else '=' for i in searchparms)
+
+
+# Statements only depend on the table, columns and operators used, so they are built once and then reused
+@functools.lru_cache(maxsize=4096)
+def _statement(operation: str, table: str, columns: Tuple[str, ...] = (), operators: Tuple[str, ...] = ()) -> str:
+
+    if operation == "replace":
+        return f"REPLACE INTO {table} ({', '.join(columns)})\nVALUES ({', '.join('?' for _ in columns)})\n"
+    elif operation == "count":
+        return f"SELECT COUNT(*) FROM {table} WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "select":
+        return f"SELECT * FROM {table} WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "delete":
+        return f"DELETE FROM {table} WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "drop":
+        return f"DROP TABLE IF EXISTS {table};"
+    elif operation == "fetch":
+        return f"SELECT * FROM {table};"
+
+    raise ValueError(f"Unknown statement operation {operation}")
+
+
+def statement_cache_info() -> "functools._CacheInfo":
+    """
+    Returns hit/miss statistics of the statement cache, for tuning its size
+    """
+    return _statement.cache_info()
+
+
 class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
     __slots__ = "con", "cur", "db_name", "closed"
@@ -43,6 +75,10 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
         self.cur.execute(db_inputStr)
 
+    def drop_index(self, tablename: str, indexname: str) -> None:
+
+        self.cur.execute(f"DROP INDEX IF EXISTS {indexname} ON {tablename}")
+
     def make_new_table(self, tablename: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
 
         # Load hashmap of python datatypes to MariaDB datatypes
@@ -73,14 +109,18 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
         # Add table addition
         db_inputBuilder.write(f'CREATE TABLE IF NOT EXISTS {tablename} (')
 
-        # Parse through table items, item with 3 entries is primary key
+        # Parse through table items, item with 3 entries is primary key, more than one makes a composite primary key
+        primary = [i[0] for i in data if len(i) >= 3 and i[2] == 1]
         inlist = []
         for i in data:
-            if len(i) >= 3 and i[2] == 1:
+            if len(primary) == 1 and i[0] in primary:
                 inlist.append(f"{i[0]} {datamap[i[1]]} PRIMARY KEY")
             else:
                 inlist.append(f"{i[0]} {datamap[i[1]]}")
 
+        if len(primary) > 1:
+            inlist.append(f"PRIMARY KEY ({', '.join(primary)})")
+
         # Add parsed inputs to inputStr
         db_inputBuilder.write(", ".join(inlist))
         db_inputBuilder.write(")")
@@ -90,47 +130,22 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
     def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
 
-        db_inputBuilder = io.StringIO()
+        self.cur.execute(_statement("replace", table, tuple(i[0] for i in data)), tuple(i[1] for i in data))
 
-        # Add insert data and generate base tables
-        db_inputBuilder.write(f"REPLACE INTO {table} (")
-        db_inputList: List[Any] = []
-        db_inputBuilder.write(", ".join(i[0] for i in data))
-        db_inputBuilder.write(")\n")
+    def add_many_to_table(self, table: str, columns: Sequence[str], rows: Sequence[Tuple[Any, ...]]) -> None:
 
-        # Insert values data
-        db_inputBuilder.write("VALUES (")
-        db_inputList.extend(i[1] for i in data)
-
-        db_inputBuilder.write(", ".join("?" for i in data))
-        db_inputBuilder.write(")\n")
-
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.executemany(_statement("replace", table, tuple(columns)), rows)
 
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> int:
 
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT COUNT(*) FROM {table} WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_statement("count", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
         retval: int = tuple(self.cur)[0][0]
         return retval
 
     def fetch_rows_from_table(self, table: str, search: List[Any]) -> Tuple[Any, ...]:
 
-        # Add SELECT data
-        db_inputStr = f"SELECT * FROM {table} WHERE {search[0]} {search[2] if len(search) > 2 else '='} ?"
-        db_inputList = [search[1]]
-
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_statement("select", table, *_search_key((search, ))), (search[1], ))
 
         # Send data
         returndata = tuple(self.cur)
@@ -138,40 +153,46 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
     def multifetch_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> Tuple[Any, ...]:
 
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT * FROM {table} WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_statement("select", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
         return tuple(self.cur)
 
     def delete_rows_from_table(self, table: str, column_search: List[Any]) -> None:
 
-        # Do deletion setup
-        db_inputStr = f"DELETE FROM {table} WHERE {column_search[0]}=?"
-        db_inputList = [column_search[1]]
+        self.cur.execute(_statement("delete", table, (column_search[0], ), ("=", )), (column_search[1], ))
+
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> None:
 
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_statement("delete", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
     def delete_table(self, table: str) -> None:
 
-        self.cur.execute(f"DROP TABLE IF EXISTS {table};")
+        self.cur.execute(_statement("drop", table))
 
     def fetch_table(self, table: str) -> Tuple[Any, ...]:
 
-        self.cur.execute(f"SELECT * FROM {table};")
+        self.cur.execute(_statement("fetch", table))
 
         # Send data
         returndata = tuple(self.cur)
         return returndata
 
+    def iter_rows_from_table(self, table: str, searchparms: List[List[Any]], batchsize: int) -> Iterator[Tuple[Any, ...]]:
+
+        # A cursor of its own, so statements run between batches do not reset it
+        cur = self.con.cursor()
+
+        try:
+            if searchparms:
+                cur.execute(_statement("select", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
+            else:
+                cur.execute(_statement("fetch", table))
+
+            while rows := cur.fetchmany(batchsize):
+                yield tuple(rows)
+        finally:
+            cur.close()
+
     def list_tables(self, searchterm: str) -> Tuple[Tuple[str], ...]:
 
         self.cur.execute(f"SHOW TABLES WHERE Tables_in_{self.db_name} LIKE ?", (searchterm, ))
@@ -0,0 +1,279 @@
+# Timed unmute scheduler
+# One task fires every timed unmute across all guilds, driven off the mutes table
+# Ultrabear 2022
+
+import importlib
+
+import asyncio
+import functools
+import heapq
+import time
+
+import discord
+
+import lib_db_obfuscator
+
+importlib.reload(lib_db_obfuscator)
+import lib_loaders
+
+importlib.reload(lib_loaders)
+import lib_compatibility
+
+importlib.reload(lib_compatibility)
+
+from lib_db_obfuscator import db_hlapi, async_db_hlapi
+from lib_loaders import datetime_now, inc_statistics_better
+from lib_compatibility import to_snowflake
+from lib_sonnetconfig import UNMUTE_CONCURRENCY
+import lib_lexdpyk_h as lexdpyk
+
+from typing import Dict, List, Optional, Set, Tuple, cast
+
+__all__ = [
+    "MuteScheduler",
+    "get_mute_scheduler",
+    ]
+
+# Guild, InfractionID, UserId, Time to be unmuted
+MuteEntryT = Tuple[str, str, str, int]
+
+# Role removals failing with a ratelimit or server error are retried this many times, backing off exponentially from _BACKOFF seconds
+_MAX_ATTEMPTS = 5
+_BACKOFF = 1.0
+# Guilds whose unmutes failed outright are retried after an exponential backoff capped at this many seconds
+_MAX_RETRY_DELAY = 15 * 60
+
+
+def _retry_delay(failures: int) -> float:
+    return min(_BACKOFF * 2.0**min(failures, 16), _MAX_RETRY_DELAY)
+
+
+def _lift_mutes(db: db_hlapi, infraction_ids: List[str]) -> Tuple[Set[str], Optional[str]]:
+    # Runs on the db executor, removes the mutes that are still active and grabs the mute role once for the whole guild
+    lifted: Set[str] = set()
+
+    for infraction_id in infraction_ids:
+        if db.is_muted(infractionid=infraction_id):
+            db.unmute_user(infractionid=infraction_id)
+            lifted.add(infraction_id)
+
+    return lifted, db.grab_config("mute-role")
+
+
+class MuteScheduler:
+    """
+    Fires timed unmutes from a single task, instead of one sleeping task per mute
+
+    Only mutes ending within the next `horizon` seconds are held in memory in a heap ordered by end time,
+    mutes ending later stay in the database and are loaded by end time as the horizon advances
+    So recovering after a restart only loads mutes that are due, and thousands of pending mutes cost one task
+    Unmutes that are due at the same time are fired concurrently, see unmute_batch()
+    """
+
+    __slots__ = "client", "kernel_ramfs", "horizon", "_heap", "_scheduled", "_loaded_until", "_wakeup", "_task", "_failures"
+
+    def __init__(self, client: discord.Client, kernel_ramfs: lexdpyk.ram_filesystem, horizon: int = 60 * 60) -> None:
+        self.client = client
+        self.kernel_ramfs = kernel_ramfs
+        self.horizon = horizon
+        # (end time, guild, infractionID, userID)
+        self._heap: List[Tuple[int, str, str, str]] = []
+        # (guild, infractionID) of entries in the heap, as mutes can be loaded from the database after being scheduled
+        self._scheduled: Set[Tuple[str, str]] = set()
+        # Every mute ending at or before this time has been loaded into the heap
+        self._loaded_until = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: "Optional[asyncio.Task[None]]" = None
+        # guild -> consecutive failed unmute batches, used to back off retries
+        self._failures: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """
+        Starts the scheduler task if it is not already running, must be called from the event loop
+        """
+        if self._task is not None and not self._task.done():
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def schedule(self, guild_id: int, infraction_id: str, user_id: int, end: int) -> None:
+        """
+        Schedules a timed unmute, the mute must already be written to the database
+        """
+        self.start()
+
+        # Mutes past the loaded horizon are picked up from the database when it advances
+        if end > self._loaded_until:
+            return
+
+        self._push((str(guild_id), infraction_id, str(user_id), end))
+
+        if self._heap[0][0] == end and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _push(self, entry: MuteEntryT) -> None:
+        if (entry[0], entry[1]) in self._scheduled:
+            return
+
+        self._scheduled.add((entry[0], entry[1]))
+        heapq.heappush(self._heap, (entry[3], entry[0], entry[1], entry[2]))
+
+    async def _load(self, until: int) -> None:
+        # Advance first so mutes scheduled while loading are pushed by schedule(), duplicates are skipped by _push()
+        after, self._loaded_until = self._loaded_until, until
+
+        try:
+            async with async_db_hlapi(None) as db:
+                mutes = await db.fetch_due_mutes(after, until)
+        except BaseException:
+            self._loaded_until = after
+            raise
+
+        for entry in mutes:
+            self._push(entry)
+
+    def _pop_due(self, now: float) -> List[MuteEntryT]:
+        due: List[MuteEntryT] = []
+
+        while self._heap and self._heap[0][0] <= now:
+            end, guild, infraction_id, user_id = heapq.heappop(self._heap)
+            self._scheduled.discard((guild, infraction_id))
+            due.append((guild, infraction_id, user_id, end))
+
+        return due
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+
+        recovering = True
+        load_failures = 0
+
+        while True:
+            now = datetime_now().timestamp()
+
+            if now + self.horizon // 2 >= self._loaded_until:
+                try:
+                    await self._load(int(now) + self.horizon)
+                except Exception as e:
+                    # A database outage must not kill the only task firing unmutes, the load is retried after a backoff
+                    delay = _retry_delay(load_failures)
+                    load_failures += 1
+                    print(f"MuteScheduler: loading mutes failed, retrying in {delay:.0f}s: {type(e).__name__}: {e}")
+                    await asyncio.sleep(delay)
+                    continue
+
+                load_failures = 0
+
+            if due := self._pop_due(now):
+                if recovering:
+                    print(f"Lost mutes: {len(due)}")
+
+                start = time.monotonic()
+                lifted = await self.unmute_batch(due)
+
+                if recovering:
+                    print(f"Mutes recovered: {lifted} in {time.monotonic()-start:.1f}s")
+
+                recovering = False
+                continue
+
+            recovering = False
+
+            # Sleep until the next mute ends, or the horizon needs to advance
+            wake = min(self._heap[0][0] if self._heap else self._loaded_until, self._loaded_until - self.horizon // 2)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wake - now, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def unmute_batch(self, due: List[MuteEntryT]) -> int:
+        """
+        Unmutes users whose mutes have ended, skipping mutes that were already lifted or replaced by another mute
+
+        Mutes are grouped per guild so each guild costs one database transaction and one mute role lookup,
+        role removals of all guilds then run concurrently, at most UNMUTE_CONCURRENCY at a time
+        Progress is counted in the kernel statistics as timed-unmute and timed-unmute-failed
+        A guild whose batch fails (database errors) is logged and has its mutes rescheduled with a backoff
+
+        :returns: int - The amount of mutes that were lifted
+        """
+        guilds: Dict[str, List[MuteEntryT]] = {}
+        for entry in due:
+            guilds.setdefault(entry[0], []).append(entry)
+
+        limit = asyncio.Semaphore(UNMUTE_CONCURRENCY)
+
+        results = await asyncio.gather(*(self._unmute_guild(guild_id, entries, limit) for guild_id, entries in guilds.items()), return_exceptions=True)
+
+        lifted = 0
+
+        for (guild_id, entries), result in zip(guilds.items(), results):
+            if isinstance(result, BaseException):
+                self._requeue(guild_id, entries, result)
+            else:
+                self._failures.pop(guild_id, None)
+                lifted += result
+
+        return lifted
+
+    def _requeue(self, guild_id: str, entries: List[MuteEntryT], error: BaseException) -> None:
+        # Mutes that were already lifted before the failure are skipped on retry by _lift_mutes
+        failures = self._failures.get(guild_id, 0)
+        self._failures[guild_id] = failures + 1
+        delay = _retry_delay(failures)
+
+        print(f"MuteScheduler: unmuting {len(entries)} mutes in guild {guild_id} failed, retrying in {delay:.0f}s: {type(error).__name__}: {error}")
+
+        retry_at = int(datetime_now().timestamp() + delay)
+        for entry in entries:
+            self._push((entry[0], entry[1], entry[2], retry_at))
+
+    async def _unmute_guild(self, guild_id: str, entries: List[MuteEntryT], limit: asyncio.Semaphore) -> int:
+
+        async with limit:
+            async with async_db_hlapi(int(guild_id)) as db:
+                lifted, mute_role_id = await db.run(_lift_mutes, [i[1] for i in entries])
+
+        if not lifted or not (guild := self.client.get_guild(int(guild_id))) or not mute_role_id:
+            return len(lifted)
+
+        if not (mute_role := guild.get_role(int(mute_role_id))):
+            return len(lifted)
+
+        await asyncio.gather(*(self._remove_role(guild, mute_role, int(i[2]), limit) for i in entries if i[1] in lifted))
+
+        return len(lifted)
+
+    async def _remove_role(self, guild: discord.Guild, mute_role: discord.Role, user_id: int, limit: asyncio.Semaphore) -> None:
+
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                async with limit:
+                    member = guild.get_member(user_id) or await guild.fetch_member(user_id)
+                    await member.remove_roles(to_snowflake(mute_role))
+                inc_statistics_better(guild.id, "timed-unmute", self.kernel_ramfs)
+                return
+            except discord.errors.HTTPException as e:
+                # Only ratelimits and server errors are worth retrying, anything else (left guild, missing permissions) is final
+                if e.status != 429 and e.status < 500:
+                    break
+
+                await asyncio.sleep(getattr(e, "retry_after", None) or _BACKOFF * 2**attempt)
+
+        inc_statistics_better(guild.id, "timed-unmute-failed", self.kernel_ramfs)
+
+
+def get_mute_scheduler(client: discord.Client, kernel_ramfs: lexdpyk.ram_filesystem) -> MuteScheduler:
+    """
+    Grabs the mute scheduler from the kernel ramfs, creating it if it does not exist
+    The scheduler lives in the kernel ramfs so it survives command module reloads
+
+    :returns: MuteScheduler - The mute scheduler, call start() or schedule() to run it
+    """
+    try:
+        return cast(MuteScheduler, kernel_ramfs.read_f(dirlist=["global", "mute_scheduler"]))
+    except FileNotFoundError:
+        return kernel_ramfs.create_f(dirlist=["global", "mute_scheduler"], f_type=functools.partial(MuteScheduler, client, kernel_ramfs))
@@ -4,8 +4,9 @@
 from __future__ import annotations
 
 import importlib
+import functools
 
-import lz4.frame, discord, os, json, hashlib, io, warnings, math
+import lz4.frame, discord, os, json, io, warnings, math, asyncio
 
 import lib_sonnetcommands
 import lib_encryption_wrapper
@@ -13,10 +14,11 @@ import lib_encryption_wrapper
 from lib_sonnetconfig import REGEX_VERSION
 from lib_db_obfuscator import db_hlapi
 from lib_encryption_wrapper import encrypted_reader
+from lib_automod import BlacklistMatcher
 import lib_constants as constants
 from lib_compatibility import is_guild_messageable, GuildMessageable
 
-from typing import Callable, Iterable, Optional, Any, Tuple, Dict, Union, List, TypeVar, Literal, overload, cast
+from typing import Callable, Iterable, Optional, Any, Tuple, Dict, Union, List, TypeVar, Literal, overload
 import lib_lexdpyk_h as lexdpyk
 
 # Import re here to trick type checker into using re stubs even if importlib grabs re2, they (should) have the same stubs
@@ -58,20 +60,51 @@ unicodeFilter = re.compile(r'[^a-z0-9 ]+')
 _parse_blacklist_inputs = Tuple[discord.Message, Dict[str, Any], lexdpyk.ram_filesystem]
 
 
-def _formatregexfind(gex: List[Any]) -> str:
-    return ", ".join(i if isinstance(i, str) else "".join(i) for i in gex)
+def load_blacklist_matcher(guild_id: int, blacklist: Dict[str, Any], ramfs: lexdpyk.ram_filesystem) -> BlacklistMatcher:
+    """
+    Loads the compiled blacklist matcher of a guild from ramfs, or compiles and caches it if it does not exist
+    The matcher lives in the regex cache directory, so it is invalidated alongside the config cache
 
+    :returns: BlacklistMatcher -- The compiled blacklist matcher
+    """
+
+    try:
+        matcher = ramfs.read_f(f"{guild_id}/regex/matcher")
+        assert isinstance(matcher, BlacklistMatcher)
+        return matcher
+    except FileNotFoundError:
+        pass
+
+    with db_hlapi(guild_id) as db:
+        reglist: Dict[str, List["re.Pattern[str]"]] = {}
+        for regex_type in ["regex-blacklist", "regex-notifier"]:
+            if dat := db.grab_config(regex_type):
+                # dict.fromkeys dedupes identical regexes while keeping their order
+                patterns = dict.fromkeys(" ".join(i.split(" ")[1:])[1:-2] for i in json.loads(dat)["blacklist"])
+                reglist[regex_type] = [re.compile(i) for i in patterns]
+            else:
+                reglist[regex_type] = []
+
+    url = re.compile(_compileurl(blacklist["url-blacklist"])) if blacklist["url-blacklist"] else None
+
+    return ramfs.create_f(
+        f"{guild_id}/regex/matcher",
+        f_type=functools.partial(
+            BlacklistMatcher, blacklist["word-blacklist"], blacklist["word-in-word-blacklist"], blacklist["filetype-blacklist"], reglist["regex-blacklist"], reglist["regex-notifier"], url
+            )
+        )
 
-# This exists because type checkers can't infer lambda return types or something
-def returnsNone() -> None:
-    ...
+
+def _blacklist_text(content: str) -> str:
+    return unicodeFilter.sub('', content.lower().replace(":", " ").replace("\n", " "))
 
 
 # Run a blacklist pass over a messages content and files
-def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[discord.ClientUser] = None) -> tuple[bool, bool, list[str]]:
+def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[discord.ClientUser] = None, old_message: Optional[discord.Message] = None) -> tuple[bool, bool, list[str]]:
     """
     Deprecated, this should be in dlib_messages.py
     Parse the blacklist over a message object
+    If old_message is the message before an edit and the current blacklist scanned it clean, only the changed content and new files are rescanned
 
     :returns: Tuple[bool, bool, List[str]] -- broke blacklist, broke notifier list, list of strings of infraction messages
     """
@@ -86,42 +119,8 @@ def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[disco
         if parsed is not None and parsed[0] == "set-whitelist":
             return False, False, []
 
-    # Preset values
-    broke_blacklist = False
-    notifier = False
-    infraction_type = []
-
-    # Compilecheck regex
-    try:
-        ramfs.ls(f"{message.guild.id}/regex")
-    except FileNotFoundError:
-        # Compiles regex blacklists if they are not precompiled
-
-        with db_hlapi(message.guild.id) as db:
-            reglist = {}
-            for regex_type in ["regex-blacklist", "regex-notifier"]:
-                if dat := db.grab_config(regex_type):
-                    reglist[regex_type] = [" ".join(i.split(" ")[1:])[1:-2] for i in json.loads(dat)["blacklist"]]
-                else:
-                    reglist[regex_type] = []
-
-        for regex_type in ["regex-blacklist", "regex-notifier"]:
-            ramfs.mkdir(f"{message.guild.id}/regex/{regex_type}")
-            for i in reglist[regex_type]:
-                # name ramfs file using sha256 hex and only take last 32 bytes to avoid directory name exploit
-                # (forward slash in regex would build a new directory)
-                regexname = hex(int.from_bytes(hashlib.sha256(i.encode("utf8")).digest(), "big"))[-32:]
-                ramfs.create_f(f"{message.guild.id}/regex/{regex_type}/{regexname}", f_type=re.compile, f_args=[i])
-
-        if blacklist["url-blacklist"]:
-            ramfs.create_f(f"{message.guild.id}/regex/url", f_type=re.compile, f_args=[_compileurl(blacklist["url-blacklist"])])
-        else:
-            ramfs.create_f(f"{message.guild.id}/regex/url", f_type=returnsNone)
-
-    # Load blacklist from ramfs cache into temp conf_cache
-    blacklist["regex-blacklist"] = [ramfs.read_f(f"{message.guild.id}/regex/regex-blacklist/{i}") for i in ramfs.ls(f"{message.guild.id}/regex/regex-blacklist")[0]]
-    blacklist["regex-notifier"] = [ramfs.read_f(f"{message.guild.id}/regex/regex-notifier/{i}") for i in ramfs.ls(f"{message.guild.id}/regex/regex-notifier")[0]]
-    blacklist["url-blacklist_regex"] = ramfs.read_f(f"{message.guild.id}/regex/url")
+    # Compiles blacklists if they are not precompiled
+    matcher = load_blacklist_matcher(message.guild.id, blacklist, ramfs)
 
     # Check that member is still part of guild (yes this is a race cond that happens)
     if not isinstance(message.author, discord.Member):
@@ -131,56 +130,21 @@ def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[disco
     if message.author.guild and blacklist["blacklist-whitelist"] and int(blacklist["blacklist-whitelist"]) in [i.id for i in message.author.roles]:
         return (False, False, [])
 
-    text_to_blacklist = unicodeFilter.sub('', message.content.lower().replace(":", " ").replace("\n", " "))
-    LowerCaseContent = message.content.lower()
-
-    # Check message against word blacklist
-    word_blacklist: List[str] = blacklist["word-blacklist"]
-    for i in text_to_blacklist.split(" "):
-        if i in word_blacklist:
-            broke_blacklist = True
-            infraction_type.append(f"Word({i})")
-
-    # Check message against word in word blacklist
-    word_in_word_blacklist: List[str] = blacklist["word-in-word-blacklist"]
-    for i in word_in_word_blacklist:
-        if i in text_to_blacklist.replace(" ", ""):
-            broke_blacklist = True
-            infraction_type.append(f"WordInWord({i})")
-
-    # Check message against REGEXP blacklist
-    regex_blacklist = cast(List["re.Pattern[str]"], blacklist["regex-blacklist"])
-    for r in regex_blacklist:
-        try:
-            if broke := r.findall(LowerCaseContent):
-                broke_blacklist = True
-                infraction_type.append(f"RegEx({_formatregexfind(broke)})")
-        except re.error:
-            pass  # GC for old regex
-
-    # Check message against REGEXP notifier list
-    regex_notifier = cast(List["re.Pattern[str]"], blacklist["regex-notifier"])
-    for r in regex_notifier:
-        if r.findall(LowerCaseContent):
-            notifier = True
-
-    # Check against filetype blacklist
-    filetype_blacklist: List[str] = blacklist["filetype-blacklist"]
-    if filetype_blacklist and message.attachments:
-        for ft in message.attachments:
-            for a in filetype_blacklist:
-                if ft.filename.lower().endswith(a):
-                    broke_blacklist = True
-                    infraction_type.append(f"FileType({a})")
-
-    # Check url blacklist
-    url_blacklist = cast(Optional["re.Pattern[str]"], blacklist["url-blacklist_regex"])
-    if url_blacklist is not None:
-        if broke := url_blacklist.findall(LowerCaseContent):
-            broke_blacklist = True
-            infraction_type.append(f"URL({_formatregexfind(broke)})")
-
-    return (broke_blacklist, notifier, infraction_type)
+    text_to_blacklist = _blacklist_text(message.content)
+
+    # Only messages that were actually scanned clean may skip rescanning their unchanged content,
+    # whitelisted authors, the set-whitelist escape, and messages whose scan never ran were not
+    if old_message is not None and matcher.is_clean(old_message.id):
+        old_files = {i.id for i in old_message.attachments}
+        new_files = (i.filename.lower() for i in message.attachments if i.id not in old_files)
+        result = matcher.scan_edit(_blacklist_text(old_message.content), text_to_blacklist, message.content.lower(), new_files)
+    else:
+        result = matcher.scan(text_to_blacklist, message.content.lower(), (i.filename.lower() for i in message.attachments))
+
+    if not result[0]:
+        matcher.mark_clean(message.id)
+
+    return result
 
 
 # Parse if we skip a message due to X reasons
@@ -401,71 +365,177 @@ def ifgate(inlist: Iterable[Any]) -> bool:
 
 
 # Grab files of a message from the internal cache
+# type ignore needed because lz4 has no type stubs
+class _encrypted_lz4_file(lz4.frame.LZ4FrameFile):  # type: ignore[misc]
+    """
+    An LZ4FrameFile over an encrypted_reader that closes the reader with itself, and does not expose the encrypted files fileno
+    """
+    def __init__(self, encrypted_file: encrypted_reader) -> None:
+        super().__init__(filename=encrypted_file, mode="rb")
+        self._encrypted_file = encrypted_file
+
+    def fileno(self) -> int:
+        # The fileno is of the encrypted file, so its size is not the size of this file
+        raise io.UnsupportedOperation("fileno")
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._encrypted_file.close()
+
+
+def _cached_files(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem) -> List[Tuple[bytes, bytes, bytes, str]]:
+    """
+    Reads the pointer, key, iv, and filename of each file of a message in the internal encryption cache
+
+    :raises: FileNotFoundError - The message has no cached files
+    """
+
+    out: List[Tuple[bytes, bytes, bytes, str]] = []
+
+    for i in ramfs.ls(f"{guild_id}/files/{message_id}")[1]:
+
+        try:
+
+            loc = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/pointer")
+            assert isinstance(loc, io.BytesIO)
+            loc.seek(0)
+            pointer = loc.read()
+
+            keys = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/key")
+            assert isinstance(keys, io.BytesIO)
+            keys.seek(0)
+            key = keys.read(32)
+            iv = keys.read(16)
+
+            name = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/name")
+            assert isinstance(name, io.BytesIO)
+            name.seek(0)
+            fname = name.read().decode("utf8")
+
+            out.append((pointer, key, iv, fname))
+
+        except FileNotFoundError:
+            continue
+
+    return out
+
+
+def _delete_cached_files(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem, pointers: Iterable[bytes]) -> None:
+
+    # Open readers keep working as the files are unlinked, not truncated
+    for pointer in pointers:
+        try:
+            os.remove(pointer)
+        except FileNotFoundError:
+            pass
+
+    try:
+        ramfs.rmdir(f"{guild_id}/files/{message_id}")
+    except FileNotFoundError:
+        pass
+
+
 def grab_files(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem, delete: bool = False) -> Optional[list[discord.File]]:
     """
     Grab all files from a message from the internal encryption cache
+    Files are decrypted and decompressed as discord.py reads them, see async_grab_files to also verify them off the event loop
 
     :returns: Optional[List[discord.File]]
     """
 
     try:
+        cached = _cached_files(guild_id, message_id, ramfs)
+    except FileNotFoundError:
+        return None
 
-        files = ramfs.ls(f"{guild_id}/files/{message_id}")[1]
-        discord_files = []
-        for i in files:
+    discord_files = []
 
-            try:
+    for pointer, key, iv, fname in cached:
+        try:
+            encrypted_file = encrypted_reader(pointer, key, iv)  # errors raised here
+            discord_files.append(discord.File(_encrypted_lz4_file(encrypted_file), filename=fname))
+        except (lib_encryption_wrapper.errors.HMACInvalidError, FileNotFoundError):
+            pass
 
-                loc = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/pointer")
-                assert isinstance(loc, io.BytesIO)
-                loc.seek(0)
-                pointer = loc.read()
+    if delete:
+        _delete_cached_files(guild_id, message_id, ramfs, (i[0] for i in cached))
 
-                keys = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/key")
-                assert isinstance(keys, io.BytesIO)
-                keys.seek(0)
-                key = keys.read(32)
-                iv = keys.read(16)
+    return discord_files
 
-                name = ramfs.read_f(f"{guild_id}/files/{message_id}/{i}/name")
-                assert isinstance(name, io.BytesIO)
-                name.seek(0)
-                fname = name.read().decode("utf8")
 
-                try:
-                    encrypted_file = encrypted_reader(pointer, key, iv)  # errors raised here
-                    rawfile = lz4.frame.LZ4FrameFile(filename=encrypted_file, mode="rb")
+def cached_file_count(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem) -> int:
+    """
+    Counts the files of a message in the internal encryption cache without opening them
 
-                    dfile = io.BytesIO(rawfile.read())
+    :returns: int - The amount of cached files, 0 if the message has none
+    """
 
-                    rawfile.close()
-                    encrypted_file.close()
+    try:
+        return len(ramfs.ls(f"{guild_id}/files/{message_id}")[1])
+    except FileNotFoundError:
+        return 0
 
-                    discord_files.append(discord.File(dfile, filename=fname))
-                except (lib_encryption_wrapper.errors.HMACInvalidError, lib_encryption_wrapper.errors.NotSonnetAESError):
-                    pass
 
-                if delete:
-                    try:
-                        os.remove(pointer)
-                    except FileNotFoundError:
-                        pass
+def delete_files(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem) -> None:
+    """
+    Deletes all files of a message from the internal encryption cache without opening them
+    """
 
-            except FileNotFoundError:
-                continue
+    try:
+        cached = _cached_files(guild_id, message_id, ramfs)
+    except FileNotFoundError:
+        return
 
-        if delete:
-            try:
-                ramfs.rmdir(f"{guild_id}/files/{message_id}")
-            except FileNotFoundError:
-                pass
+    _delete_cached_files(guild_id, message_id, ramfs, (i[0] for i in cached))
 
-        return discord_files
 
-    except FileNotFoundError:
+def close_files(files: Iterable[discord.File]) -> None:
+    """
+    Closes the files returned by grab_files or async_grab_files
+    discord.File never closes a file object it was handed, so their encrypted readers hold a file descriptor until closed
+    """
+
+    for i in files:
+        i.close()
+        i.fp.close()
+
+
+async def async_grab_files(guild_id: int, message_id: int, ramfs: lexdpyk.ram_filesystem, delete: bool = False) -> Optional[list[discord.File]]:
+    """
+    Grab all files from a message from the internal encryption cache, see grab_files
+    The HMAC of every file is verified concurrently in an executor so large files do not block the event loop
 
+    :returns: Optional[List[discord.File]]
+    """
+
+    try:
+        cached = _cached_files(guild_id, message_id, ramfs)
+    except FileNotFoundError:
         return None
 
+    readers = await asyncio.gather(*(encrypted_reader.open(pointer, key, iv) for pointer, key, iv, _ in cached), return_exceptions=True)
+
+    # An unexpected error is raised without leaking the file descriptors of the readers that did open
+    for reader in readers:
+        if isinstance(reader, BaseException) and not isinstance(reader, (lib_encryption_wrapper.errors.HMACInvalidError, FileNotFoundError)):
+            for opened in readers:
+                if isinstance(opened, encrypted_reader):
+                    opened.close()
+            raise reader
+
+    discord_files = []
+
+    for (_, _, _, fname), reader in zip(cached, readers):
+        if isinstance(reader, encrypted_reader):
+            discord_files.append(discord.File(_encrypted_lz4_file(reader), filename=fname))
+
+    if delete:
+        _delete_cached_files(guild_id, message_id, ramfs, (i[0] for i in cached))
+
+    return discord_files
+
 
 # Generate a prettified reply field from a message for displaying in embeds
 def generate_reply_field(message: discord.Message) -> str:
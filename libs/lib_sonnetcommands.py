@@ -156,6 +156,13 @@ class CommandCtx:
         """
         return str(self.conf_cache["prefix"])
 
+    @property
+    def registry(self) -> "CommandRegistry":
+        """
+        Returns the CommandRegistry of the loaded command modules
+        """
+        return get_command_registry(self.cmds, self.cmds_dict)
+
 
 def cache_sweep(cdata: Union[str, "SonnetCommand"], ramfs: lexdpyk.ram_filesystem, guild: discord.Guild) -> None:
     """
@@ -188,14 +195,28 @@ def cache_sweep(cdata: Union[str, "SonnetCommand"], ramfs: lexdpyk.ram_filesyste
                 pass
 
 
+# func -> (positional arg count, has **kwargs)
+# Command functions live for as long as their module is loaded, and this module is reloaded along with them
+_argspecs: Dict[Any, Tuple[int, bool]] = {}
+
+
+def _argspec(func: Union[ExecutableT, ExecutableCtxT]) -> Tuple[int, bool]:
+    try:
+        return _argspecs[func]
+    except KeyError:
+        spec = inspect.getfullargspec(func)
+        out = _argspecs[func] = len(spec.args), spec.varkw is not None
+        return out
+
+
 def _iskwargcallable(func: Union[ExecutableT, ExecutableCtxT]) -> TypeGuard[ExecutableT]:
-    spec = inspect.getfullargspec(func)
-    return len(spec.args) == 3 and spec.varkw is not None
+    args, varkw = _argspec(func)
+    return args == 3 and varkw
 
 
 def _isctxcallable(func: Union[ExecutableT, ExecutableCtxT]) -> TypeGuard[ExecutableCtxT]:
-    spec = inspect.getfullargspec(func)
-    return len(spec.args) == 4
+    args, _ = _argspec(func)
+    return args == 4
 
 
 def CallKwargs(func: Union[ExecutableT, ExecutableCtxT]) -> ExecutableT:
@@ -327,3 +348,99 @@ class SonnetCommand(dict):  # type: ignore[type-arg]
     @property
     def rich_description(self) -> str:
         return str(self["rich_description"])
+
+
+class CommandRegistry:
+    """
+    A frozen index of the loaded commands, built once per load of the command modules
+
+    Holds every endpoint with its alias resolved, the ctx callable of every endpoint,
+    the aliases of every command, and the module that owns every endpoint, so dispatch and help do not scan cmds_dict
+    """
+    __slots__ = "source", "commands", "executors", "aliases", "modules", "_resolved"
+
+    def __init__(self, cmds: List[lexdpyk.cmd_module], cmds_dict: lexdpyk.cmd_modules_dict) -> None:
+        self.source = cmds_dict
+        # endpoint -> true command name
+        self.commands: Dict[str, str] = {}
+        self.executors: Dict[str, ExecutableCtxT] = {}
+        # true command name -> its aliases, in load order
+        self.aliases: Dict[str, Tuple[str, ...]] = {}
+        # endpoint -> owning module
+        self.modules: Dict[str, lexdpyk.cmd_module] = {}
+        # true command name -> command
+        self._resolved: Dict[str, SonnetCommand] = {}
+
+        resolved = self._resolved
+        aliases: Dict[str, List[str]] = {}
+
+        for name, vals in cmds_dict.items():
+            true_name = vals.get("alias", name)
+
+            # Aliases that point at a missing command are treated as missing
+            if true_name not in cmds_dict:
+                continue
+
+            if true_name not in resolved:
+                resolved[true_name] = SonnetCommand(cmds_dict[true_name])
+                aliases[true_name] = []
+
+            if true_name != name:
+                aliases[true_name].append(name)
+
+            self.commands[name] = true_name
+
+        for name, true_name in self.commands.items():
+            self.executors[name] = resolved[true_name].execute_ctx
+
+        self.aliases = {k: tuple(v) for k, v in aliases.items()}
+
+        # Later modules override earlier ones, as the kernel builds cmds_dict in the same order
+        for module in cmds:
+            for name in module.commands:
+                if name in self.commands:
+                    self.modules[name] = module
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.commands
+
+    def __getitem__(self, name: str) -> SonnetCommand:
+        return self._resolved[self.commands[name]]
+
+    def get(self, name: str) -> Optional[SonnetCommand]:
+        """
+        Grabs an endpoint with its alias resolved
+
+        :returns: Optional[SonnetCommand] - The command, or None if it does not exist
+        """
+        try:
+            return self[name]
+        except KeyError:
+            return None
+
+    def true_name(self, name: str) -> Optional[str]:
+        """
+        Resolves an endpoint to the name of the command it aliases, or itself if it is not an alias
+
+        :returns: Optional[str] - The true name, or None if it does not exist
+        """
+        return self.commands.get(name)
+
+
+_registry: Optional[CommandRegistry] = None
+
+
+def get_command_registry(cmds: List[lexdpyk.cmd_module], cmds_dict: lexdpyk.cmd_modules_dict) -> CommandRegistry:
+    """
+    Grabs the CommandRegistry of the loaded command modules
+
+    The kernel builds a new cmds_dict every time it loads command modules, so the registry is rebuilt when cmds_dict is not the one it was built from
+
+    :returns: CommandRegistry - The registry
+    """
+    global _registry
+
+    if _registry is None or _registry.source is not cmds_dict:
+        _registry = CommandRegistry(cmds, cmds_dict)
+
+    return _registry
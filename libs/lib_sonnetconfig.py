@@ -23,6 +23,12 @@ __all__ = [
     "GOLIB_LOAD",
     "GOLIB_VERSION",
     "BOT_NAME",
+    "DB_POOL_SIZE",
+    "DB_HEALTHCHECK_INTERVAL",
+    "DB_WRITE_BEHIND_MS",
+    "UNMUTE_CONCURRENCY",
+    "FILELOG_MAX_BYTES",
+    "FILELOG_WORKERS",
     ]
 
 Typ = TypeVar("Typ")
@@ -67,3 +73,9 @@ GOLIB_VERSION = _load_cfg("GOLIB_VERSION", "go", str)
 BOT_NAME = _load_cfg("BOT_NAME", "Sonnet", str, lambda s: len(s) < 10, "Name is too large")
 STATELESS = _load_cfg("STATELESS", False, bool)
 AUTOMOD_ENABLED = _load_cfg("AUTOMOD_ENABLED", True, bool)
+DB_POOL_SIZE = _load_cfg("DB_POOL_SIZE", 4, int, lambda i: i >= 1, "Pool size must be at least 1")
+DB_HEALTHCHECK_INTERVAL = _load_cfg("DB_HEALTHCHECK_INTERVAL", 60, int, lambda i: i > 0, "Health check interval must be positive")
+DB_WRITE_BEHIND_MS = _load_cfg("DB_WRITE_BEHIND_MS", 250, int, lambda i: i >= 0, "Write behind window must not be negative")
+UNMUTE_CONCURRENCY = _load_cfg("UNMUTE_CONCURRENCY", 8, int, lambda i: i >= 1, "Unmute concurrency must be at least 1")
+FILELOG_MAX_BYTES = _load_cfg("FILELOG_MAX_BYTES", 1024**3, int, lambda i: i >= 0, "File log budget must not be negative")
+FILELOG_WORKERS = _load_cfg("FILELOG_WORKERS", 4, int, lambda i: i >= 1, "File log workers must be at least 1")
@@ -3,13 +3,32 @@
 
 import importlib
 
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import functools
 import threading
 import warnings
+import time
 import io
 
-from lib_sonnetconfig import DB_TYPE, SQLITE3_LOCATION
+from lib_sonnetconfig import DB_TYPE, SQLITE3_LOCATION, DB_POOL_SIZE, DB_HEALTHCHECK_INTERVAL, DB_WRITE_BEHIND_MS
 
-from typing import Union, Dict, List, Tuple, Optional, Any, Type, Protocol, cast
+from typing import Union, Dict, List, Tuple, Optional, Any, Type, Protocol, Callable, TypeVar, Deque, Sequence, Iterable, Iterator, Generator, Set, cast
+
+_T = TypeVar("_T")
+
+# Pending writes of a previous load are written out before the db handler is reloaded under them
+# This must happen before the old executor is shut down, as flushes run on it
+if (_old_write_queue := globals().get("_write_queue")) is not None:
+    atexit.unregister(_old_write_queue.flush)
+    _old_write_queue.flush()
+# Shut down the executor and health check of a previous load of this module, a reload would otherwise leak them
+if (_old_db_executor := globals().get("_db_executor")) is not None:
+    _old_db_executor.shutdown(wait=False)
+if (_old_health_check_task := globals().get("_health_check_task")) is not None:
+    _old_health_check_task.cancel()
 
 db_handler: Type["_DataBaseHandler"]
 
@@ -18,14 +37,14 @@ if DB_TYPE == "mariadb":
     import lib_mdb_handler
     importlib.reload(lib_mdb_handler)
     import json
-    from lib_mdb_handler import db_handler, db_error
+    from lib_mdb_handler import db_handler, db_error, statement_cache_info
     with open(".login-info.txt", encoding="utf-8") as login_info_file:  # Grab login data
         db_connection_parameters: Any = json.load(login_info_file)
 
 elif DB_TYPE == "sqlite3":
     import lib_sql_handler
     importlib.reload(lib_sql_handler)
-    from lib_sql_handler import db_handler, db_error  # type: ignore[assignment]
+    from lib_sql_handler import db_handler, db_error, statement_cache_info  # type: ignore[assignment]
     db_connection_parameters = SQLITE3_LOCATION
 
 else:
@@ -46,12 +65,18 @@ class _DataBaseHandler(Protocol):
     def make_new_index(self, tablename: str, indexname: str, columns: List[str], /) -> None:
         ...
 
+    def drop_index(self, tablename: str, indexname: str, /) -> None:
+        ...
+
     def make_new_table(self, tablename: str, data: Union[List[Any], Tuple[Any, ...]], /) -> None:
         ...
 
     def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]], /) -> None:
         ...
 
+    def add_many_to_table(self, table: str, columns: Sequence[str], rows: Sequence[Tuple[Any, ...]], /) -> None:
+        ...
+
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]], /) -> int:
         ...
 
@@ -64,12 +89,18 @@ class _DataBaseHandler(Protocol):
     def delete_rows_from_table(self, table: str, column_search: List[Any], /) -> None:
         ...
 
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]], /) -> None:
+        ...
+
     def delete_table(self, table: str, /) -> None:
         ...
 
     def fetch_table(self, table: str, /) -> Tuple[Any, ...]:
         ...
 
+    def iter_rows_from_table(self, table: str, searchparms: List[List[Any]], batchsize: int, /) -> Iterator[Tuple[Any, ...]]:
+        ...
+
     def list_tables(self, searchterm: str, /) -> Tuple[Tuple[str], ...]:
         ...
 
@@ -93,25 +124,440 @@ class DATABASE_FATAL_CONNECTION_LOSS(Exception):
     __slots__ = ()
 
 
-try:
-    db_connection = db_handler(db_connection_parameters)
-except db_error.Error:
-    print("FATAL: DATABASE CONNECTION ERROR")
-    raise DATABASE_FATAL_CONNECTION_LOSS("Database connection failure")
+def _db_connect() -> _DataBaseHandler:  # pytype: disable=invalid-annotation
+    try:
+        return db_handler(db_connection_parameters)
+    except db_error.Error:
+        print("FATAL: DATABASE CONNECTION ERROR")
+        raise DATABASE_FATAL_CONNECTION_LOSS("Database connection failure")
+
+
+# Seconds a checkout waits on an exhausted pool before opening a connection past the pool size anyway
+_CHECKOUT_TIMEOUT = 30
+
+
+class _ConnectionPool:
+    """
+    A bounded pool of database connections, shared by the event loop and the db executor threads
+
+    Shared checkouts are reentrant per thread, nested db_hlapi instances in one thread share a connection (and its transaction)
+    the same way they shared the old global connection, so nesting can never deadlock on a database lock
+    Exclusive checkouts (used by long running exports that hop between executor threads) always get a connection of their own
+
+    At most `size` connections are checked out at once, a checkout past that blocks until one is released (for at most _CHECKOUT_TIMEOUT seconds)
+    Two kinds of checkout never block and may go past `size`: checkouts from a thread running an event loop, as blocking would stall it,
+    and checkouts from a thread that already holds a shared connection, as that thread could otherwise wait on itself
+    At most `size` idle connections are kept open for reuse
+
+    Idle connections are health checked in the background by health_check(), a connection is only pinged on checkout
+    if it has sat idle for longer than the health check interval (ie when no background check is running)
+    """
+
+    __slots__ = "size", "interval", "_idle", "_out", "_lock", "_released", "_local"
+
+    def __init__(self, size: int, interval: float) -> None:
+        self.size = size
+        self.interval = interval
+        # (connection, monotonic time of last use), ordered oldest to newest
+        self._idle: Deque[Tuple[_DataBaseHandler, float]] = collections.deque()
+        # Connections currently checked out
+        self._out = 0
+        # Only ever held for a deque operation or waiting on _released, never across a blocking call or an await
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        # The shared checkout of each thread as [connection, depth]
+        self._local = threading.local()
+
+    def _may_block(self) -> bool:
+        if getattr(self._local, "held", None) is not None:
+            return False
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+
+        return False
+
+    def _checkout(self) -> _DataBaseHandler:
+        block = self._may_block()
+
+        with self._lock:
+            deadline = time.monotonic() + _CHECKOUT_TIMEOUT
+            while block and not self._idle and self._out >= self.size:
+                if (remaining := deadline - time.monotonic()) <= 0 or not self._released.wait(remaining):
+                    # Connections held across awaits (exports) could otherwise starve the executor threads that would release them
+                    print(f"sonnetdb: connection pool exhausted for {_CHECKOUT_TIMEOUT}s, opening a connection past the pool size")
+                    break
+            self._out += 1
+            entry = self._idle.pop() if self._idle else None
+
+        try:
+            if entry is None:
+                connection = _db_connect()
+            else:
+                connection, last_used = entry
+
+                if time.monotonic() - last_used > self.interval:
+                    try:
+                        connection.ping()
+                    except (db_error.Error, db_error.InterfaceError):
+                        connection = _db_connect()
+
+        except BaseException:
+            with self._lock:
+                self._out -= 1
+                self._released.notify()
+            raise
+
+        return connection
+
+    def acquire(self, *, exclusive: bool = False) -> _DataBaseHandler:
+        """
+        Checks out a connection, reusing the most recently used idle connection if there is one
+        This blocks while `size` connections are checked out, unless called from an event loop or while already holding a connection
+
+        :returns: _DataBaseHandler - A database connection
+        :raises: DATABASE_FATAL_CONNECTION_LOSS - Could not connect to the database
+        """
+        if exclusive:
+            return self._checkout()
+
+        held: Optional[List[Any]] = getattr(self._local, "held", None)
+
+        if held is None:
+            held = self._local.held = [self._checkout(), 0]
+
+        held[1] += 1
+        return cast(_DataBaseHandler, held[0])
+
+    def release(self, connection: _DataBaseHandler, *, exclusive: bool = False) -> None:
+        """
+        Returns a checked out connection to the pool, closing it if the pool is already full
+        """
+        if not exclusive:
+            held: List[Any] = self._local.held
+            held[1] -= 1
+            if held[1] > 0:
+                return
+            self._local.held = None
+
+        with self._lock:
+            self._out -= 1
+            self._released.notify()
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+
+        connection.close()
+
+    def health_check(self) -> None:
+        """
+        Pings idle connections that have not been used in the last interval, dropping dead ones
+        This blocks on the database and so should be ran on the db executor
+        """
+        now = time.monotonic()
+
+        for _ in range(self.size):
+            with self._lock:
+                if not self._idle or now - self._idle[0][1] <= self.interval:
+                    return
+                connection, _ = self._idle.popleft()
+
+            try:
+                connection.ping()
+            except (db_error.Error, db_error.InterfaceError):
+                continue
+
+            with self._lock:
+                self._idle.appendleft((connection, now))
+
+
+_pool = _ConnectionPool(DB_POOL_SIZE, DB_HEALTHCHECK_INTERVAL)
+# Connect on load so a bad configuration fails early
+_pool.release(_pool.acquire())
+
+
+def db_grab_connection(*, exclusive: bool = False) -> _DataBaseHandler:  # pytype: disable=invalid-annotation
+    """
+    Checks out a database connection from the connection pool, it must be returned with db_release_connection
+
+    :returns: _DataBaseHandler - A database connection
+    :raises: DATABASE_FATAL_CONNECTION_LOSS - Could not connect to the database
+    """
+    _ensure_health_check()
+    return _pool.acquire(exclusive=exclusive)
+
+
+def db_release_connection(connection: _DataBaseHandler, *, exclusive: bool = False) -> None:
+    """
+    Returns a database connection to the connection pool, exclusive must match how it was grabbed
+    """
+    _pool.release(connection, exclusive=exclusive)
+
+
+# The db executor is only handed plain db_hlapi calls and never touches asyncio objects, keeping it out of the event loop's way
+# sqlite only allows one writer at a time, so extra threads would only contend on the file lock
+_DB_EXECUTOR_WORKERS = DB_POOL_SIZE if DB_TYPE == "mariadb" else 1
+_db_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
 
+def _get_db_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _db_executor
+
+    if _db_executor is None:
+        _db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=_DB_EXECUTOR_WORKERS, thread_name_prefix="sonnetdb")
+
+    return _db_executor
+
+
+async def _health_check_loop(pool: _ConnectionPool) -> None:
+    loop = asyncio.get_running_loop()
+
+    while True:
+        await asyncio.sleep(pool.interval)
+        await loop.run_in_executor(_get_db_executor(), pool.health_check)
+
+
+_health_check_task: "Optional[asyncio.Task[None]]" = None
+
+
+def _ensure_health_check() -> None:
+    """
+    Starts the background health check of the connection pool if an event loop is running in this thread
+    Without an event loop (build tools, the db executor) stale connections are pinged on checkout instead
+    """
+    global _health_check_task
+
+    if _health_check_task is not None and not _health_check_task.done():
+        return
 
-def db_grab_connection() -> _DataBaseHandler:  # pytype: disable=invalid-annotation
-    global db_connection
     try:
-        db_connection.ping()
-        return db_connection
-    except (db_error.Error, db_error.InterfaceError):
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    _health_check_task = loop.create_task(_health_check_loop(_pool))
+
+
+# (columns, values) of a queued row
+_RowT = Tuple[Tuple[str, ...], Tuple[Any, ...]]
+
+
+class _WriteBehindQueue:
+    """
+    Coalesces REPLACE INTO writes into batched executemany transactions
+
+    Rows are keyed by table and primary key, a row written more than once inside one window is only written once (last write wins)
+    Queued rows are written by the db executor `window` seconds after the first write of a batch, and at interpreter exit
+    Writes are only queued while an event loop is running to schedule the flush on, otherwise (build tools) they are written directly
+
+    Point lookups read queued rows directly, anything else must flush() the tables it reads first
+    Flushes are serialized by _flush_lock, and rows being flushed stay readable until they are written
+    Rows flushed into a db_hlapis own transaction are only visible to other connections once that db_hlapi commits
+    """
+
+    __slots__ = "window", "loop", "_pending", "_inflight", "_schemas", "_armed", "_lock", "_flush_lock"
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # table -> primary key -> row
+        self._pending: Dict[str, Dict[Any, _RowT]] = {}
+        self._inflight: Dict[str, Dict[Any, _RowT]] = {}
+        # Schema to create a table with if it does not exist yet
+        self._schemas: Dict[str, List[Any]] = {}
+        self._armed = False
+        # Only ever held for dict operations, never across a blocking call
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _get_loop(self) -> Optional[asyncio.AbstractEventLoop]:
         try:
-            db_connection = db_handler(db_connection_parameters)
-            return db_connection
-        except db_error.Error:
-            print("FATAL: DATABASE CONNECTION ERROR")
-            raise DATABASE_FATAL_CONNECTION_LOSS("Database connection failure")
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+        if self.loop is not None and self.loop.is_running():
+            return self.loop
+
+        return None
+
+    def put(self, table: str, schema: List[Any], key: Any, data: Sequence[Tuple[str, Any]]) -> bool:
+        """
+        Queues a row to be written to table, key must be the rows primary key
+
+        :returns: bool - Whether the row was queued, if False it must be written directly
+        """
+        if self.window <= 0 or (loop := self._get_loop()) is None:
+            return False
+
+        columns = tuple(i[0] for i in data)
+        values = tuple(i[1] for i in data)
+
+        with self._lock:
+            self._pending.setdefault(table, {})[key] = (columns, values)
+            self._schemas[table] = schema
+            arm, self._armed = not self._armed, True
+
+        if arm:
+            loop.call_soon_threadsafe(loop.call_later, self.window, self._flush_in_executor)
+
+        return True
+
+    def _flush_in_executor(self) -> None:
+        # Runs on the event loop
+        with self._lock:
+            self._armed = False
+
+        future = asyncio.get_running_loop().run_in_executor(_get_db_executor(), self._flush_now, (), None)
+        future.add_done_callback(self._flush_done)
+
+    def _flush_done(self, future: "asyncio.Future[None]") -> None:
+        # Runs on the event loop, a failed flush requeued its rows so they are retried next window
+        if future.cancelled() or (e := future.exception()) is None:
+            return
+
+        print(f"sonnetdb: write behind flush failed, retrying in {self.window}s: {type(e).__name__}: {e}")
+
+        with self._lock:
+            arm = bool(self._pending) and not self._armed
+            self._armed = self._armed or arm
+
+        if arm:
+            future.get_loop().call_later(self.window, self._flush_in_executor)
+
+    def get(self, table: str, key: Any) -> Optional[Tuple[Any, ...]]:
+        """
+        Grabs a queued row of table by primary key
+
+        :returns: Optional[Tuple[Any, ...]] - The queued row, or None if it is not queued
+        """
+        if not (self._pending or self._inflight):
+            return None
+
+        with self._lock:
+            for queue in (self._pending, self._inflight):
+                if (rows := queue.get(table)) is not None and (row := rows.get(key)) is not None:
+                    return row[1]
+
+        return None
+
+    def rows(self, table: str) -> Iterator[Tuple[Any, ...]]:
+        """
+        Returns a snapshot of all queued rows of table
+        """
+        if not (self._pending or self._inflight):
+            return iter(())
+
+        with self._lock:
+            return iter([row[1] for queue in (self._pending, self._inflight) for row in queue.get(table, {}).values()])
+
+    def flush(self, *tables: str, connection: Optional[_DataBaseHandler] = None) -> None:
+        """
+        Writes queued rows to the database, only writes rows of the given tables if any are passed
+        This runs inline on the calling thread and waits for any other running flush to finish
+
+        With a connection (a db_hlapi reading its own writes) the rows are written into the callers open transaction and committed with it,
+        so the caller reads them without waiting on the db executor, and its transaction is never committed early
+        Without one, the rows are written and committed on a connection of their own
+
+        :raises: DATABASE_FATAL_CONNECTION_LOSS - Could not connect to the database
+        """
+        self._flush_now(tables, connection)
+
+    async def flush_async(self, *tables: str) -> None:
+        """
+        Awaitable variant of flush that does not block the event loop
+
+        :raises: DATABASE_FATAL_CONNECTION_LOSS - Could not connect to the database
+        """
+        if not (self._pending or self._inflight):
+            return
+
+        await asyncio.get_running_loop().run_in_executor(_get_db_executor(), self._flush_now, tables, None)
+
+    def _flush_now(self, tables: Tuple[str, ...], connection: Optional[_DataBaseHandler]) -> None:
+        if not (self._pending or self._inflight):
+            return
+
+        with self._flush_lock:
+            with self._lock:
+                if tables:
+                    self._inflight = {t: self._pending.pop(t) for t in tables if t in self._pending}
+                else:
+                    self._inflight, self._pending = self._pending, {}
+                batch = self._inflight
+
+            if not batch:
+                return
+
+            try:
+                if connection is not None:
+                    for table, rows in batch.items():
+                        self._write_table(connection, table, rows.values())
+                else:
+                    own = db_grab_connection(exclusive=True)
+                    try:
+                        for table, rows in batch.items():
+                            self._write_table(own, table, rows.values())
+                        own.commit()
+                    finally:
+                        db_release_connection(own, exclusive=True)
+            except BaseException:
+                # Requeue without overwriting anything written since, so a failed flush loses nothing
+                with self._lock:
+                    for table, rows in batch.items():
+                        self._pending[table] = {**rows, **self._pending.get(table, {})}
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+    def _write_table(self, connection: _DataBaseHandler, table: str, rows: Iterable[_RowT]) -> None:
+        # Rows of one table may differ in columns (infraction flags), batch each column set on its own
+        batches: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+        for columns, values in rows:
+            batches.setdefault(columns, []).append(values)
+
+        for columns, batch in batches.items():
+            try:
+                connection.add_many_to_table(table, columns, batch)
+            except db_error.OperationalError as e:
+                if not _is_missing_table(e):
+                    raise
+                connection.make_new_table(table, self._schemas[table])
+                connection.add_many_to_table(table, columns, batch)
+
+
+def _is_missing_table(error: Exception) -> bool:
+    """
+    Returns whether a database error was raised because the table it used does not exist
+    """
+    # mariadb reports ER_NO_SUCH_TABLE, sqlite only reports it in the message
+    return getattr(error, "errno", None) == 1146 or str(error).startswith("no such table")
+
+
+_write_queue = _WriteBehindQueue(DB_WRITE_BEHIND_MS / 1000)
+# Queued writes must never be lost on a clean shutdown
+atexit.register(_write_queue.flush)
+
+# The db version that replaced per guild tables with shared tables that are indexed by guild
+_SHARED_TABLES_VERSION = (2, 0, 0)
+
+
+def _shared_columns(enumname: str, cols: List[Any]) -> List[Any]:
+    """
+    Converts the columns of a per guild table to the columns of its shared table
+    A guildID column is prepended, and joins the primary key if the table has one
+    """
+    shared = [("guildID", int(64), 1) if len(cols[0]) >= 3 else ("guildID", int(64)), *cols]
+
+    # add_infraction writes infraction flags from db version 1.1.0 onwards
+    if enumname == "infractions":
+        shared.append(("flags", int(8)))
+
+    return shared
 
 
 # Define base infraction type
@@ -119,21 +565,39 @@ InfractionT = Tuple[str, str, str, str, str, int]
 # Unused currently, will roll into new apis as DBV1.1 rolls out
 TaggedInfractionT = Tuple[str, str, str, str, str, int, int]
 
-__all__ = ["db_hlapi", "DATABASE_FATAL_CONNECTION_LOSS"]
+__all__ = ["db_hlapi", "async_db_hlapi", "run_in_db_executor", "DATABASE_FATAL_CONNECTION_LOSS", "db_statement_cache_info"]
+
+
+def db_statement_cache_info() -> "functools._CacheInfo":
+    """
+    Returns hit/miss statistics of the database handlers SQL statement cache
+    A low hit rate under normal load means the cache is too small for the number of guild tables in use
+
+    :returns: functools._CacheInfo - hits, misses, maxsize, currsize
+    """
+    return statement_cache_info()
 
 
 # Because being lazy writes good code
 class db_hlapi:
 
-    __slots__ = "_db", "database", "guild", "hlapi_version", "_sonnet_db_version", "__enum_input", "__enum_pool"
+    __slots__ = "_db", "database", "guild", "hlapi_version", "_sonnet_db_version", "_shared", "__enum_input", "__enum_pool", "_released", "_exclusive"
 
-    def __init__(self, guild_id: Optional[int], lock: Optional[threading.Lock] = None) -> None:
-        self._db = db_grab_connection()
+    def __init__(self, guild_id: Optional[int], lock: Optional[threading.Lock] = None, *, exclusive_connection: bool = False) -> None:
+        """
+        Opens a db_hlapi, by default the connection is shared with other db_hlapi instances open in the same thread
+        exclusive_connection checks out a connection of its own, allowing the db_hlapi to be used from different threads
+        """
+        self._exclusive = exclusive_connection
+        self._db = db_grab_connection(exclusive=exclusive_connection)
+        self._released = False
         self.database = self._db  # Deprecated name
         self.guild: Optional[int] = guild_id
 
         self.hlapi_version = (1, 2, 11)
         self._sonnet_db_version = self._get_db_version()
+        # Whether all guilds are stored in shared sonnet_{enum} tables instead of {guild}_{enum} tables
+        self._shared = self._sonnet_db_version >= _SHARED_TABLES_VERSION
 
         if lock is not None:
             warnings.warn("db_hlapi(lock: threading.Lock) is deprecated", DeprecationWarning)
@@ -154,15 +618,16 @@ class db_hlapi:
             if d:
                 ver = [int(i) for i in d[0][1].split(".")]
                 return ver[0], ver[1], ver[2]  # mypy caused this
-            else:
-                self._db.add_to_table("version_info", [["property", "db_version"], ["value", "1.0.0"]])
-                return (1, 0, 0)
         except db_error.OperationalError:
             self._db.make_new_table("version_info", [("property", tuple, 1), ("value", str)])
-            self._db.add_to_table("version_info", [["property", "db_version"], ["value", "1.0.0"]])
-            return (1, 0, 0)
 
-    def _validate_enum(self, schema: List[Tuple[str, Type[Union[str, int]]]]) -> bool:
+        # A database without any guild tables is new and starts out with shared tables, otherwise it predates versioning
+        version = _SHARED_TABLES_VERSION if not self._db.list_tables("%_config") else (1, 0, 0)
+        self._db.add_to_table("version_info", [["property", "db_version"], ["value", ".".join(map(str, version))]])
+        return version
+
+    @staticmethod
+    def _validate_enum(schema: List[Tuple[str, Type[Union[str, int]]]]) -> bool:
         for i in schema:
             if not isinstance(i[0], str) or i[1] not in [str, int]:
                 return False
@@ -204,7 +669,59 @@ class db_hlapi:
                     ))
 
         self.__enum_input[enumname] = schema
-        self.__enum_pool[enumname] = cols
+        self.__enum_pool[enumname] = _shared_columns(enumname, cols) if self._shared else cols
+
+    def _enum_schemas(self) -> Dict[str, List[Any]]:
+        """
+        Returns the table schemas of all registered enums, for use by migrations
+        """
+        return dict(self.__enum_pool)
+
+    def _table(self, enumname: str) -> str:
+        return f"sonnet_{enumname}" if self._shared else f"{self.guild}_{enumname}"
+
+    def _strip(self, enumname: str, row: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        # Shared table rows carry a leading guildID (and infraction flags), which are not part of the enums schema
+        return row[1:1 + len(self.__enum_input[enumname])] if self._shared else row
+
+    def _fetch(self, enumname: str, search: List[List[Any]]) -> Tuple[Any, ...]:
+        """
+        Fetches rows of an enums table for this guild matching all of search, or all rows if search is empty
+
+        :raises: db_error.OperationalError - The table does not exist
+        """
+        if self._shared:
+            rows = self._db.multifetch_rows_from_table(self._table(enumname), [["guildID", self.guild], *search])
+            return tuple(self._strip(enumname, row) for row in rows)
+        elif not search:
+            return self._db.fetch_table(self._table(enumname))
+        elif len(search) == 1:
+            return self._db.fetch_rows_from_table(self._table(enumname), search[0])
+        else:
+            return self._db.multifetch_rows_from_table(self._table(enumname), search)
+
+    def _delete(self, enumname: str, column_search: List[Any]) -> None:
+        """
+        Deletes rows of an enums table for this guild where column column_search[0] has value column_search[1]
+
+        :raises: db_error.OperationalError - The table does not exist
+        """
+        if self._shared:
+            self._db.multidelete_rows_from_table(self._table(enumname), [["guildID", self.guild], column_search])
+        else:
+            self._db.delete_rows_from_table(self._table(enumname), column_search)
+
+    def _pending_row(self, enumname: str, key: Union[str, int]) -> Optional[Tuple[Any, ...]]:
+        # Grabs a row that is queued for writing by its primary key
+        row = _write_queue.get(self._table(enumname), (self.guild, key) if self._shared else key)
+        return self._strip(enumname, row) if row is not None else None
+
+    def _pending_rows(self, enumname: str) -> List[Tuple[Any, ...]]:
+        # Grabs all rows of this guild that are queued for writing
+        rows = _write_queue.rows(self._table(enumname))
+        if self._shared:
+            return [self._strip(enumname, row) for row in rows if row[0] == self.guild]
+        return list(rows)
 
     def grab_enum(self, name: str, cname: Union[str, int]) -> Optional[List[Union[str, int]]]:
         """
@@ -221,8 +738,11 @@ class db_hlapi:
         if not isinstance(cname, self.__enum_input[name][0][1]):
             raise TypeError("grab type does not match enum PK signature")
 
+        if (row := self._pending_row(name, cname)) is not None:
+            return cast(List[Union[str, int]], row)
+
         try:
-            data = self._db.fetch_rows_from_table(f"{self.guild}_{name}", [self.__enum_input[name][0][0], cname])
+            data = self._fetch(name, [[self.__enum_input[name][0][0], cname]])
         except db_error.OperationalError:
             return None
 
@@ -253,11 +773,7 @@ class db_hlapi:
 
         push = tuple(zip(map(lambda i: i[0], self.__enum_input[name]), cpush))
 
-        try:
-            self._db.add_to_table(f"{self.guild}_{name}", push)
-        except db_error.OperationalError:
-            self.create_guild_db()
-            self._db.add_to_table(f"{self.guild}_{name}", push)
+        self._write_row(name, push)
 
     def delete_enum(self, enumname: str, key: Union[str, int]) -> None:
         """
@@ -274,8 +790,10 @@ class db_hlapi:
         if not isinstance(key, self.__enum_input[enumname][0][1]):
             raise TypeError("delete type does not match enum PK signature")
 
+        _write_queue.flush(self._table(enumname), connection=self._db)
+
         try:
-            self._db.delete_rows_from_table(f"{self.guild}_{enumname}", [self.__enum_input[enumname][0][0], key])
+            self._delete(enumname, [self.__enum_input[enumname][0][0], key])
         except db_error.OperationalError:
             pass
 
@@ -288,8 +806,10 @@ class db_hlapi:
         if enumName not in self.__enum_pool:
             raise TypeError(f"Trying to list from table that is not registered ({enumName} not registered)")
 
+        _write_queue.flush(self._table(enumName), connection=self._db)
+
         try:
-            return cast(List[Union[str, int]], [i[0] for i in self._db.fetch_table(f"{self.guild}_{enumName}")])
+            return cast(List[Union[str, int]], [i[0] for i in self._fetch(enumName, [])])
         except db_error.OperationalError:
             return []
 
@@ -316,7 +836,36 @@ class db_hlapi:
         This function is mainly for internal use as db calls will automatically create a db if it does not exist
         """
         for i in self.__enum_pool:
-            self._db.make_new_table(f"{self.guild}_{i}", self.__enum_pool[i])
+            self._db.make_new_table(self._table(i), self.__enum_pool[i])
+
+            # Tables without a primary key still need to find a guilds rows quickly
+            if self._shared and len(self.__enum_pool[i][0]) < 3:
+                self._db.make_new_index(self._table(i), f"{self._table(i)}_guilds", ["guildID"])
+
+        # The mute scheduler loads mutes by end time across all guilds
+        if self._shared:
+            self._db.make_new_index(self._table("mutes"), f"{self._table('mutes')}_end", ["endMute"])
+
+    def _write_row(self, enumname: str, push: Tuple[Tuple[str, Any], ...]) -> None:
+        """
+        Writes a row to an enums table, queueing it on the write behind queue if the table has a primary key to coalesce on
+        """
+        table = self._table(enumname)
+        schema = self.__enum_pool[enumname]
+        key: Any = push[0][1]
+
+        if self._shared:
+            push = (("guildID", self.guild), ) + push
+            key = (self.guild, key)
+
+        if len(schema[0]) >= 3 and _write_queue.put(table, schema, key, push):
+            return
+
+        try:
+            self._db.add_to_table(table, push)
+        except db_error.OperationalError:
+            self.create_guild_db()
+            self._db.add_to_table(table, push)
 
     def grab_config(self, config: str) -> Optional[str]:
         """
@@ -325,8 +874,11 @@ class db_hlapi:
         :returns: Optional[str] - The configuration value
         """
 
+        if (row := self._pending_row("config", config)) is not None:
+            return cast(str, row[1])
+
         try:
-            data: Optional[Tuple[List[Any], ...]] = self._db.fetch_rows_from_table(f"{self.guild}_config", ["property", config])
+            data: Optional[Tuple[List[Any], ...]] = self._fetch("config", [["property", config]])
         except db_error.OperationalError:
             data = None
 
@@ -337,16 +889,14 @@ class db_hlapi:
         Adds a config to the guilds config table
         """
 
-        try:
-            self._db.add_to_table(f"{self.guild}_config", [["property", config], ["value", value]])
-        except db_error.OperationalError:
-            self.create_guild_db()
-            self._db.add_to_table(f"{self.guild}_config", [["property", config], ["value", value]])
+        self._write_row("config", (("property", config), ("value", value)))
 
     def delete_config(self, config: str) -> None:
 
+        _write_queue.flush(self._table("config"), connection=self._db)
+
         try:
-            self._db.delete_rows_from_table(f"{self.guild}_config", ["property", config])
+            self._delete("config", ["property", config])
         except db_error.OperationalError:
             pass
 
@@ -357,8 +907,10 @@ class db_hlapi:
         """
         warnings.warn("grab_user_infractions is Deprecated, use grab_filter_infractions instead", DeprecationWarning)
 
+        _write_queue.flush(self._table("infractions"), connection=self._db)
+
         try:
-            data = self._db.fetch_rows_from_table(f"{self.guild}_infractions", ["userID", userid])
+            data = self._fetch("infractions", [["userID", userid]])
         except db_error.OperationalError:
             data = tuple()
 
@@ -371,8 +923,10 @@ class db_hlapi:
         """
         warnings.warn("grab_moderator_infractions is Deprecated, use grab_filter_infractions instead", DeprecationWarning)
 
+        _write_queue.flush(self._table("infractions"), connection=self._db)
+
         try:
-            data = self._db.fetch_rows_from_table(f"{self.guild}_infractions", ["moderatorID", moderatorid])
+            data = self._fetch("infractions", [["moderatorID", moderatorid]])
         except db_error.OperationalError:
             data = tuple()
 
@@ -398,14 +952,20 @@ class db_hlapi:
         elif automod is True:
             schm.append(["reason", "[AUTOMOD]%", "LIKE"])
 
+        table = self._table("infractions")
+        _write_queue.flush(table, connection=self._db)
+
+        # Shared tables are indexed by guild first
+        guild_cols = ["guildID"] if self._shared else []
+
         try:
             if self._db.TEXT_KEY:
-                self._db.make_new_index(f"{self.guild}_infractions", f"{self.guild}_infractions_users", ["userID"])
-                self._db.make_new_index(f"{self.guild}_infractions", f"{self.guild}_infractions_moderators", ["moderatorID"])
+                self._db.make_new_index(table, f"{table}_users", [*guild_cols, "userID"])
+                self._db.make_new_index(table, f"{table}_moderators", [*guild_cols, "moderatorID"])
             if count:
-                return self._db.multicount_rows_from_table(f"{self.guild}_infractions", schm)
+                return self._db.multicount_rows_from_table(table, [["guildID", self.guild], *schm] if self._shared else schm)
             else:
-                return cast(List[InfractionT], list(self._db.multifetch_rows_from_table(f"{self.guild}_infractions", schm)))
+                return cast(List[InfractionT], list(self._fetch("infractions", schm)))
         except db_error.OperationalError:
             return 0 if count else list()
 
@@ -435,8 +995,11 @@ class db_hlapi:
 
     def grab_infraction(self, infractionID: str) -> Optional[InfractionT]:
 
+        if (row := self._pending_row("infractions", infractionID)) is not None:
+            return cast(InfractionT, row)
+
         try:
-            infraction: Any = self._db.fetch_rows_from_table(f"{self.guild}_infractions", ["infractionID", infractionID])
+            infraction: Any = self._fetch("infractions", [["infractionID", infractionID]])
         except db_error.OperationalError:
             infraction = None
 
@@ -444,26 +1007,26 @@ class db_hlapi:
 
     def delete_infraction(self, infraction_id: str) -> None:
 
+        _write_queue.flush(self._table("infractions"), connection=self._db)
+
         try:
-            self._db.delete_rows_from_table(f"{self.guild}_infractions", ["infractionID", infraction_id])
+            self._delete("infractions", ["infractionID", infraction_id])
         except db_error.OperationalError:
             pass
 
     def mute_user(self, user: int, endtime: int, infractionID: str) -> None:
 
-        try:
-            self._db.add_to_table(f"{self.guild}_mutes", [["infractionID", infractionID], ["userID", user], ["endMute", endtime]])
-        except db_error.OperationalError:
-            self.create_guild_db()
-            self._db.add_to_table(f"{self.guild}_mutes", [["infractionID", infractionID], ["userID", user], ["endMute", endtime]])
+        self._write_row("mutes", (("infractionID", infractionID), ("userID", user), ("endMute", endtime)))
 
     def unmute_user(self, infractionid: Optional[str] = None, userid: Optional[int] = None) -> None:
 
+        _write_queue.flush(self._table("mutes"), connection=self._db)
+
         try:
             if infractionid is not None:
-                self._db.delete_rows_from_table(f"{self.guild}_mutes", ["infractionID", infractionid])
+                self._delete("mutes", ["infractionID", infractionid])
             if userid is not None:
-                self._db.delete_rows_from_table(f"{self.guild}_mutes", ["userid", userid])
+                self._delete("mutes", ["userid", userid])
         except db_error.OperationalError:
             pass
 
@@ -484,14 +1047,49 @@ class db_hlapi:
             "starboard": [["messageID"]]
             }
 
+        self.inject_enum("starboard", [
+            ("messageID", str),
+            ])
+
+        _write_queue.flush(*(self._table(i) for i in dbdict), connection=self._db)
+
         for i in ["config", "infractions", "starboard", "mutes"]:
             try:
-                dbdict[i].extend(self._db.fetch_table(f"{self.guild}_{i}"))
+                dbdict[i].extend(self._fetch(i, []))
             except db_error.OperationalError:
                 pass
 
         return dbdict
 
+    def iter_guild_db(self, batchsize: int = 1000) -> Generator[Tuple[str, List[str], Tuple[Tuple[Union[str, int], ...], ...]], None, None]:
+        """
+        Streams a guilds database with a cursor, so the database is never held in memory at once
+        Holds a cursor open between batches, so it should only be used with an exclusive connection
+
+        :returns: Generator[Tuple[str, List[str], Tuple[Tuple[Union[str, int], ...], ...]], None, None] - Batches of at most batchsize rows as (table name, column names, rows)
+        """
+
+        columns: Dict[str, List[str]] = {
+            "config": ["property", "value"],
+            "infractions": ["infractionID", "userID", "moderatorID", "type", "reason", "timestamp"],
+            "mutes": ["infractionID", "userID", "endMute"],
+            "starboard": ["messageID"]
+            }
+
+        self.inject_enum("starboard", [
+            ("messageID", str),
+            ])
+
+        _write_queue.flush(*(self._table(i) for i in columns), connection=self._db)
+
+        for i in ["config", "infractions", "starboard", "mutes"]:
+            search = [["guildID", self.guild]] if self._shared else []
+            try:
+                for rows in self._db.iter_rows_from_table(self._table(i), search, batchsize):
+                    yield i, columns[i], tuple(self._strip(i, row) for row in rows)
+            except db_error.OperationalError:
+                pass
+
     def full_download_guild_db(self) -> Dict[str, List[List[Union[str, int]]]]:
         """
         full_download_guild_db downloads an entire database including custom enum tables
@@ -503,44 +1101,89 @@ class db_hlapi:
         """
         return self.download_guild_db()
 
-    def upload_guild_db(self, dbdict: Dict[str, List[List[Any]]]) -> bool:
+    def upload_guild_db(self, dbdict: Dict[str, List[List[Any]]], *, chunk_size: int = 10000, rebuild_indexes: bool = False, progress: Optional[Callable[[str, int, float], None]] = None) -> bool:
         """
         Uploads a guilds database from a db hashmap
 
+        Every table is checked against its schema before anything is written, then rows are written with executemany,
+        committing every chunk_size rows so a large import does not build one huge transaction
+        rebuild_indexes drops the guilds infraction indexes during the import and rebuilds them after,
+        it does nothing on shared tables as their indexes are used by every guild
+        progress is called after every chunk with (table name, rows written of that table, rows per second)
+
         If you are uploading a db with custom enums you must inject those enums before uploading
+
+        :returns: bool - False if a table does not match its schema or a write failed
         """
 
         self.inject_enum("starboard", [
             ("messageID", str),
             ])
 
-        reimport = {
-            "config": [["property", "value"]],
-            "infractions": [["infractionID", "userID", "moderatorID", "type", "reason", "timestamp"]],
-            "mutes": [["infractionID", "userID", "endMute"]],
-            "starboard": [["messageID"]]
+        columns: Dict[str, List[str]] = {
+            "config": ["property", "value"],
+            "infractions": ["infractionID", "userID", "moderatorID", "type", "reason", "timestamp"],
+            "mutes": ["infractionID", "userID", "endMute"],
+            "starboard": ["messageID"]
             }
 
-        for i in reimport.keys():
+        # The first row of a table is its column names, which must match if they are there
+        for i in columns:
             if i in dbdict:
-                reimport[i].extend(dbdict[i][1:])
+                if dbdict[i] and dbdict[i][0] != columns[i]:
+                    return False
+                if any(len(row) != len(columns[i]) for row in dbdict[i][1:]):
+                    return False
 
         self.create_guild_db()
+        _write_queue.flush(*(self._table(i) for i in columns), connection=self._db)
 
-        for i in reimport.keys():
-            for row in reimport[i][1:]:
-                try:
-                    self._db.add_to_table(f"{self.guild}_{i}", tuple(zip(reimport[i][0], row)))
-                except db_error.OperationalError:
-                    return False
+        # Shared tables need every row tagged with its guild
+        guild_cols = ["guildID"] if self._shared else []
+        guild_vals = (self.guild, ) if self._shared else ()
+
+        indexes: List[Tuple[str, str, List[str]]] = []
+        if rebuild_indexes and not self._shared:
+            table = self._table("infractions")
+            indexes = [(table, f"{table}_users", ["userID"]), (table, f"{table}_moderators", ["moderatorID"])]
+
+        try:
+            for table, index, _ in indexes:
+                self._db.drop_index(table, index)
+
+            for i in columns:
+                rows = dbdict.get(i, [])[1:]
+                table = self._table(i)
+                start = time.monotonic()
+
+                for chunk in range(0, len(rows), chunk_size):
+                    self._db.add_many_to_table(table, (*guild_cols, *columns[i]), [(*guild_vals, *row) for row in rows[chunk:chunk + chunk_size]])
+                    self._db.commit()
+
+                    if progress is not None:
+                        written = min(chunk + chunk_size, len(rows))
+                        progress(i, written, written / max(time.monotonic() - start, 1e-9))
+
+            # Rebuilt with one pass over the table instead of growing them a row at a time
+            if self._db.TEXT_KEY:
+                for table, index, cols in indexes:
+                    self._db.make_new_index(table, index, cols)
+
+        except db_error.OperationalError:
+            return False
 
         return True
 
     def delete_guild_db(self) -> None:
 
+        _write_queue.flush(*(self._table(i) for i in ["config", "infractions", "starboard", "mutes"]), connection=self._db)
+
         for i in ["config", "infractions", "starboard", "mutes"]:
             try:
-                self._db.delete_table(f"{self.guild}_{i}")
+                if self._shared:
+                    self._db.multidelete_rows_from_table(self._table(i), [["guildID", self.guild]])
+                else:
+                    self._db.delete_table(self._table(i))
             except db_error.OperationalError:
                 pass
 
@@ -549,19 +1192,13 @@ class db_hlapi:
         quer: Tuple[Tuple[str, Union[str, int]], ...]
         quer = tuple(zip(("infractionID", "userID", "moderatorID", "type", "reason", "timestamp"), (infraction_id, user_id, moderator_id, itype, reason, timestamp)))
 
-        table_name = f"{self.guild}_infractions"
-
         # TODO(ultrabear): Make all infraction grabbing functions check version and MAINTAIN SAME API
         # New functions need to be coded to get full flags data
         if self._sonnet_db_version >= (1, 1, 0):
             # Tuples have fixed length :cry:
             quer = quer + (("flags", int(automod)), )
 
-        try:
-            self._db.add_to_table(table_name, quer)
-        except db_error.OperationalError:
-            self.create_guild_db()
-            self._db.add_to_table(table_name, quer)
+        self._write_row("infractions", quer)
 
     def fetch_all_mutes(self) -> List[Tuple[str, str, str, int]]:
         """
@@ -571,10 +1208,21 @@ class db_hlapi:
         :returns: List[Tuple[str, str, str, int]] - Guild, InfractionID, UserId, Time to be unmuted
         """
 
+        _write_queue.flush(connection=self._db)
+
+        mute_table: List[Tuple[str, str, str, int]] = []
+
+        if self._shared:
+            try:
+                for row in self._db.fetch_table(self._table("mutes")):
+                    mute_table.append((str(row[0]), str(row[1]), str(row[2]), int(row[3])))
+            except db_error.OperationalError:
+                pass
+            return mute_table
+
         # Grab list of tables
         guild_list: Tuple[Tuple[str], ...] = self._db.list_tables("%_mutes")
 
-        mute_table: List[Tuple[str, str, str, int]] = []
         for i in guild_list:
             guild_id = str(i[0][:-6])
             for row in self._db.fetch_table(i[0]):
@@ -584,6 +1232,32 @@ class db_hlapi:
 
         return mute_table
 
+    def fetch_due_mutes(self, after: int, until: int) -> List[Tuple[str, str, str, int]]:
+        """
+        Fetches timed mutes across all guilds that end after `after` and no later than `until`
+        On shared tables this is an index range scan over endMute, so it only costs the mutes returned
+        Not meant to be used in guild scope commands, only by the mute scheduler
+
+        :returns: List[Tuple[str, str, str, int]] - Guild, InfractionID, UserId, Time to be unmuted
+        """
+
+        # endMute 0 marks a mute that never ends
+        after = max(after, 0)
+
+        if not self._shared:
+            return [i for i in self.fetch_all_mutes() if after < i[3] <= until]
+
+        table = self._table("mutes")
+        _write_queue.flush(table, connection=self._db)
+
+        try:
+            self._db.make_new_index(table, f"{table}_end", ["endMute"])
+            rows = self._db.multifetch_rows_from_table(table, [["endMute", after, ">"], ["endMute", until, "<="]])
+        except db_error.OperationalError:
+            return []
+
+        return [(str(row[0]), str(row[1]), str(row[2]), int(row[3])) for row in rows]
+
     def is_muted(self, userid: Optional[int] = None, infractionid: Optional[str] = None) -> bool:
         """
         Queries whether the userid or infractionid is in the mute database
@@ -592,11 +1266,16 @@ class db_hlapi:
         :returns: bool - Whether the user is muted or not
         """
 
+        if userid is not None and any(str(row[1]) == str(userid) for row in self._pending_rows("mutes")):
+            return True
+        elif userid is None and infractionid is not None and self._pending_row("mutes", infractionid) is not None:
+            return True
+
         try:
             if userid is not None:
-                muted = bool(self._db.fetch_rows_from_table(f"{self.guild}_mutes", ["userID", userid]))
+                muted = bool(self._fetch("mutes", [["userID", userid]]))
             elif infractionid is not None:
-                muted = bool(self._db.fetch_rows_from_table(f"{self.guild}_mutes", ["infractionID", infractionid]))
+                muted = bool(self._fetch("mutes", [["infractionID", infractionid]]))
             else:
                 raise TypeError("Must specify either a userid or infractionid")
         except db_error.OperationalError:
@@ -611,15 +1290,29 @@ class db_hlapi:
 
         :returns: List[Tuple[str, str, int]] - InfractionID, UserId, Unmute Time
         """
-        mutetable = list(self._db.fetch_table(f"{self.guild}_mutes"))
+
+        _write_queue.flush(self._table("mutes"), connection=self._db)
+        mutetable = list(self._fetch("mutes", []))
 
         return mutetable
 
+    def commit(self) -> None:
+        """
+        Commits pending changes without returning the connection to the pool
+        """
+        self._db.commit()
+
     def close(self) -> None:
+        """
+        Commits pending changes and returns the connection to the pool, the db_hlapi must not be used afterwards
+        """
         self._db.commit()
+        if not self._released:
+            self._released = True
+            db_release_connection(self._db, exclusive=self._exclusive)
 
     def __exit__(self, err_type: Optional[Type[Exception]], err_value: Optional[str], err_traceback: Any) -> None:
-        self._db.commit()
+        self.close()
 
 
 class _enum_context:
@@ -655,3 +1348,295 @@ class _enum_context:
         self._hlapi.list_enum.__doc__
 
         return self._hlapi.list_enum(self._name)
+
+
+async def run_in_db_executor(func: Callable[..., _T], *args: Any) -> _T:
+    """
+    Runs a blocking function on the db executor, for database work that does not fit async_db_hlapi calls (such as holding a cursor open)
+    func must not touch asyncio or discord objects
+
+    :returns: _T - The return value of func
+    """
+    return await asyncio.get_running_loop().run_in_executor(_get_db_executor(), func, *args)
+
+
+class async_db_hlapi:
+    """
+    An awaitable variant of db_hlapi that runs all database work on the db executor, so slow queries never stall the event loop
+
+    It exposes the same method surface as db_hlapi, with every call being a coroutine:
+        async with async_db_hlapi(guild_id) as db:
+            prefix = await db.grab_config("prefix")
+
+    Each awaited call checks out a connection from the pool and is committed as its own transaction,
+    so no connection or database lock is held across an await
+    Existing db_hlapi code can be migrated a block at a time by passing a function to run()
+    """
+
+    __slots__ = "guild", "_entered", "_enums"
+
+    def __init__(self, guild_id: Optional[int]) -> None:
+        self.guild: Optional[int] = guild_id
+        self._entered = False
+        # Enums injected into this async_db_hlapi, replayed into the db_hlapi of every call
+        self._enums: List[Tuple[str, List[Tuple[str, Type[Union[str, int]]]], bool]] = []
+
+    async def __aenter__(self) -> "async_db_hlapi":
+        self._entered = True
+        return self
+
+    async def __aexit__(self, err_type: Optional[Type[Exception]], err_value: Optional[str], err_traceback: Any) -> None:
+        self._entered = False
+
+    def _transaction(self, func: Callable[..., _T], *args: Any) -> _T:
+        # Runs on the executor thread, closing the db_hlapi commits and returns its connection to the pool
+        with db_hlapi(self.guild) as hlapi:
+            for enumname, schema, use_primary in self._enums:
+                hlapi.inject_enum(enumname, schema, use_primary=use_primary)
+            return func(hlapi, *args)
+
+    async def run(self, func: Callable[..., _T], *args: Any) -> _T:
+        """
+        Runs func(db, *args) on the db executor thread with a synchronous db_hlapi as db, committing afterwards
+        This is the migration path for existing db_hlapi blocks, func must not touch asyncio or discord objects
+        A connection is only checked out for the duration of the call, waiting on the executor if the pool is exhausted
+
+        :returns: _T - The return value of func
+        :raises: RuntimeError - The async_db_hlapi was used outside of its async with block
+        """
+        if not self._entered:
+            raise RuntimeError("async_db_hlapi used outside of async with block")
+
+        return await asyncio.get_running_loop().run_in_executor(_get_db_executor(), functools.partial(self._transaction, func, *args))
+
+    def inject_enum(self, enumname: str, schema: List[Tuple[str, Type[Union[str, int]]]], *, use_primary: bool = True) -> None:
+        """
+        Add a custom table schema to the database, this does not touch the database and so is not a coroutine
+
+        :raises: TypeError - The schema passed is not valid
+        :raises: RuntimeError - The async_db_hlapi was used outside of its async with block
+        """
+        if not self._entered:
+            raise RuntimeError("async_db_hlapi used outside of async with block")
+
+        if not db_hlapi._validate_enum(schema):
+            raise TypeError("Invalid schema passed")
+
+        self._enums.append((enumname, schema, use_primary))
+
+    async def grab_enum(self, name: str, cname: Union[str, int]) -> Optional[List[Union[str, int]]]:
+        return await self.run(db_hlapi.grab_enum, name, cname)
+
+    async def set_enum(self, name: str, cpush: List[Union[str, int]]) -> None:
+        return await self.run(db_hlapi.set_enum, name, cpush)
+
+    async def delete_enum(self, enumname: str, key: Union[str, int]) -> None:
+        return await self.run(db_hlapi.delete_enum, enumname, key)
+
+    async def list_enum(self, enumName: str) -> List[Union[str, int]]:
+        return await self.run(db_hlapi.list_enum, enumName)
+
+    def enum_context(self, enumName: str) -> "_async_enum_context":
+        """
+        Returns an async context manager to access db_enums functions in a safer and more concise way
+
+        :returns: _async_enum_context - An async enum context manager
+        """
+        return _async_enum_context(self, enumName)
+
+    def inject_enum_context(self, enumName: str, schema: List[Tuple[str, Type[Union[str, int]]]], *, use_primary: bool = True) -> "_async_enum_context":
+        """
+        A combination of inject_enum and enum_context that returns an async enum context of the just injected enum
+
+        :returns: _async_enum_context - An async enum context manager
+        """
+        self.inject_enum(enumName, schema, use_primary=use_primary)
+        return _async_enum_context(self, enumName)
+
+    async def create_guild_db(self) -> None:
+        return await self.run(db_hlapi.create_guild_db)
+
+    async def grab_config(self, config: str) -> Optional[str]:
+        return await self.run(db_hlapi.grab_config, config)
+
+    async def add_config(self, config: str, value: str) -> None:
+        return await self.run(db_hlapi.add_config, config, value)
+
+    async def delete_config(self, config: str) -> None:
+        return await self.run(db_hlapi.delete_config, config)
+
+    async def grab_filter_infractions(self,
+                                      user: Optional[int] = None,
+                                      moderator: Optional[int] = None,
+                                      itype: Optional[str] = None,
+                                      automod: Optional[bool] = None,
+                                      count: bool = False) -> Union[List[InfractionT], int]:
+        return await self.run(db_hlapi.grab_filter_infractions, user, moderator, itype, automod, count)
+
+    async def grab_infraction(self, infractionID: str) -> Optional[InfractionT]:
+        return await self.run(db_hlapi.grab_infraction, infractionID)
+
+    async def delete_infraction(self, infraction_id: str) -> None:
+        return await self.run(db_hlapi.delete_infraction, infraction_id)
+
+    async def add_infraction(self, infraction_id: str, user_id: str, moderator_id: str, itype: str, reason: str, timestamp: int, automod: bool = False) -> None:
+        return await self.run(db_hlapi.add_infraction, infraction_id, user_id, moderator_id, itype, reason, timestamp, automod)
+
+    async def mute_user(self, user: int, endtime: int, infractionID: str) -> None:
+        return await self.run(db_hlapi.mute_user, user, endtime, infractionID)
+
+    async def unmute_user(self, infractionid: Optional[str] = None, userid: Optional[int] = None) -> None:
+        return await self.run(db_hlapi.unmute_user, infractionid, userid)
+
+    async def is_muted(self, userid: Optional[int] = None, infractionid: Optional[str] = None) -> bool:
+        return await self.run(db_hlapi.is_muted, userid, infractionid)
+
+    async def fetch_guild_mutes(self) -> List[Tuple[str, str, int]]:
+        return await self.run(db_hlapi.fetch_guild_mutes)
+
+    async def fetch_all_mutes(self) -> List[Tuple[str, str, str, int]]:
+        return await self.run(db_hlapi.fetch_all_mutes)
+
+    async def fetch_due_mutes(self, after: int, until: int) -> List[Tuple[str, str, str, int]]:
+        return await self.run(db_hlapi.fetch_due_mutes, after, until)
+
+    async def download_guild_db(self) -> Dict[str, List[List[Union[str, int]]]]:
+        return await self.run(db_hlapi.download_guild_db)
+
+    async def full_download_guild_db(self) -> Dict[str, List[List[Union[str, int]]]]:
+        return await self.run(db_hlapi.full_download_guild_db)
+
+    async def upload_guild_db(
+        self, dbdict: Dict[str, List[List[Any]]], *, chunk_size: int = 10000, rebuild_indexes: bool = False, progress: Optional[Callable[[str, int, float], None]] = None
+        ) -> bool:
+        # progress is called from the db executor thread, so it must not touch asyncio or discord objects
+        return await self.run(functools.partial(db_hlapi.upload_guild_db, chunk_size=chunk_size, rebuild_indexes=rebuild_indexes, progress=progress), dbdict)
+
+    async def delete_guild_db(self) -> None:
+        return await self.run(db_hlapi.delete_guild_db)
+
+
+class _async_enum_context:
+    __slots__ = "_hlapi", "_name"
+
+    def __init__(self, hlapi: async_db_hlapi, enum_name: str) -> None:
+
+        self._hlapi: async_db_hlapi = hlapi
+        self._name: str = enum_name
+
+    async def __aenter__(self) -> "_async_enum_context":
+        return self
+
+    async def __aexit__(self, err_type: Optional[Type[Exception]], err_value: Optional[str], err_traceback: Any) -> None:
+        return
+
+    async def grab(self, name: Union[str, int]) -> Optional[List[Union[str, int]]]:
+        return await self._hlapi.grab_enum(self._name, name)
+
+    async def set(self, cpush: List[Union[str, int]]) -> None:
+        return await self._hlapi.set_enum(self._name, cpush)
+
+    async def delete(self, name: Union[str, int]) -> None:
+        return await self._hlapi.delete_enum(self._name, name)
+
+    async def list(self) -> List[Union[str, int]]:
+        return await self._hlapi.list_enum(self._name)
+
+
+def _guild_tables(connection: _DataBaseHandler) -> Iterator[Tuple[str, int, str]]:
+    # Yields (table, guild, enum name) of every {guild}_{enum} table
+    for (table, ) in connection.list_tables("%"):
+        guild, sep, name = table.partition("_")
+        if sep and name and guild.isdigit():
+            yield table, int(guild), name
+
+
+def _copy_guild_tables(connection: _DataBaseHandler, schemas: Dict[str, List[Any]], copied_rows: Set[int]) -> int:
+    """
+    Copies every {guild}_{enum} table into its shared table, returning the amount of rows copied
+    Only rows that are new or changed since the last copy (tracked by hash in copied_rows) are written,
+    so a resync never restores a row that was deleted from a shared table after it was first copied
+    """
+    copied = 0
+
+    for table, guild, name in _guild_tables(connection):
+        # A table of an unregistered enum created after the migration started, see migrate_to_shared_tables
+        if name not in schemas:
+            continue
+
+        names = [col[0] for col in schemas[name]]
+
+        # Rows of one table may differ in length (infraction flags), batch each length on its own
+        batches: Dict[int, List[Tuple[Any, ...]]] = {}
+        for row in connection.fetch_table(table):
+            if (digest := hash((table, *row))) in copied_rows:
+                continue
+            copied_rows.add(digest)
+            batches.setdefault(len(row), []).append((guild, *row))
+
+        for length, rows in batches.items():
+            connection.add_many_to_table(f"sonnet_{name}", names[:length + 1], rows)
+            copied += len(rows)
+
+    return copied
+
+
+def migrate_to_shared_tables(*, drop_old: bool = False, resync_delay: float = 5.0, inject: Optional[Callable[[db_hlapi], None]] = None) -> Optional[int]:
+    """
+    Migrates a database of per guild tables (db version 1.x) to shared tables indexed by guild (db version 2.0.0)
+
+    This is safe to run while sonnet is online: rows are copied into the shared tables, then the db version is flipped
+    so every new db_hlapi uses the shared tables, then after resync_delay seconds (enough for open db_hlapi instances
+    and queued writes of running bots to finish) rows that were added or changed in the old tables meanwhile are copied again
+    Rows deleted from the old tables during the migration may be restored by the copy, rows deleted from the shared tables are not
+
+    Every {guild}_{enum} table is migrated, so enums registered by other modules must be passed in with inject,
+    a function that registers them on the db_hlapi of the migration with inject_enum
+
+    :returns: Optional[int] - The amount of rows copied (counting the resync), None if the database was already migrated
+    :raises: DATABASE_FATAL_CONNECTION_LOSS - Could not connect to the database
+    :raises: RuntimeError - The database has guild tables of enums that were not registered, nothing was migrated
+    """
+
+    with db_hlapi(None) as db:
+        if db._sonnet_db_version >= _SHARED_TABLES_VERSION:
+            return None
+
+        db.inject_enum("starboard", [
+            ("messageID", str),
+            ])
+        if inject is not None:
+            inject(db)
+        schemas = {name: _shared_columns(name, cols) for name, cols in db._enum_schemas().items()}
+
+        # Migrating only known tables would leave the data of unknown ones unreachable once the version flips
+        if unknown := sorted({name for _, _, name in _guild_tables(db._db)} - schemas.keys()):
+            raise RuntimeError(f"Guild tables of unregistered enums would not be migrated ({', '.join(unknown)}), register them with inject")
+
+    _write_queue.flush()
+
+    connection = db_grab_connection(exclusive=True)
+    try:
+        for name, schema in schemas.items():
+            connection.make_new_table(f"sonnet_{name}", schema)
+
+        copied_rows: Set[int] = set()
+        copied = _copy_guild_tables(connection, schemas, copied_rows)
+        connection.add_to_table("version_info", [["property", "db_version"], ["value", ".".join(map(str, _SHARED_TABLES_VERSION))]])
+        connection.commit()
+
+        time.sleep(resync_delay)
+
+        copied += _copy_guild_tables(connection, schemas, copied_rows)
+        connection.commit()
+
+        if drop_old:
+            for table, _, name in list(_guild_tables(connection)):
+                if name in schemas:
+                    connection.delete_table(table)
+            connection.commit()
+
+    finally:
+        db_release_connection(connection, exclusive=True)
+
+    return copied
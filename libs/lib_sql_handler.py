@@ -3,7 +3,8 @@
 
 import sqlite3
 import io
-from typing import List, Tuple, Any, Union
+import functools
+from typing import List, Tuple, Any, Union, Sequence, Iterator
 
 
 class db_error:  # DB error codes
@@ -12,6 +13,41 @@ class db_error:  # DB error codes
     Error = sqlite3.Error
 
 
+def _search_key(searchparms: Sequence[Sequence[Any]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    return tuple(i[0] for i in searchparms), tuple(i[2] if len(i) > 2 else '=' for i in searchparms)
+
+
+# Statements only depend on the table, columns and operators used, so they are built (and checked) once and then reused
+@functools.lru_cache(maxsize=4096)
+def _statement(operation: str, table: str, columns: Tuple[str, ...] = (), operators: Tuple[str, ...] = ()) -> str:
+
+    # Test for attack
+    if "\\" in table or "'" in table:
+        raise db_error.OperationalError("Detected SQL injection attack")
+
+    if operation == "replace":
+        return f"REPLACE INTO '{table}' ({', '.join(columns)})\nVALUES ({', '.join('?' for _ in columns)})\n"
+    elif operation == "count":
+        return f"SELECT COUNT(*) FROM '{table}' WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "select":
+        return f"SELECT * FROM '{table}' WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "delete":
+        return f"DELETE FROM '{table}' WHERE " + " AND ".join(f"({c} {o} ?)" for c, o in zip(columns, operators))
+    elif operation == "drop":
+        return f"DROP TABLE IF EXISTS '{table}';"
+    elif operation == "fetch":
+        return f"SELECT * FROM '{table}';"
+
+    raise ValueError(f"Unknown statement operation {operation}")
+
+
+def statement_cache_info() -> "functools._CacheInfo":
+    """
+    Returns hit/miss statistics of the statement cache, for tuning its size
+    """
+    return _statement.cache_info()
+
+
 class db_handler:
 
     __slots__ = "con", "cur", "closed"
@@ -19,7 +55,8 @@ class db_handler:
     TEXT_KEY = True
 
     def __init__(self, db_location: str) -> None:
-        self.con = sqlite3.connect(db_location)
+        # Connections are pooled and may be handed between threads, but are never used by two threads at once
+        self.con = sqlite3.connect(db_location, check_same_thread=False)
         self.cur = self.con.cursor()
         self.closed: bool = False
 
@@ -40,6 +77,14 @@ class db_handler:
 
         self.cur.execute(db_inputStr)
 
+    def drop_index(self, tablename: str, indexname: str) -> None:
+
+        # Test for attack
+        if "\\" in indexname or "'" in indexname:
+            raise db_error.OperationalError("Detected SQL injection attack")
+
+        self.cur.execute(f"DROP INDEX IF EXISTS '{indexname}'")
+
     def make_new_table(self, tablename: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
 
         # Load hashmap of python datatypes to SQLite3 datatypes
@@ -73,14 +118,18 @@ class db_handler:
         db_inputBuilder = io.StringIO()
         db_inputBuilder.write(f"CREATE TABLE IF NOT EXISTS '{tablename}' (")
 
-        # Parse through table items, item with 3 entries is primary key
+        # Parse through table items, item with 3 entries is primary key, more than one makes a composite primary key
+        primary = [i[0] for i in data if len(i) >= 3 and i[2] == 1]
         inlist = []
         for i in data:
-            if len(i) >= 3 and i[2] == 1:
+            if len(primary) == 1 and i[0] in primary:
                 inlist.append(f"{i[0]} {datamap[i[1]]} PRIMARY KEY")
             else:
                 inlist.append(f"{i[0]} {datamap[i[1]]}")
 
+        if len(primary) > 1:
+            inlist.append(f"PRIMARY KEY ({', '.join(primary)})")
+
         # Add parsed inputs to inputStr
         db_inputBuilder.write(", ".join(inlist))
         db_inputBuilder.write(")")
@@ -90,118 +139,71 @@ class db_handler:
 
     def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add insert data and generate base tables
-        db_inputBuilder.write(f"REPLACE INTO '{table}' (")
-        db_inputList = []
+        self.cur.execute(_statement("replace", table, tuple(i[0] for i in data)), tuple(i[1] for i in data))
 
-        db_inputBuilder.write(", ".join(i[0] for i in data))
-        db_inputBuilder.write(")\n")
+    def add_many_to_table(self, table: str, columns: Sequence[str], rows: Sequence[Tuple[Any, ...]]) -> None:
 
-        # Insert values data
-        db_inputBuilder.write("VALUES (")
-        db_inputBuilder.write(", ".join("?" for _ in data))
-        db_inputBuilder.write(")\n")
-
-        db_inputList.extend([i[1] for i in data])
-
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.executemany(_statement("replace", table, tuple(columns)), rows)
 
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> int:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT COUNT(*) FROM '{table}' WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_statement("count", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
         retval: int = tuple(self.cur.fetchall())[0][0]
         return retval
 
     def fetch_rows_from_table(self, table: str, search: List[Any]) -> Tuple[Any, ...]:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        # Add SELECT data
-        db_inputStr = f"SELECT * FROM '{table}' WHERE {search[0]} {search[2] if len(search) > 2 else '='} ?"
-        db_inputList = [search[1]]
-
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_statement("select", table, *_search_key((search, ))), (search[1], ))
 
         return tuple(self.cur.fetchall())
 
     def multifetch_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> Tuple[Any, ...]:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT * FROM '{table}' WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_statement("select", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
         return tuple(self.cur.fetchall())
 
     # deletes rows from table where column i[0] has value i[1]
     def delete_rows_from_table(self, table: str, column_search: List[Any]) -> None:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
+        self.cur.execute(_statement("delete", table, (column_search[0], ), ("=", )), (column_search[1], ))
 
-        # Do deletion setup
-        db_inputStr = f"DELETE FROM '{table}' WHERE {column_search[0]}=?"
-        db_inputList = [column_search[1]]
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> None:
 
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_statement("delete", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
 
     def delete_table(self, table: str) -> None:  # drops the table specified
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        self.cur.execute(f"DROP TABLE IF EXISTS '{table}';")
+        self.cur.execute(_statement("drop", table))
 
     def fetch_table(self, table: str) -> Tuple[Any, ...]:  # Fetches a full table
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        self.cur.execute(f"SELECT * FROM '{table}';")
+        self.cur.execute(_statement("fetch", table))
 
         # Send data
         return tuple(self.cur.fetchall())
 
+    def iter_rows_from_table(self, table: str, searchparms: List[List[Any]], batchsize: int) -> Iterator[Tuple[Any, ...]]:
+
+        # A cursor of its own, so statements run between batches do not reset it
+        cur = self.con.cursor()
+
+        try:
+            if searchparms:
+                cur.execute(_statement("select", table, *_search_key(searchparms)), tuple(i[1] for i in searchparms))
+            else:
+                cur.execute(_statement("fetch", table))
+
+            while rows := cur.fetchmany(batchsize):
+                yield tuple(rows)
+        finally:
+            cur.close()
+
     def list_tables(self, searchterm: str) -> Tuple[Tuple[str], ...]:
 
-        self.cur.execute("SELECT name FROM sqlite_master WHERE name LIKE ?;", (searchterm, ))
+        # sqlite_master also lists indexes, which share the naming scheme of the tables they index
+        self.cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?;", (searchterm, ))
 
         # Send data
         return tuple(self.cur.fetchall())
@@ -4,14 +4,17 @@
 # Ultrabear 2021
 
 import importlib
+import functools
 
 import discord
 
 from lib_parsers import generate_reply_field
 from lib_sonnetconfig import STARBOARD_EMOJI, STARBOARD_COUNT, REGEX_VERSION
 from lib_compatibility import user_avatar_url
+from lib_db_obfuscator import db_hlapi
+import lib_lexdpyk_h as lexdpyk
 
-from typing import Dict, Union, Any
+from typing import Dict, Set, Union, Any, cast
 
 # Import re here to trick type checker into using re stubs even if importlib grabs re2, they (should) have the same stubs
 import re
@@ -59,3 +62,48 @@ async def build_starboard_embed(message: discord.Message) -> discord.Embed:
     starboard_embed.set_footer(text=f"#{message.channel}")
 
     return starboard_embed
+
+
+class StarredIndex:
+    """
+    An in memory set of the message ids in a guilds starboard table
+
+    It is warmed from the db with one query the first time it is used, and every starboarded message is added to it,
+    so checking whether a message was already starboarded never touches the db after that
+    """
+    __slots__ = "guild_id", "_ids"
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+        self._ids: Set[int] = set()
+
+        with db_hlapi(guild_id) as db:
+            db.inject_enum("starboard", [("messageID", str)])
+            # The database is not trusted, rows that are not message ids can never match a message and are skipped
+            self._ids.update(int(i) for i in db.list_enum("starboard") if str(i).isdecimal())
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._ids
+
+    def add(self, message_id: int) -> None:
+        """
+        Marks a message as starboarded, writing it to the db
+        """
+        self._ids.add(message_id)
+
+        with db_hlapi(self.guild_id) as db:
+            db.inject_enum("starboard", [("messageID", str)])
+            db.set_enum("starboard", [str(message_id)])
+
+
+def load_starred_index(guild_id: int, ramfs: lexdpyk.ram_filesystem) -> StarredIndex:
+    """
+    Grabs a guilds starred index from the ramfs, warming it from the db if it does not exist
+    The index lives in the guilds caches so a cache purge (such as after a db upload) rewarms it
+
+    :returns: StarredIndex -- The index
+    """
+    try:
+        return cast(StarredIndex, ramfs.read_f(dirlist=[str(guild_id), "caches", "starboard_index"]))
+    except FileNotFoundError:
+        return ramfs.create_f(dirlist=[str(guild_id), "caches", "starboard_index"], f_type=functools.partial(StarredIndex, guild_id))
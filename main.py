@@ -15,7 +15,7 @@ print("Booting LeXdPyK")
 import os, importlib, sys, io, traceback
 
 # Import sub dependencies
-import glob, json, hashlib, logging, getpass, datetime, argparse, random
+import glob, json, hashlib, logging, getpass, datetime, argparse, random, math
 
 # Import typing support
 from typing import List, Optional, Any, Tuple, Dict, Union, Type, Protocol, TypeVar
@@ -358,6 +358,14 @@ class KernelSyntaxError(SyntaxError):
 # Import configs
 from LeXdPyK_conf import BOT_OWNER as KNOWN_OWNER
 
+import LeXdPyK_conf as kernel_conf
+
+# Handler time budgets, read with defaults so configs predating them still load
+HANDLER_TIMEOUT: float = float(getattr(kernel_conf, "HANDLER_TIMEOUT", 0))
+HANDLER_TIMEOUTS: Dict[str, float] = dict(getattr(kernel_conf, "HANDLER_TIMEOUTS", {}))
+EVENT_TIMEOUT: float = float(getattr(kernel_conf, "EVENT_TIMEOUT", 0))
+EVENT_TIMEOUTS: Dict[str, float] = dict(getattr(kernel_conf, "EVENT_TIMEOUTS", {}))
+
 UNKNOWN_OWNER: Any = KNOWN_OWNER
 BOT_OWNER: List[int]
 
@@ -631,6 +639,30 @@ def logging_toggle(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]
         return "Logging at L10 (DEBUG)", []
 
 
+def kernel_event_stats(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    try:
+        stats: Dict[str, handler_stats] = kernel_ramfs.read_f(dirlist=["global", "event_stats"])
+    except FileNotFoundError:
+        stats = {}
+
+    if args and args[0] == "reset":
+        stats.clear()
+        return "Reset dynamiclib handler timings", []
+
+    if not stats:
+        return "No dynamiclib handlers have run yet", []
+
+    # slowest p99 first, optionally filtered to names containing the first arg
+    lines = [
+        f"{name}: n={i.calls} err={i.errors} timeout={i.timeouts} p50={i.percentile(50)*1000:.2f}ms p99={i.percentile(99)*1000:.2f}ms max={i.worst*1000:.2f}ms"
+        for name, i in sorted(stats.items(), key=lambda kv: kv[1].percentile(99), reverse=True) if not args or args[0] in name
+        ]
+
+    # clip to discord message limit
+    return "```\n" + "\n".join(lines or ["No matching handlers"])[:1900] + "\n```", []
+
+
 class DebugCallable(Protocol):
     def __call__(self, args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
         return None
@@ -650,6 +682,7 @@ debug_commands: Dict[str, DebugCallable] = {
     "debug-drop-modules": kernel_drop_dlibs,
     "debug-drop-commands": kernel_drop_cmds,
     "debug-toggle-logging": logging_toggle,
+    "debug-event-stats": kernel_event_stats,
     }
 
 
@@ -685,10 +718,97 @@ async def on_error(event: str, *args: Any, **kwargs: Any) -> None:
     raise
 
 
-async def do_event_return_error(event: Any, args: Tuple[Any, ...]) -> Optional[Exception]:
+# LeXdPyK 2.1: dynamiclib handler timing
+# every dynamiclib handler call is timed into a per handler histogram in kernel_ramfs
+#  this is always on, so slow handlers can be found in production without development mode, see debug-event-stats
+class handler_stats:
+    __slots__ = "calls", "errors", "timeouts", "total", "worst", "buckets"
+
+    # latencies are bucketed on a log scale with this many buckets per doubling, starting at 1us
+    #  so percentiles are accurate to within ~19% while memory stays constant
+    resolution = 4
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def record(self, seconds: float, failed: bool, timed_out: bool = False) -> None:
+
+        self.calls += 1
+        self.errors += failed
+        self.timeouts += timed_out
+        self.total += seconds
+        self.worst = max(self.worst, seconds)
+
+        idx = max(0, int(math.log2(max(seconds * 1_000_000, 1)) * self.resolution))
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+
+    def percentile(self, pct: float) -> float:
+        """
+        Returns the upper bound in seconds of the bucket holding the given percentile
+        """
+
+        rank = math.ceil(self.calls * pct / 100)
+        seen = 0
+
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return min(2**((idx + 1) / self.resolution) / 1_000_000, self.worst)
+
+        return self.worst
+
+
+def load_handler_stats(name: str) -> handler_stats:
     try:
+        table: Dict[str, handler_stats] = kernel_ramfs.read_f(dirlist=["global", "event_stats"])
+    except FileNotFoundError:
+        table = kernel_ramfs.create_f(dirlist=["global", "event_stats"], f_type=dict)
+
+    try:
+        return table[name]
+    except KeyError:
+        stats = table[name] = handler_stats()
+        return stats
 
-        await event(
+
+# LeXdPyK 2.1: handler time budgets
+# a handler that overruns its budget is cancelled and reported as a HandlerTimeoutError,
+#  so one stuck module cannot hold up the later exec order tiers of an event and backlog every guild
+# budgets are set in LeXdPyK_conf, 0 disables a budget
+class HandlerTimeoutError(Exception):
+    pass
+
+
+def handler_budget(argtype: str, name: str, deadline: Optional[float]) -> Optional[float]:
+    """
+    Returns the seconds a handler may run for, per handler overrides win over per event overrides
+    The budget is clipped to what remains of the events budget, None means unlimited
+    """
+
+    budget = HANDLER_TIMEOUTS.get(name, HANDLER_TIMEOUTS.get(argtype, HANDLER_TIMEOUT))
+
+    if deadline is not None:
+        remaining = max(deadline - time.monotonic(), 0)
+        return min(budget, remaining) if budget > 0 else remaining
+
+    return budget if budget > 0 else None
+
+
+async def do_event_return_error(argtype: str, event: Any, args: Tuple[Any, ...], deadline: Optional[float] = None) -> Optional[Exception]:
+
+    tstart = time.monotonic()
+    err: Optional[Exception] = None
+
+    name = f"{argtype} {getattr(event, '__module__', '?')}.{getattr(event, '__qualname__', repr(event))}"
+    budget = handler_budget(argtype, name, deadline)
+
+    task = asyncio.ensure_future(
+        event(
             *args,
             client=Client,
             ramfs=ramfs,
@@ -698,9 +818,27 @@ async def do_event_return_error(event: Any, args: Tuple[Any, ...]) -> Optional[E
             kernel_version=version_info,
             kernel_ramfs=kernel_ramfs
             )
-        return None
-    except Exception as e:
-        return e
+        )
+
+    try:
+        # asyncio.wait does not raise or cancel on timeout, so a handlers own TimeoutErrors are not mistaken for a budget overrun
+        done, _ = await asyncio.wait((task, ), timeout=budget)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    if done:
+        try:
+            await task
+        except Exception as e:
+            err = e
+    else:
+        task.cancel()
+        err = HandlerTimeoutError(f"{name} exceeded its time budget of {budget:.2f}s and was cancelled")
+
+    load_handler_stats(name).record(time.monotonic() - tstart, err is not None, isinstance(err, HandlerTimeoutError))
+
+    return err
 
 
 async def event_call(argtype: str, *args: Any) -> Optional[errtype]:
@@ -715,13 +853,23 @@ async def event_call(argtype: str, *args: Any) -> Optional[errtype]:
     except KeyError:
         functions = []
 
-    for ftable in functions:
-        tasks = [asyncio.create_task(do_event_return_error(func, args)) for func in ftable]
+    event_budget = EVENT_TIMEOUTS.get(argtype, EVENT_TIMEOUT)
+    deadline = tstartexec + event_budget if event_budget > 0 else None
 
-        for i in tasks:
-            if e := (await i):
+    # handlers within a tier run concurrently, each tier waits on the previous
+    for idx, ftable in enumerate(functions):
+
+        if deadline is not None and time.monotonic() >= deadline:
+            etypes.append(errtype(HandlerTimeoutError(f"{argtype} exceeded its time budget of {event_budget:.2f}s, skipped {len(functions) - idx} exec order tiers"), argtype))
+            break
+
+        for e in await asyncio.gather(*(do_event_return_error(argtype, func, args, deadline) for func in ftable)):
+            if e:
                 etypes.append(errtype(e, argtype))
 
+    # the whole event is recorded under "<event> *" alongside its handlers
+    load_handler_stats(f"{argtype} *").record(time.monotonic() - tstartexec, bool(etypes), any(isinstance(i.err, HandlerTimeoutError) for i in etypes))
+
     if DEVELOPMENT_MODE:
         log_kernel_info(f"EVENT {argtype} : {round((time.monotonic()-tstartexec)*100000)/100}ms CC {len(functions)}")
 